@@ -0,0 +1,79 @@
+# Importing numpy to compute the cells covered by our brushes.
+import numpy as np
+# Importing lru_cache to compute each of our stamps only once.
+from functools import lru_cache
+
+'''
+    The functions we'll use to compute the cells covered by our pencil and eraser brushes:
+    Each time we paint, our brush "stamps" a shape (centered on the cell under our mouse) onto our canvas.
+
+    Our brushes come in sizes from 1 to 32 cells wide, and in the following shapes:
+        square   -> every cell of a size x size square.
+        round    -> the cells of a size x size square whose centers lie within its inscribed circle.
+        dithered -> the cells of our round brush that form a checkerboard pattern on our canvas.
+                    (Our pattern is aligned to our canvas, so overlapping stamps stay consistent.
+                    A single cell can't form a pattern, so our 1 cell wide dithered brush always paints its cell.)
+
+    Our stamps are computed once per (shape, size) and cached, as read-only arrays of (x, y) offsets from our center cell.
+'''
+
+# Our supported brush shapes and sizes.
+BRUSH_SHAPES = ("square", "round", "dithered")
+MIN_BRUSH_SIZE = 1
+MAX_BRUSH_SIZE = 32
+
+# A function to get the mask of a stamp (a size x size bool array), given our brush's shape and size.
+@lru_cache(maxsize=None)
+def get_stamp_mask(shape, size):
+    if shape not in BRUSH_SHAPES:
+        raise ValueError(f"Unknown brush shape: {shape}")
+    if not MIN_BRUSH_SIZE <= size <= MAX_BRUSH_SIZE:
+        raise ValueError(f"Brush size must be between {MIN_BRUSH_SIZE} and {MAX_BRUSH_SIZE}.")
+
+    if shape == "square":
+        mask = np.ones((size, size), dtype=bool)
+    else:
+        # Keeping the cells whose centers lie within the circle inscribed in our square.
+        centers = np.arange(size) - (size - 1) / 2
+        mask = centers[None, :] ** 2 + centers[:, None] ** 2 <= (size / 2) ** 2
+
+    mask.flags.writeable = False
+    return mask
+
+# A function to get the (x, y) offsets of the cells of a stamp from our center cell, as read-only arrays.
+@lru_cache(maxsize=None)
+def get_stamp_offsets(shape, size):
+    ys, xs = np.nonzero(get_stamp_mask(shape, size))
+    # Our center cell (for even sizes, the cell just above and to the left of our center).
+    xs = xs - (size - 1) // 2
+    ys = ys - (size - 1) // 2
+    xs.flags.writeable = False
+    ys.flags.writeable = False
+    return xs, ys
+
+# A function to get the cells covered by a stamp centered on the given (x, y) cell, as x and y coordinate arrays.
+# Our cells are clipped to a canvas of the given width and height.
+def get_stamp_cells(shape, size, pixel, width, height):
+    return get_stroke_cells(shape, size, np.array([pixel[0]]), np.array([pixel[1]]), width, height)
+
+# A function to get the cells covered by stamping our brush at every cell of a path (given as x and y coordinate arrays).
+# Each cell is only returned once, even where our stamps overlap.
+def get_stroke_cells(shape, size, path_xs, path_ys, width, height):
+    dxs, dys = get_stamp_offsets(shape, size)
+    xs = (path_xs[:, None] + dxs[None, :]).ravel()
+    ys = (path_ys[:, None] + dys[None, :]).ravel()
+
+    keep = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    if shape == "dithered" and size > 1:
+        keep &= (xs + ys) % 2 == 0
+    xs, ys = xs[keep], ys[keep]
+
+    # Removing the duplicates of overlapping stamps (a single stamp never overlaps itself).
+    if len(path_xs) > 1:
+        ys, xs = np.divmod(np.unique(ys * width + xs), width)
+    return xs, ys
+
+# A function to get the bounding rect of a stamp centered on the given (x, y) cell, as (x, y, width, height).
+def get_stamp_bounds(size, pixel):
+    offset = (size - 1) // 2
+    return (pixel[0] - offset, pixel[1] - offset, size, size)
@@ -0,0 +1,92 @@
+# Importing numpy to composite our pixel colors.
+import numpy as np
+# Importing QImage to display our composited colors.
+from PyQt6.QtGui import QImage
+from PyQt6.QtCore import QRect
+
+'''
+    A class to store what our canvas currently displays, at its native resolution (one pixel per cell):
+    Each pixel of our buffer is the color of a cell composited on top of our canvas's background color.
+
+    Our buffer's colors are stored in a numpy array that is shared with a QImage, so writing to the array
+    updates the image directly. When painting, the image is scaled up onto the canvas (nearest-neighbor),
+    which keeps our memory proportional to the sprite rather than to its zoomed, on-screen size.
+'''
+class CanvasBuffer:
+
+    # Our constructor will allocate our buffer and fill it with our background color.
+    def __init__(self, width, height, background_color):
+        self.width  = width
+        self.height = height
+        self.background = np.array(background_color.getRgb(), dtype=np.uint8)
+
+        # Our composited colors (always opaque, since our background is opaque).
+        self.display = np.empty((height, width, 4), dtype=np.uint8)
+        self.display[...] = self.background
+
+        # Our image shares its memory with our array. (Being opaque, our colors are already premultiplied.)
+        self.image = QImage(self.display.data, width, height, width * 4, QImage.Format.Format_RGBA8888_Premultiplied)
+
+    # A method to re-render a region of our buffer from our pixel store.
+    # Our region is a QRect in cell coordinates (the whole canvas by default).
+    # An optional color filter maps an N x 4 array of colors to their filtered colors (i.e. daltonization).
+    def render(self, store, rect=None, color_filter=None):
+
+        # Clamping our region to our buffer's bounds.
+        rect = QRect(0, 0, self.width, self.height) if rect is None else rect.intersected(QRect(0, 0, self.width, self.height))
+        if rect.isEmpty():
+            return
+        x0, y0 = rect.x(), rect.y()
+        x1, y1 = x0 + rect.width(), y0 + rect.height()
+
+        # Clearing our region to our background, then compositing the painted cells of our store on top of it, a row of tiles at a time
+        # (so that our filter is given a batch of colors per row, rather than per tile).
+        # Our colors are gathered and scattered as packed 32-bit values, which numpy copies far faster than rows of 4 bytes.
+        display = self.display.view(np.uint32)[..., 0]
+        display[y0:y1, x0:x1] = self.background.view(np.uint32)[0]
+        size = store.TILE_SIZE
+        for tile_y in range(y0 // size, (y1 - 1) // size + 1):
+            top, bottom = max(y0, tile_y * size), min(y1, (tile_y + 1) * size)
+
+            # Retrieving the slices of our region covered by each (allocated) tile of our row, along with their painted colors.
+            slices, chunks = [], []
+            for tile_x in range(x0 // size, (x1 - 1) // size + 1):
+                tile = store.read_tile((tile_x, tile_y))
+                if tile is None:
+                    continue
+                left, right = max(x0, tile_x * size), min(x1, (tile_x + 1) * size)
+                rows, columns = slice(top - tile_y * size, bottom - tile_y * size), slice(left - tile_x * size, right - tile_x * size)
+                mask = tile[1][rows, columns]
+                slices.append((display[top:bottom, left:right], mask))
+                chunks.append(np.ascontiguousarray(tile[0]).view(np.uint32)[rows, columns, 0][mask])
+            colors = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint32)
+            if not len(colors):
+                continue
+
+            # Filtering our painted colors, if a filter was provided.
+            colors = colors.view(np.uint8).reshape(-1, 4)
+            if color_filter is not None:
+                colors = color_filter(colors)
+
+            # Compositing our painted colors on top of our background ("source over"), back into their slices.
+            colors = np.ascontiguousarray(self.composite(colors)).view(np.uint32)[:, 0]
+            offset = 0
+            for (region, mask), chunk in zip(slices, chunks):
+                region[mask] = colors[offset:offset + len(chunk)]
+                offset += len(chunk)
+
+    # A method to composite an N x 4 array of colors on top of our (opaque) background.
+    def composite(self, colors):
+
+        # Opaque colors are drawn as is.
+        if (colors[:, 3] == 255).all():
+            return colors
+        colors = colors.astype(np.uint16)
+        alpha = colors[:, 3:4]
+        blended = (colors[:, :3] * alpha + self.background[:3].astype(np.uint16) * (255 - alpha) + 127) // 255
+        return np.concatenate([blended, np.full_like(alpha, 255)], axis=1).astype(np.uint8)
+
+    # A method to draw a region of our buffer (in cell coordinates), scaled up by our pixel size.
+    def draw(self, painter, cells, pixel_size):
+        target = QRect(cells.x() * pixel_size, cells.y() * pixel_size, cells.width() * pixel_size, cells.height() * pixel_size)
+        painter.drawImage(target, self.image, cells)
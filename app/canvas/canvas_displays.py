@@ -0,0 +1,137 @@
+from canvas.canvas_buffer import CanvasBuffer
+from canvas.canvas_mipmaps import CanvasMipmaps
+from canvas.stale_tiles import StaleTiles
+
+'''
+    A class to store a single display of our canvas: a canvas buffer (along with its mip chain) rendered with a given color filter
+    (i.e. daltonization), or without any filter at all. Our pixels remain the source of truth; a display is only ever rendered from them.
+
+    While another display is shown, the regions our canvas re-renders are only marked as stale here (per tile, see StaleTiles).
+    Once we're shown again, we'll only re-render our stale tiles.
+'''
+class CanvasDisplay:
+
+    # Our constructor will allocate our buffer, with all of our tiles stale (we haven't rendered anything yet).
+    # Our color filter maps an N x 4 array of colors to their filtered colors (or is None for an unfiltered display),
+    # and our key identifies our filter (see CanvasDisplays).
+    def __init__(self, width, height, background, color_filter=None, key=None):
+        self.width  = width
+        self.height = height
+        self.key = key
+        self.color_filter = color_filter
+        self.buffer  = CanvasBuffer(width, height, background)
+        self.mipmaps = CanvasMipmaps(self.buffer)
+        self.stale_tiles = StaleTiles(width, height)
+
+    # A method to re-render a region of cells (a QRect in cell coordinates, or our whole canvas) from the given pixel store.
+    def render(self, store, cells=None):
+        self.buffer.render(store, cells, self.color_filter)
+        self.mipmaps.mark_dirty(cells)
+        if cells is None:
+            self.stale_tiles.clear()
+
+    # A method to mark a region of cells (or our whole canvas) as stale.
+    def mark_stale(self, cells=None):
+        self.stale_tiles.mark(cells)
+
+    # A method to get the memory used by our buffer and its mip chain (in bytes, once each of our levels has been allocated).
+    def get_memory_usage(self):
+        return sum(width * height * 4 for width, height in self.mipmaps.sizes)
+
+    # A method to re-render our stale tiles from the given pixel store, returning the regions (QRects of cells) we've re-rendered.
+    # Given a region of cells (i.e. the part of our canvas that's visible), we'll only re-render the stale tiles covering it.
+    def update(self, store, cells=None):
+        rects = self.stale_tiles.take_rects(cells)
+        for rect in rects:
+            self.render(store, rect)
+        return rects
+
+'''
+    A class to store the displays of our canvas, one per color filter (keyed by our filter, i.e. a CVD type, or None when unfiltered).
+    Only one of our displays is shown at a time (our active display). Whenever our canvas re-renders a region, our active display
+    is re-rendered right away, and the same region is marked as stale in our other displays.
+
+    Switching back to a display we've shown before is then just a swap (re-rendering only the tiles that changed in the meantime).
+    Since each display is as large as our canvas buffer (along with its mip chain), we'll only keep our most recently shown displays,
+    within a memory budget (so a small canvas keeps a display for every filter, while a large one only keeps a few).
+
+    Displays shown elsewhere (i.e. the panes of our comparison view) can also be attached to us, so that they're marked as stale
+    along with our other displays (they're never dropped, nor made active). They count towards our memory budget all the same,
+    so attaching them drops our least recently used displays instead.
+'''
+class CanvasDisplays:
+
+    # The maximum memory our displays may use (in bytes), i.e. three displays of a 4096 x 4096 canvas.
+    MAX_MEMORY = 256 * 1024 * 1024
+
+    # Our constructor will set up our (active) unfiltered display.
+    def __init__(self, width, height, background):
+        self.width  = width
+        self.height = height
+        self.background = background
+        self.displays = {None: CanvasDisplay(width, height, background)}
+        self.active_key = None
+        self.attached_displays = []
+
+    # A method to get our active display.
+    def get_active_display(self):
+        return self.displays[self.active_key]
+
+    # A method to get one of our displays (creating it with the given color filter if we don't have it yet).
+    def get_display(self, key, color_filter=None):
+        display = self.displays.pop(key, None)
+        if display is None:
+            display = CanvasDisplay(self.width, self.height, self.background, color_filter, key)
+            self.make_room(display)
+
+        # Our displays are ordered from least to most recently used.
+        self.displays[key] = display
+        return display
+
+    # A method to drop our least recently used displays until the given display fits within our memory budget (but never our active one).
+    def make_room(self, display):
+        for old_key in list(self.displays):
+            if self.get_memory_usage() + display.get_memory_usage() <= self.MAX_MEMORY:
+                break
+            if old_key != self.active_key:
+                del self.displays[old_key]
+
+    # A method to set our active display (creating it if needed), and bring it up to date with the given pixel store.
+    def set_active_display(self, key, store, color_filter=None):
+        display = self.get_display(key, color_filter)
+        self.active_key = key
+        display.update(store)
+        return display
+
+    # A method to get the memory used by our displays, including our attached displays (in bytes).
+    def get_memory_usage(self):
+        return sum(display.get_memory_usage() for display in list(self.displays.values()) + self.attached_displays)
+
+    # A method to change the color filter of our displays with the given key (if we have any), which makes those displays stale.
+    def set_color_filter(self, key, color_filter):
+        for display in list(self.displays.values()) + self.attached_displays:
+            if display.key == key:
+                display.color_filter = color_filter
+                display.mark_stale()
+
+    # A method to create a display with the given key and color filter, and attach it to us (it starts out entirely stale).
+    def attach_display(self, key, color_filter=None):
+        display = CanvasDisplay(self.width, self.height, self.background, color_filter, key)
+        self.make_room(display)
+        self.attached_displays.append(display)
+        return display
+
+    # A method to detach one of our attached displays.
+    def detach_display(self, display):
+        if display in self.attached_displays:
+            self.attached_displays.remove(display)
+
+    # A method to re-render a region of cells (or our whole canvas) in our active display, marking it as stale in our other displays.
+    def render(self, store, cells=None):
+        for key, display in self.displays.items():
+            if key == self.active_key:
+                display.render(store, cells)
+            else:
+                display.mark_stale(cells)
+        for display in self.attached_displays:
+            display.mark_stale(cells)
@@ -1,67 +1,204 @@
-# Importing QColor to work with color objects.
-from PyQt6.QtGui import QColor, QPixmap
+# Importing numpy to store our changed tiles, and zlib to compress older changes.
+import numpy as np
+import zlib
+# Importing QRect to describe the region of cells a change covers.
+from PyQt6.QtCore import QRect
+
+'''
+    A class to store a single change made to our canvas (i.e. a stroke, a fill, or clearing our canvas):
+    Rather than a full copy of our canvas, each change only stores the tiles (see PixelStore) that changed.
+
+    Our change holds the tiles of whichever side of it our pixel store isn't currently showing: the tiles from before our change
+    once it's been made (or redone), and the tiles from after it once it's been undone. Undoing or redoing our change simply swaps
+    our tiles with those of our pixel store, so we never hold more than one copy of a tile, and nothing needs to be copied.
+
+    The structure of our change will be as follows:
+        keys   -> the (tile_x, tile_y) key of each changed tile.
+        tiles  -> the (values, mask) arrays of each changed tile, or None if it isn't allocated on our side of our change.
+                  (Our values are stored as our pixel store stores them, i.e. palette indices for an indexed store.)
+        pixels -> the pixel store (i.e. the layer) our change was made to.
+
+    Older changes can be compressed (with zlib) into a single block of bytes, and are decompressed when needed.
+'''
+class CanvasDelta:
+
+    def __init__(self, keys, tiles, pixels, rect):
+        self.keys   = keys
+        self.tiles  = tiles
+        self.pixels = pixels
+
+        # Our number of changed tiles and the bounding rect of our changed tiles (kept, so they're available while compressed).
+        self.count = len(keys)
+        self.rect  = rect
+
+        # Our compressed bytes (None while uncompressed).
+        self.compressed = None
+
+    def bounds(self):
+        return QRect(self.rect)
+
+    # A method to get the number of bytes our change takes up in memory.
+    def get_size(self):
+        if self.compressed is not None:
+            return len(self.compressed)
+        return sum(values.nbytes + mask.nbytes for values, mask in self.get_allocated_tiles())
+
+    # A method to get the tiles we hold that are allocated.
+    def get_allocated_tiles(self):
+        return [tile for tile in self.tiles if tile is not None]
+
+    # A method to compress our change into a single block of bytes.
+    def compress(self):
+        if self.compressed is not None:
+            return
+        # (Which of our tiles are allocated is kept alongside our keys.)
+        self.allocated = [tile is not None for tile in self.tiles]
+        arrays = [array for tile in self.get_allocated_tiles() for array in tile]
+        # (Our tiles are highly repetitive, so zlib's fastest level compresses them nearly as well as its default.)
+        self.compressed = zlib.compress(b"".join(np.ascontiguousarray(array).tobytes() for array in arrays), 1)
+        self.tiles = None
+
+    # A method to decompress our change (if it's been compressed).
+    def decompress(self):
+        if self.compressed is None:
+            return
+        data = np.frombuffer(zlib.decompress(self.compressed), dtype=np.uint8)
+        mask_shape = (self.pixels.TILE_SIZE, self.pixels.TILE_SIZE)
+        values_shape = mask_shape + self.pixels.VALUE_SHAPE
+        values_size, mask_size = int(np.prod(values_shape)), int(np.prod(mask_shape))
+
+        # Our bytes are laid out as the values and mask of each of our allocated tiles.
+        self.tiles, offset = [], 0
+        for allocated in self.allocated:
+            if not allocated:
+                self.tiles.append(None)
+                continue
+            values = data[offset:offset + values_size].reshape(values_shape).copy()
+            mask = data[offset + values_size:offset + values_size + mask_size].view(bool).reshape(mask_shape).copy()
+            self.tiles.append((values, mask))
+            offset += values_size + mask_size
+        self.compressed = None
+
+    # A method to undo our change on the given pixel store (the store our change was made to by default), restoring its old tiles.
+    def revert(self, pixels=None):
+        self.swap(pixels)
+
+    # A method to redo our change on the given pixel store (the store our change was made to by default), restoring its new tiles.
+    def apply(self, pixels=None):
+        self.swap(pixels)
+
+    # A method to swap our tiles with those of the given pixel store (which then hold the other side of our change).
+    def swap(self, pixels=None):
+        pixels = self.pixels if pixels is None else pixels
+        self.decompress()
+        self.tiles = pixels.swap_tiles(self.keys, self.tiles)
 
 '''
     A class to store the history of our canvas:
-    Each state of our canvas will be represented by a dictionary of pixel colors and a canvas buffer.
-    
-    The structure of our pixels dictionary will be as follows:
-        (x, y) -> QColor object, where (x, y) are the coordinates of the pixel on the canvas.
-    
-    Our canvas buffer will be a QPixmap object that will store the current state of our canvas.
+    Each entry of our history is a CanvasDelta, which only stores the tiles changed by a single action.
+    This keeps our memory proportional to what we've drawn (not to the size of our canvas), and lets us
+    undo/redo an action by rewriting just the tiles it changed.
+
+    Our history is also limited to a memory budget (64 MB by default). Once our budget is exceeded,
+    our oldest entries are compressed first (then our newest ones, which are decompressed once they're undone or redone);
+    if that's not enough, they're evicted from our history, down to our single most recent entry.
 '''
 class CanvasHistory:
-    # Our constructor will initialize our undo/redo stacks.
-    def __init__(self):
+    # Our constructor will initialize our undo/redo stacks and our memory budget (in bytes).
+    def __init__(self, max_bytes=64 * 1024 * 1024):
         self.undo_stack = [] # To store our undo states.
         self.redo_stack = [] # To store our redo states.
+        self.max_bytes  = max_bytes
 
-    # This method will save the current state of our canvas to the undo stack.
-    def save_state(self, pixels, canvas_buffer):
-        data = (pixels.copy(), canvas_buffer.copy())
-        self.undo_stack.append(data)
-
-    # When we draw on our canvas, we'll need to save the current state of our canvas and reset our redo stack.
+    # When we draw on our canvas, we'll need to save our change and reset our redo stack.
     # The following method will handle this task.
-    def save_state_and_update(self, pixels, canvas_buffer):
-        
-        # Adding our current state to the undo stack so that we have the ability to undo our actions.
-        self.save_state(pixels, canvas_buffer)
+    def push(self, delta):
+
+        # If nothing changed, there's nothing to undo.
+        if delta is None:
+            return
+
+        # Adding our change to the undo stack so that we have the ability to undo our actions.
+        self.undo_stack.append(delta)
 
         # Once we've drawn on our canvas, we can no longer redo any actions. Thus, we'll clear the redo stack.
         self.redo_stack.clear()
 
+        # Making sure we're still within our memory budget.
+        self.enforce_budget()
+
     # This method is responsible for undoing the last action performed on our canvas.
-    def undo(self, pixels, canvas_buffer):
-        # If we can undo an action, we'll retrieve the last state of our canvas.
+    # It returns the change we've undone (or None if there was nothing to undo).
+    # (Each change is reverted on the pixel store it was made to, unless we provide another one.)
+    def undo(self, pixels=None):
+        # If we can undo an action, we'll revert the last change made to our canvas.
         if self.undo_stack:
-            # First, we must save our current state to the redo stack. This will allow us to redo our actions.
-            data = (pixels.copy(), canvas_buffer.copy())
-            self.redo_stack.append(data)
+            delta = self.undo_stack.pop()
+            delta.revert(pixels)
 
-            # Next, we'll retrieve the last state of our canvas from the undo stack.
-            pixels.clear()
-            pixels, last_buffer = self.undo_stack.pop()
-            
-            # Finally, we'll return the last state of our canvas.
-            return (pixels, last_buffer)
+            # We'll save our change to the redo stack. This will allow us to redo our actions.
+            self.redo_stack.append(delta)
+            self.enforce_budget()
+            return delta
 
-        # Otherwise, we'll simply return the current state of our canvas.
-        return (pixels, canvas_buffer)
+        return None
 
     # This method is responsible for redoing the last action performed on our canvas.
-    def redo(self, pixels, canvas_buffer):
-        # If we can redo an action, we'll retrieve the last state of our canvas.
+    # It returns the change we've redone (or None if there was nothing to redo).
+    def redo(self, pixels=None):
+        # If we can redo an action, we'll reapply the last change we've undone.
         if self.redo_stack:
-            # First, we must save our current state to the undo stack. This will allow us to undo our actions.
-            self.save_state(pixels, canvas_buffer)
+            delta = self.redo_stack.pop()
+            delta.apply(pixels)
+
+            # We'll save our change to the undo stack. This will allow us to undo our actions.
+            self.undo_stack.append(delta)
+            self.enforce_budget()
+            return delta
+
+        return None
+
+    # A method to remove the changes made to the given pixel store from our history (i.e. once its layer has been deleted).
+    def remove_changes(self, pixels):
+        self.undo_stack = [delta for delta in self.undo_stack if delta.pixels is not pixels]
+        self.redo_stack = [delta for delta in self.redo_stack if delta.pixels is not pixels]
+
+    # A method to set our memory budget (in bytes).
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.enforce_budget()
+
+    # A method to get the number of bytes our history currently takes up.
+    def get_memory_usage(self):
+        return sum(delta.get_size() for delta in self.undo_stack) + sum(delta.get_size() for delta in self.redo_stack)
+
+    # A method to get the depth of our history, as (number of undo entries, number of redo entries).
+    def get_depth(self):
+        return (len(self.undo_stack), len(self.redo_stack))
+
+    # A method to keep our history within our memory budget.
+    def enforce_budget(self):
+        usage = self.get_memory_usage()
+        if usage <= self.max_bytes:
+            return
+
+        # Our entries ordered from oldest (coldest) to newest: the bottom of our undo stack is the oldest change,
+        # and the bottom of our redo stack is the furthest change from our current state.
+        # Our most recent entry of each stack comes last, so that a single undo/redo stays fast whenever our budget allows it.
+        entries = self.undo_stack[:-1] + self.redo_stack[:-1] + self.undo_stack[-1:] + self.redo_stack[-1:]
 
-            # Next, we'll retrieve the last state of our canvas from the redo stack.
-            pixels.clear()
-            pixels, last_buffer = self.redo_stack.pop()
+        # First, we'll compress our oldest entries until we're within our budget.
+        for delta in entries:
+            if usage <= self.max_bytes:
+                return
+            size = delta.get_size()
+            delta.compress()
+            usage -= size - delta.get_size()
 
-            # Finally, we'll return the last state of our canvas.
-            return (pixels, last_buffer)
+        # If we're still over budget, we'll evict our oldest undo entries (keeping our most recent one)...
+        while usage > self.max_bytes and len(self.undo_stack) > 1:
+            usage -= self.undo_stack.pop(0).get_size()
 
-        # Otherwise, we'll simply return the current state of our canvas.
-        return (pixels, canvas_buffer)
\ No newline at end of file
+        # ...followed by the redo entries furthest from our current state, until we're down to a single entry.
+        while usage > self.max_bytes and self.redo_stack and len(self.undo_stack) + len(self.redo_stack) > 1:
+            usage -= self.redo_stack.pop(0).get_size()
@@ -0,0 +1,410 @@
+# Importing the modules we'll need to write our journal to disk.
+import os
+import glob
+import struct
+import time
+import uuid
+import zlib
+# Importing numpy to pack/unpack our pixel arrays.
+import numpy as np
+from PyQt6.QtCore import QStandardPaths, QLockFile
+
+'''
+    A class to keep a crash-safe, append-only journal of the operations committed to our canvas:
+    Every committed operation (a stroke, fill, shape, clear, or generated-image import) is appended as a
+    compact binary record, so that our work can be recovered by replaying the journal after a crash.
+
+    The structure of our journal file will be as follows:
+        header -> b"PIXJ", a version byte, and our canvas's width and height.
+        record -> a type byte, the length of its payload, its (zlib-compressed) payload, and a CRC32 checksum.
+
+    There are the following types of records:
+        layers checkpoint -> our palette (if our layers are indexed), then each of our layers (bottom to top): its name, visibility,
+                             opacity, and the contents of its allocated tiles (empty tiles are skipped).
+        layer delta       -> the index of the layer that changed, followed by the contents of the tiles an operation changed
+                             (their colors, or palette indices, and painted states, once it's been made, undone, or redone).
+        palette           -> the colors of our palette, once they've changed (i.e. once our palette has been swapped or edited).
+        layer operation   -> a layer being added, removed, moved, or having its visibility or opacity changed: our operation,
+                             the index of its layer, its new index, its visibility and opacity, and its name.
+
+    Our deltas refer to our layers by index, so our layer operations are replayed in order along with them
+    (we'll only checkpoint when the pixels of our layers are replaced outright, i.e. when opening or importing a project).
+    Indexed layers are journaled as palette indices, so swapping our palette only appends its new colors.
+
+    Our journal is periodically checkpointed: it's atomically rewritten as a single checkpoint record,
+    which keeps the time it takes to replay our journal bounded, regardless of how long our session lasts.
+    A record that was only partially written (i.e. during a crash) fails its checksum and ends our replay.
+
+    Our journal is stored next to our project (as <project>.pix.journal). Unsaved projects are journaled in our
+    recovery directory instead, which also holds a link to each project's journal so we can find them on startup.
+
+    While a journal is in use, we hold a lock file next to it (<journal>.lock, holding our process ID). On startup,
+    we'll only offer to recover the journals whose owners are no longer running (i.e. not those of another open Pixelate window).
+'''
+class CanvasJournal:
+
+    MAGIC   = b"PIXJ"
+    VERSION = 4
+    HEADER  = struct.Struct("<4sBHH")  # magic, version, width, height
+    RECORD  = struct.Struct("<BI")     # type, payload length
+    CRC     = struct.Struct("<I")
+
+    LAYERS_CHECKPOINT = 4
+    LAYER_DELTA       = 5
+    LAYER_OPERATION   = 6
+    PALETTE           = 7
+
+    # Our layer operations (and their payload: operation, index, new index, visibility, opacity, followed by a name).
+    LAYER_ADDED      = 1
+    LAYER_REMOVED    = 2
+    LAYER_MOVED      = 3
+    LAYER_PROPERTIES = 4
+    OPERATION = struct.Struct("<BHHBB")
+
+    # Our constructor will start a new journal for the given layers (see CanvasLayers).
+    # We checkpoint after the given number of records (or bytes), whichever comes first.
+    def __init__(self, layers, project_path=None, checkpoint_interval=256, checkpoint_bytes=8 * 1024 * 1024):
+        self.layers = layers
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_bytes = checkpoint_bytes
+        self.file = None
+        self.path = None
+        self.link_path = None
+        self.lock = None
+        self.set_project_path(project_path)
+
+    # A static method to get our recovery directory (where unsaved projects and links to project journals are kept).
+    @staticmethod
+    def get_recovery_dir():
+        data_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericDataLocation)
+        recovery_dir = os.path.abspath(os.path.join(data_dir or os.path.expanduser("~"), "Pixelate", "recovery"))
+        os.makedirs(recovery_dir, exist_ok=True)
+        return recovery_dir
+
+    # A static method to get the path of the link (in our recovery directory) to a project's journal.
+    @staticmethod
+    def get_link_path(project_path):
+        project_path = os.path.abspath(project_path)
+        name = os.path.basename(project_path) + "-" + format(zlib.crc32(project_path.encode()), "08x")
+        return os.path.join(CanvasJournal.get_recovery_dir(), name + ".journal-link")
+
+    # A method to (re)locate our journal, i.e. once our project has been saved or opened.
+    # Our journal will be restarted from a checkpoint of our current pixels.
+    def set_project_path(self, project_path):
+
+        # Removing our previous journal (its contents are covered by our new checkpoint).
+        self.discard()
+
+        if project_path:
+            self.path = os.path.abspath(project_path) + ".journal"
+            # Linking to our journal from our recovery directory, so it can be found on startup.
+            self.link_path = self.get_link_path(project_path)
+            with open(self.link_path, "w") as file:
+                file.write(self.path)
+        else:
+            # (Several unsaved projects may be started within the same second, so our name ends with a random suffix.)
+            self.path = os.path.join(self.get_recovery_dir(), f"untitled-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.journal")
+            self.link_path = None
+
+        # Locking our journal, so it isn't offered for recovery while we're still using it.
+        self.lock = self.create_lock(self.path)
+        self.lock.tryLock(0)
+
+        self.checkpoint()
+
+    # A method to append a committed (or undone/redone) operation (a CanvasDelta) to our journal:
+    # the current contents of the tiles it changed.
+    def append(self, delta):
+        if self.file is None or delta is None:
+            return
+
+        # Changes to a layer that's since been removed have nothing left to recover.
+        index = self.layers.index_of(delta.pixels)
+        if index is None:
+            return
+
+        # (Freed tiles are journaled as empty ones.)
+        empty = delta.pixels.new_tile()
+        tiles = [delta.pixels.tiles.get(key, empty) for key in delta.keys]
+
+        # Our indices may refer to colors that have been added to our palette since we last journaled it.
+        palette = self.layers.get_palette()
+        if palette is not None and palette.get_color_count() != self.palette_count:
+            self.append_palette()
+
+        payload = struct.pack("<H", index) + self.pack_tile_list(delta.pixels.TILE_SIZE, delta.keys, tiles)
+        self.append_record(self.LAYER_DELTA, payload)
+
+    # A method to append a layer operation to our journal: one of our layer operations on the layer at the given index.
+    # Our layer's current properties (its visibility, opacity, and name) are journaled along with it.
+    def append_layer_operation(self, operation, index, new_index=0):
+        if self.file is None:
+            return
+        layer = self.layers.get_layer(new_index if operation == self.LAYER_MOVED else index) if operation != self.LAYER_REMOVED else None
+        name = layer.name.encode("utf-8") if layer else b""
+        visible, opacity = (layer.visible, layer.opacity) if layer else (True, 100)
+        self.append_record(self.LAYER_OPERATION, self.OPERATION.pack(operation, index, new_index, visible, opacity) + name)
+
+    # A method to append the colors of our palette to our journal (i.e. once it's been swapped or edited).
+    def append_palette(self):
+        palette = self.layers.get_palette()
+        if self.file is None or palette is None:
+            return
+        self.palette_count = palette.get_color_count()
+        self.append_record(self.PALETTE, self.pack_palette(palette))
+
+    # A static method to pack a palette (or None) into a payload: its number of colors, followed by its colors.
+    @staticmethod
+    def pack_palette(palette):
+        if palette is None:
+            return struct.pack("<H", 0)
+        return struct.pack("<H", palette.get_color_count()) + palette.colors[:palette.get_color_count()].tobytes()
+
+    # A static method to unpack a palette (see pack_palette), returning its colors as an N x 4 array (or None), along with the size of its payload.
+    @staticmethod
+    def unpack_palette(payload, offset=0):
+        (count,) = struct.unpack_from("<H", payload, offset)
+        if count == 0:
+            return None, 2
+        return np.frombuffer(payload, dtype=np.uint8, count=count * 4, offset=offset + 2).reshape(count, 4), 2 + count * 4
+
+    # A method to append a record to our journal, checkpointing our journal periodically (to keep our replay time bounded).
+    def append_record(self, record_type, payload):
+        self.write_record(self.file, record_type, payload)
+        self.records += 1
+        if self.records >= self.checkpoint_interval or self.file.tell() >= self.checkpoint_bytes:
+            self.checkpoint()
+
+    # A method to checkpoint our journal: we'll atomically replace it with a single checkpoint of our pixels.
+    def checkpoint(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        # Writing our checkpoint to a temporary file first, so a crash can never leave us without a valid journal.
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.layers.width, self.layers.height))
+            self.write_record(file, self.LAYERS_CHECKPOINT, self.pack_layers())
+        os.replace(temp_path, self.path)
+
+        # Reopening our journal to append new records.
+        self.file = open(self.path, "ab")
+        self.records = 0
+        palette = self.layers.get_palette()
+        self.palette_count = palette.get_color_count() if palette is not None else 0
+
+    # A method to pack our layers into a layers checkpoint's payload: our palette (see pack_palette), our number of layers,
+    # then for each layer, its name (length-prefixed), visibility, opacity, and the (length-prefixed) tiles of its pixels.
+    def pack_layers(self):
+        payload = [self.pack_palette(self.layers.get_palette()), struct.pack("<H", self.layers.get_layer_count())]
+        for index in range(self.layers.get_layer_count()):
+            layer = self.layers.get_layer(index)
+            name = layer.name.encode("utf-8")
+            tiles = self.pack_tiles(layer.pixels)
+            payload.append(struct.pack("<H", len(name)) + name + struct.pack("<BBI", layer.visible, layer.opacity, len(tiles)) + tiles)
+        return b"".join(payload)
+
+    # A static method to pack the allocated tiles of a pixel store into a payload:
+    # the tile size and number of tiles, then the (x, y) of each tile, followed by their rgba (or palette index) and mask arrays.
+    @staticmethod
+    def pack_tiles(pixels):
+        return CanvasJournal.pack_tile_list(pixels.TILE_SIZE, list(pixels.tiles.keys()), list(pixels.tiles.values()))
+
+    # A static method to pack a list of tiles (given their (tile_x, tile_y) keys and their (rgba, mask) arrays) into a payload (see pack_tiles).
+    @staticmethod
+    def pack_tile_list(size, keys, tiles):
+        keys = np.array(keys, dtype=np.uint16).reshape(-1, 2)
+        return (struct.pack("<HI", size, len(tiles)) + keys.tobytes()
+                + b"".join(np.ascontiguousarray(rgba).tobytes() for rgba, _ in tiles)
+                + b"".join(np.ascontiguousarray(mask).tobytes() for _, mask in tiles))
+
+    # A static method to unpack a list of tiles (see pack_tiles), given the shape of each of their values ((4,) for colors, () for palette indices).
+    # We'll return our tile size, our (tile_x, tile_y) keys, and our (count x size x size) rgba and mask arrays (which are read-only).
+    @staticmethod
+    def unpack_tile_list(payload, channels):
+        size, count = struct.unpack_from("<HI", payload, 0)
+        values = np.frombuffer(payload, dtype=np.uint8, offset=6)
+        keys = [tuple(key) for key in values[:4 * count].view(np.uint16).reshape(count, 2).tolist()]
+        end = 4 * count + count * size * size * int(np.prod(channels))
+        tile_rgba = values[4 * count:end].reshape((count, size, size) + channels)
+        tile_mask = values[end:].view(bool).reshape(count, size, size)
+        return size, keys, tile_rgba, tile_mask
+
+    # A static method to unpack tiles (see pack_tiles) onto the given rgba (or palette index) and mask arrays,
+    # replacing the regions they cover.
+    @staticmethod
+    def unpack_tiles(payload, rgba, mask):
+        size, keys, tile_rgba, tile_mask = CanvasJournal.unpack_tile_list(payload, rgba.shape[2:])
+        for (tile_x, tile_y), tile_colors, tile_painted in zip(keys, tile_rgba, tile_mask):
+            x0, y0 = tile_x * size, tile_y * size
+            height, width = rgba[y0:y0 + size, x0:x0 + size].shape[:2]
+            rgba[y0:y0 + height, x0:x0 + width] = tile_colors[:height, :width]
+            mask[y0:y0 + height, x0:x0 + width] = tile_painted[:height, :width]
+
+    # A method to write a single record (type, length, compressed payload, checksum) and flush it to disk.
+    def write_record(self, file, record_type, payload):
+        payload = zlib.compress(payload, 1)
+        header = self.RECORD.pack(record_type, len(payload))
+        file.write(header + payload + self.CRC.pack(zlib.crc32(header + payload)))
+        file.flush()
+        os.fsync(file.fileno())
+
+    # A method to close our journal. On a clean exit, we'll discard it (there's nothing to recover).
+    def close(self, discard=True):
+        if discard:
+            self.discard()
+        else:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.unlock()
+
+    # A method to delete our journal (and its link) from disk.
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for path in (self.path, self.link_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        self.unlock()
+        self.path = None
+        self.link_path = None
+
+    # A method to release the lock on our journal.
+    def unlock(self):
+        if self.lock is not None:
+            self.lock.unlock()
+            self.lock = None
+
+    # A static method to create the lock file of a journal. Our lock is only ever stale once the process holding it has exited
+    # (however long it's been held).
+    @staticmethod
+    def create_lock(journal_path):
+        lock = QLockFile(journal_path + ".lock")
+        lock.setStaleLockTime(0)
+        return lock
+
+    # A static method to check whether a journal is in use (i.e. locked by a process that's still running).
+    # The lock of a process that has exited is removed.
+    @staticmethod
+    def is_locked(journal_path):
+        lock = CanvasJournal.create_lock(journal_path)
+        if not lock.tryLock(0):
+            return True
+        lock.unlock()
+        return False
+
+    # A static method to find the journals left behind by previous sessions (i.e. after a crash), newest first.
+    # Journals that are still in use (i.e. by another Pixelate window) are skipped.
+    @staticmethod
+    def find_journals():
+        recovery_dir = CanvasJournal.get_recovery_dir()
+        journals = glob.glob(os.path.join(recovery_dir, "*.journal"))
+
+        # Following our links to the journals stored next to our projects (removing any stale links).
+        for link_path in glob.glob(os.path.join(recovery_dir, "*.journal-link")):
+            with open(link_path, "r") as file:
+                journal_path = file.read().strip()
+            if os.path.exists(journal_path):
+                journals.append(journal_path)
+            else:
+                os.remove(link_path)
+
+        journals = [journal_path for journal_path in journals if not CanvasJournal.is_locked(journal_path)]
+        return sorted(journals, key=os.path.getmtime, reverse=True)
+
+    # A static method to get the project path of a journal (or None for unsaved projects).
+    @staticmethod
+    def get_project_path(journal_path):
+        if os.path.dirname(os.path.abspath(journal_path)) == CanvasJournal.get_recovery_dir():
+            return None
+        return journal_path[:-len(".journal")]
+
+    # A static method to delete a journal (and its link, if any) once we've recovered or dismissed it.
+    @staticmethod
+    def remove_journal(journal_path):
+        project_path = CanvasJournal.get_project_path(journal_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        if project_path and os.path.exists(CanvasJournal.get_link_path(project_path)):
+            os.remove(CanvasJournal.get_link_path(project_path))
+
+    # A static method to replay a journal, returning our recovered (width, height, layers, palette), where our layers are a list of
+    # (name, visible, opacity, rgba, mask) tuples (from bottom to top), and our palette is a list of (r, g, b, a) colors
+    # (or None if our layers weren't indexed). Indexed layers are replayed as indices, then looked up in our final palette.
+    # Replaying stops at the first incomplete or corrupted record (i.e. one that was being written during a crash).
+    @staticmethod
+    def replay(journal_path):
+        with open(journal_path, "rb") as file:
+            data = file.read()
+
+        # Reading and validating our header.
+        magic, version, width, height = CanvasJournal.HEADER.unpack_from(data, 0)
+        if magic != CanvasJournal.MAGIC or version != CanvasJournal.VERSION:
+            raise ValueError("The journal file is not a valid Pixelate journal.")
+        palette = None
+        layers = [["Layer 1", True, 100, np.zeros((height, width, 4), dtype=np.uint8), np.zeros((height, width), dtype=bool)]]
+
+        # The shape of the values (colors, or palette indices) of our layers.
+        def values_shape():
+            return (height, width) if palette is not None else (height, width, 4)
+
+        offset = CanvasJournal.HEADER.size
+        while offset + CanvasJournal.RECORD.size <= len(data):
+
+            # Reading our record, stopping if it's incomplete or its checksum doesn't match.
+            record_type, length = CanvasJournal.RECORD.unpack_from(data, offset)
+            end = offset + CanvasJournal.RECORD.size + length
+            if end + CanvasJournal.CRC.size > len(data):
+                break
+            (crc,) = CanvasJournal.CRC.unpack_from(data, end)
+            if crc != zlib.crc32(data[offset:end]):
+                break
+            payload = zlib.decompress(data[offset + CanvasJournal.RECORD.size:end])
+            offset = end + CanvasJournal.CRC.size
+
+            # Applying our record.
+            if record_type == CanvasJournal.LAYERS_CHECKPOINT:
+                palette, position = CanvasJournal.unpack_palette(payload)
+                (count,) = struct.unpack_from("<H", payload, position)
+                position, layers = position + 2, []
+                for _ in range(count):
+                    (length,) = struct.unpack_from("<H", payload, position)
+                    name = payload[position + 2:position + 2 + length].decode("utf-8")
+                    visible, opacity, size = struct.unpack_from("<BBI", payload, position + 2 + length)
+                    position += 2 + length + 6
+                    rgba, mask = np.zeros(values_shape(), dtype=np.uint8), np.zeros((height, width), dtype=bool)
+                    CanvasJournal.unpack_tiles(payload[position:position + size], rgba, mask)
+                    position += size
+                    layers.append([name, bool(visible), opacity, rgba, mask])
+            elif record_type == CanvasJournal.LAYER_OPERATION:
+                operation, index, new_index, visible, opacity = CanvasJournal.OPERATION.unpack_from(payload, 0)
+                if operation == CanvasJournal.LAYER_ADDED:
+                    name = payload[CanvasJournal.OPERATION.size:].decode("utf-8")
+                    layers.insert(index, [name, bool(visible), opacity, np.zeros(values_shape(), dtype=np.uint8), np.zeros((height, width), dtype=bool)])
+                elif operation == CanvasJournal.LAYER_REMOVED:
+                    layers.pop(index)
+                elif operation == CanvasJournal.LAYER_MOVED:
+                    layers.insert(new_index, layers.pop(index))
+                elif operation == CanvasJournal.LAYER_PROPERTIES:
+                    layers[index][1], layers[index][2] = bool(visible), opacity
+            elif record_type == CanvasJournal.PALETTE:
+                palette = CanvasJournal.unpack_palette(payload)[0]
+            elif record_type == CanvasJournal.LAYER_DELTA:
+                (index,) = struct.unpack_from("<H", payload, 0)
+                CanvasJournal.unpack_tiles(payload[2:], layers[index][3], layers[index][4])
+
+        # Looking up the colors of our indexed layers (our unpainted cells are left as (0, 0, 0, 0)).
+        colors = None
+        if palette is not None:
+            lookup = np.zeros((256, 4), dtype=np.uint8)
+            lookup[:len(palette)] = palette
+            for layer in layers:
+                rgba = lookup[layer[3]]
+                rgba[~layer[4]] = 0
+                layer[3] = rgba
+            colors = [tuple(color) for color in palette.tolist()]
+
+        return width, height, [tuple(layer) for layer in layers], colors
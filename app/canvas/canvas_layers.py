@@ -0,0 +1,303 @@
+# Importing numpy to blend our layers together, and base64/zlib to encode their tiles (for saving).
+import base64
+import zlib
+import numpy as np
+from PyQt6.QtGui import QColor
+from canvas.pixel_store import PixelStore
+from canvas.indexed_pixel_store import CanvasPalette, IndexedPixelStore
+from canvas.canvas_journal import CanvasJournal
+
+'''
+    A class to store a single layer of our canvas:
+    Each layer has its own pixel store (its pixels), along with the following properties:
+        name    -> the name of our layer (shown in our layers menu).
+        visible -> whether our layer is drawn at all.
+        opacity -> how opaque our layer is drawn (from 0 to 100 percent).
+'''
+class CanvasLayer:
+
+    def __init__(self, name, pixels, visible=True, opacity=100):
+        self.name    = name
+        self.visible = visible
+        self.opacity = opacity
+        self.pixels  = pixels
+
+'''
+    A class to store the composite of our layers: a pixel store of colors, except that a tile covered by a single opaque
+    indexed layer simply shares that layer's tile of palette indices (rather than holding a decoded copy of its colors).
+    Those tiles are only looked up in our palette as they're read (i.e. when our canvas buffer is rendered from them).
+'''
+class CompositePixelStore(PixelStore):
+
+    # Our constructor will set up our (empty) tiles, and store the palette of our layers (or None if they aren't indexed).
+    def __init__(self, width, height, palette=None):
+        super().__init__(width, height)
+        self.palette = palette
+
+    # A method to read one of our tiles as (rgba, mask) arrays (or None if it isn't allocated).
+    # Our shared indexed tiles are decoded into a new array of colors, with their unpainted pixels read as (0, 0, 0, 0).
+    def read_tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None or tile[0].ndim == 3:
+            return tile
+        rgba = self.palette.decode(tile[0])
+        rgba[~tile[1]] = 0
+        return rgba, tile[1]
+
+    def __getitem__(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        x, y = pixel
+        rgba = self.read_tile((x // self.TILE_SIZE, y // self.TILE_SIZE))[0]
+        return QColor(*rgba[y % self.TILE_SIZE, x % self.TILE_SIZE].tolist())
+
+'''
+    A class to store the layers of our canvas (ordered from bottom to top), along with a cached composite of them:
+    Our composite is itself a pixel store, holding the colors our visible layers blend to ("source over", with each
+    layer's opacity applied to its alpha). Our canvas buffer is rendered from our composite, just as it was from a single store.
+
+    Rather than re-blending our whole canvas whenever something changes, we only recompute the tiles (see PixelStore)
+    that have been written to in any of our layers, or that are covered by a layer whose visibility, opacity, or order has changed.
+    Where only a single (fully opaque) layer covers a tile, our composite simply shares that layer's tile (its indices,
+    for an indexed layer, see CompositePixelStore), so a canvas with a single layer costs no more than it did before we had layers.
+
+    One of our layers is our active layer, which is the layer our tools draw on.
+
+    Our layers can also be indexed (see IndexedPixelStore), in which case they all share our palette.
+    Changing our palette recomputes our composite from our layers' indices, without touching our layers.
+'''
+class CanvasLayers:
+
+    # Our constructor will set up a single (active) layer and an empty composite.
+    # If we're given a palette (a CanvasPalette), our layers will be indexed.
+    def __init__(self, width, height, palette=None):
+        self.width   = width
+        self.height  = height
+        self.palette = palette
+        self.layers  = [CanvasLayer("Layer 1", self.create_store())]
+        self.active_index = 0
+
+        # Our composite of our visible layers, and the tiles of it that need recomputing (besides our layers' dirty tiles).
+        self.composite = CompositePixelStore(width, height, palette)
+        self.invalid_tiles = set()
+
+        # To number our new layers.
+        self.layers_created = 1
+
+    # A method to create an empty pixel store for one of our layers (indexed, if we have a palette).
+    def create_store(self):
+        if self.palette is not None:
+            return IndexedPixelStore(self.width, self.height, self.palette)
+        return PixelStore(self.width, self.height)
+
+    # A method to get our palette (or None if our layers aren't indexed).
+    def get_palette(self):
+        return self.palette
+
+    # A method to set our palette (or None), converting the pixels of each of our layers to match.
+    # Converting to indexed layers maps each color to our palette (adding colors to it while there's room).
+    def set_palette(self, palette):
+        self.palette = self.composite.palette = palette
+        for layer in self.layers:
+            pixels = self.create_store()
+            pixels.update(layer.pixels)
+            self.invalidate(layer)
+            layer.pixels = pixels
+            self.invalidate(layer)
+
+    # A method to mark every tile of our composite as needing to be recomputed (i.e. once our palette has changed).
+    def invalidate_all(self):
+        for layer in self.layers:
+            self.invalidate(layer)
+
+    # A static method to flatten a layered project (see validate_layered_data) into a single pixels dictionary ({(x, y): rgba_tuple}),
+    # blending its visible layers just as our composite does (i.e. when uploading a project to our gallery).
+    @staticmethod
+    def flatten_data(width, height, data):
+        layers = CanvasLayers(width, height)
+        project_layers = []
+        for layer_data in data["layers"]:
+            pixels = layers.create_store()
+            layers.load_pixels(pixels, layer_data, data.get("palette"))
+            project_layers.append(CanvasLayer(layer_data["name"], pixels, layer_data["visible"], layer_data["opacity"]))
+        layers.set_layers(project_layers, data["active"])
+        layers.update_composite()
+        return layers.composite.to_rgba_dict()
+
+    # A static method to encode the tiles of a pixel store as a string (for saving): our tiles are packed just as they are
+    # in our journal (see CanvasJournal.pack_tiles), then compressed and encoded in base64.
+    @staticmethod
+    def encode_tiles(pixels):
+        return base64.b64encode(zlib.compress(CanvasJournal.pack_tiles(pixels))).decode("ascii")
+
+    # A static method to decode tiles (see encode_tiles) into the given (empty) pixel store.
+    @staticmethod
+    def decode_tiles(data, pixels):
+        size, keys, values, masks = CanvasJournal.unpack_tile_list(zlib.decompress(base64.b64decode(data)), pixels.VALUE_SHAPE)
+        if size != pixels.TILE_SIZE or not all(0 <= tile_x < pixels.tiles_x and 0 <= tile_y < pixels.tiles_y for tile_x, tile_y in keys):
+            raise ValueError("The saved tiles don't match the canvas.")
+        pixels.swap_tiles(keys, [(tile_values.copy(), tile_mask.copy()) for tile_values, tile_mask in zip(values, masks)])
+
+    # A method to load the pixels of a saved layer (see PixelateCanvas.get_layers_data) into the given (empty) store of ours,
+    # given the palette colors its project was saved with (or None if it wasn't indexed).
+    def load_pixels(self, pixels, layer_data, palette_colors=None):
+
+        # Older projects save a pixels dictionary for each layer.
+        if "tiles" not in layer_data:
+            pixels.update(layer_data["pixels"])
+            return
+
+        # Tiles saved with our own palette (or as colors, for our non-indexed layers) are loaded as they are.
+        saved_colors = None if palette_colors is None else [tuple(color) for color in palette_colors]
+        if saved_colors == (None if self.palette is None else self.palette.get_colors()):
+            self.decode_tiles(layer_data["tiles"], pixels)
+            return
+
+        # Otherwise, we'll load them into a store of their own kind first, then convert their colors to ours.
+        if palette_colors is None:
+            saved = PixelStore(self.width, self.height)
+        else:
+            saved = IndexedPixelStore(self.width, self.height, CanvasPalette(palette_colors))
+        self.decode_tiles(layer_data["tiles"], saved)
+        pixels.update(saved)
+
+    # A method to get our number of layers.
+    def get_layer_count(self):
+        return len(self.layers)
+
+    # A method to get one of our layers (by index, from the bottom).
+    def get_layer(self, index):
+        return self.layers[index]
+
+    # A method to get the index of our active layer.
+    def get_active_index(self):
+        return self.active_index
+
+    # A method to get our active layer.
+    def get_active_layer(self):
+        return self.layers[self.active_index]
+
+    # A method to set our active layer (by index).
+    def set_active_index(self, index):
+        if not 0 <= index < len(self.layers):
+            raise IndexError("There is no layer at the given index.")
+        self.active_index = index
+
+    # A method to get the index of the layer that owns the given pixel store (or None if none of our layers do).
+    def index_of(self, pixels):
+        for index, layer in enumerate(self.layers):
+            if layer.pixels is pixels:
+                return index
+        return None
+
+    # A method to add a new (empty) layer above the given index (above our active layer by default), which becomes our active layer.
+    def add_layer(self, name=None, index=None, visible=True, opacity=100):
+        self.layers_created += 1
+        layer = CanvasLayer(name or f"Layer {self.layers_created}", self.create_store(), visible, opacity)
+        index = self.active_index + 1 if index is None else index
+        self.layers.insert(index, layer)
+        self.active_index = index
+        return layer
+
+    # A method to add the given layers on top of our own (i.e. when importing a project), the top one becoming our active layer.
+    def append_layers(self, layers):
+        for layer in layers:
+            self.layers.append(layer)
+            self.invalidate(layer)
+        self.layers_created += len(layers)
+        self.active_index = len(self.layers) - 1
+
+    # A method to remove a layer (we always keep at least one), returning the layer we've removed.
+    def remove_layer(self, index):
+        if len(self.layers) == 1:
+            raise ValueError("A canvas must have at least one layer.")
+        layer = self.layers.pop(index)
+        self.invalidate(layer)
+        self.active_index = min(self.active_index if self.active_index < index else self.active_index - 1, len(self.layers) - 1)
+        self.active_index = max(self.active_index, 0)
+        return layer
+
+    # A method to move a layer to a new index (our active layer stays the same layer).
+    def move_layer(self, index, new_index):
+        new_index = max(0, min(new_index, len(self.layers) - 1))
+        if new_index == index:
+            return
+        active_layer = self.get_active_layer()
+        layer = self.layers.pop(index)
+        self.layers.insert(new_index, layer)
+        self.active_index = self.layers.index(active_layer)
+        self.invalidate(layer)
+
+    # A method to show or hide a layer.
+    def set_visible(self, index, visible):
+        layer = self.layers[index]
+        if layer.visible != visible:
+            layer.visible = visible
+            self.invalidate(layer)
+
+    # A method to set the opacity of a layer (from 0 to 100 percent).
+    def set_opacity(self, index, opacity):
+        layer = self.layers[index]
+        opacity = max(0, min(int(opacity), 100))
+        if layer.opacity != opacity:
+            layer.opacity = opacity
+            self.invalidate(layer)
+
+    # A method to mark every tile our layer covers as needing to be recomputed in our composite.
+    def invalidate(self, layer):
+        self.invalid_tiles.update(layer.pixels.tiles.keys())
+        self.invalid_tiles.update(layer.pixels.dirty_tiles)
+
+    # A method to replace our layers with the given ones (i.e. when opening a project), which invalidates our entire composite.
+    def set_layers(self, layers, active_index=0):
+        for layer in self.layers:
+            self.invalidate(layer)
+        self.layers = list(layers)
+        self.active_index = max(0, min(active_index, len(self.layers) - 1))
+        self.layers_created = max(self.layers_created, len(self.layers))
+        for layer in self.layers:
+            self.invalidate(layer)
+
+    # A method to recompute the tiles of our composite that have changed, returning the (tile_x, tile_y) keys we've recomputed.
+    def update_composite(self):
+        keys, self.invalid_tiles = self.invalid_tiles, set()
+        for layer in self.layers:
+            keys |= layer.pixels.take_dirty_tiles()
+        for key in keys:
+            self.composite_tile(key)
+        return keys
+
+    # A method to recompute a single tile of our composite from our visible layers.
+    def composite_tile(self, key):
+        layers = [layer for layer in self.layers if layer.visible and layer.opacity > 0 and key in layer.pixels.tiles]
+
+        # Tiles no visible layer has painted are left unallocated.
+        if not layers:
+            self.composite.tiles.pop(key, None)
+            return
+
+        # A tile covered by a single opaque layer is shared as is (it's only ever read from our composite).
+        # (An indexed layer's tile is shared as indices, which our composite decodes as it's read.)
+        if len(layers) == 1 and layers[0].opacity == 100:
+            self.composite.tiles[key] = layers[0].pixels.tiles[key]
+            return
+        tiles = [(layer.pixels.read_tile(key), layer.opacity) for layer in layers]
+
+        # Otherwise, we'll blend our layers from the bottom up (with premultiplied colors).
+        size = PixelStore.TILE_SIZE
+        color = np.zeros((size, size, 3), dtype=np.float32)
+        alpha = np.zeros((size, size, 1), dtype=np.float32)
+        painted = np.zeros((size, size), dtype=bool)
+        for (rgba, mask), opacity in tiles:
+            layer_alpha = rgba[..., 3:4] * (mask[..., None] * (opacity / (100 * 255)))
+            color = rgba[..., :3] * layer_alpha + color * (1 - layer_alpha)
+            alpha = layer_alpha + alpha * (1 - layer_alpha)
+            painted |= mask
+
+        # Converting our colors back to straight (non-premultiplied) colors.
+        rgba = np.zeros((size, size, 4), dtype=np.uint8)
+        visible = alpha[..., 0] > 0
+        rgba[visible, :3] = np.rint(color[visible] / alpha[visible]).clip(0, 255)
+        rgba[..., 3] = np.rint(alpha[..., 0] * 255)
+        rgba[~painted] = 0
+        self.composite.tiles[key] = (rgba, painted)
@@ -0,0 +1,101 @@
+# Importing numpy to downsample our canvas buffer.
+import numpy as np
+# Importing the necessary modules to draw our downsampled images.
+from PyQt6.QtGui import QImage
+from PyQt6.QtCore import QRectF
+from canvas.stale_tiles import StaleTiles
+
+'''
+    A class to store a mip chain of our canvas buffer: a series of images, each half the size of the last one.
+    When our canvas is zoomed out far enough that each cell is smaller than a pixel on screen, we'll draw the level of our
+    chain that matches our zoom, rather than having Qt downsample our full-size buffer every time we paint.
+
+    The structure of our chain will be as follows:
+        level 0 -> our canvas buffer itself (one pixel per cell).
+        level k -> one pixel per 2^k x 2^k block of cells (the average of the 4 pixels below it in level k - 1).
+
+    Our levels are only computed when they're first drawn. Afterwards, we only recompute the tiles (see StaleTiles)
+    that have been re-rendered since a level was last drawn.
+'''
+class CanvasMipmaps:
+
+    # Our constructor will set up the size of each level (and mark all of our tiles as dirty).
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+        # The (width, height) of each of our levels, down to a single pixel.
+        self.sizes = [(buffer.width, buffer.height)]
+        while self.sizes[-1] != (1, 1):
+            width, height = self.sizes[-1]
+            self.sizes.append(((width + 1) // 2, (height + 1) // 2))
+
+        # Our levels (past level 0) and their images, which are allocated once they're first drawn.
+        self.levels = [buffer.display] + [None] * (len(self.sizes) - 1)
+        self.images = [buffer.image] + [None] * (len(self.sizes) - 1)
+
+        # Which of our tiles each level (past level 0) needs to recompute.
+        self.dirty_tiles = [None] + [StaleTiles(buffer.width, buffer.height) for _ in self.sizes[1:]]
+
+    # A method to mark a region of cells (a QRect in cell coordinates, or our whole canvas) as changed.
+    def mark_dirty(self, cells=None):
+        for dirty_tiles in self.dirty_tiles[1:]:
+            dirty_tiles.mark(cells)
+
+    # A method to choose the level to draw, given the size of a cell on screen (in device pixels).
+    # We'll use the largest level whose pixels are still at least as large as a pixel on screen.
+    def choose_level(self, cell_size):
+        if cell_size >= 1:
+            return 0
+        return min(int(np.floor(np.log2(1 / cell_size))), len(self.sizes) - 1)
+
+    # A method to get the image of a level (recomputing its dirty tiles first).
+    def get_image(self, level):
+        self.update_level(level)
+        return self.images[level]
+
+    # A method to recompute the dirty tiles of a level from the level below it.
+    def update_level(self, level):
+        if level == 0 or not self.dirty_tiles[level].any():
+            return
+        self.update_level(level - 1)
+
+        # Allocating our level (and its image) the first time it's needed.
+        if self.levels[level] is None:
+            width, height = self.sizes[level]
+            self.levels[level] = np.empty((height, width, 4), dtype=np.uint8)
+            self.images[level] = QImage(self.levels[level].data, width, height, width * 4, QImage.Format.Format_RGBA8888_Premultiplied)
+
+        # Recomputing each row of tiles, from its first to its last dirty tile.
+        for rect in self.dirty_tiles[level].take_rects():
+            x0, y0, x1, y1 = rect.x(), rect.y(), rect.x() + rect.width(), rect.y() + rect.height()
+            self.downsample(level, x0 >> level, y0 >> level, -(-x1 >> level), -(-y1 >> level))
+
+    # A method to recompute a region of a level (given in that level's pixel coordinates) from the level below it.
+    def downsample(self, level, x0, y0, x1, y1):
+        below = self.levels[level - 1]
+        source = below[2 * y0:2 * y1, 2 * x0:2 * x1].astype(np.uint16)
+
+        # At the edges of an odd-sized level, our last pixel only has one row (or column) below it, which we'll repeat.
+        pad_y, pad_x = 2 * (y1 - y0) - source.shape[0], 2 * (x1 - x0) - source.shape[1]
+        if pad_y or pad_x:
+            source = np.pad(source, ((0, pad_y), (0, pad_x), (0, 0)), mode="edge")
+
+        # Averaging each 2 x 2 block of pixels.
+        blocks = source.reshape(y1 - y0, 2, x1 - x0, 2, 4).sum(axis=(1, 3))
+        self.levels[level][y0:y1, x0:x1] = ((blocks + 2) // 4).astype(np.uint8)
+
+    # A method to draw a region of our canvas (in cell coordinates) from the given level, scaled up by our pixel size.
+    def draw(self, painter, cells, pixel_size, level):
+        image = self.get_image(level)
+        scale = 1 << level
+
+        # The pixels of our level that cover our cells (clipped to our canvas, since our last pixels may cover fewer cells).
+        x0, y0 = cells.x() // scale, cells.y() // scale
+        x1 = -(-(cells.x() + cells.width()) // scale)
+        y1 = -(-(cells.y() + cells.height()) // scale)
+        cell_x1 = min(x1 * scale, self.buffer.width)
+        cell_y1 = min(y1 * scale, self.buffer.height)
+
+        target = QRectF(x0 * scale * pixel_size, y0 * scale * pixel_size, (cell_x1 - x0 * scale) * pixel_size, (cell_y1 - y0 * scale) * pixel_size)
+        source = QRectF(x0, y0, (cell_x1 - x0 * scale) / scale, (cell_y1 - y0 * scale) / scale)
+        painter.drawImage(target, image, source)
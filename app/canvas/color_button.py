@@ -40,6 +40,12 @@ class ColorButton(QPushButton):
 
         super().mousePressEvent(event)
 
+    # Overriding the mouseDoubleClickEvent method to edit the palette color of our button.
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.color_selection_window.edit_palette_color(self)
+        super().mouseDoubleClickEvent(event)
+
     # Overriding the enterEvent method to set our color selection window's approximation label.
     def enterEvent(self, event):
 
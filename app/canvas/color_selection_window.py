@@ -2,12 +2,16 @@
 from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QGridLayout, QHBoxLayout, QVBoxLayout, QWidget, QColorDialog, QLabel
 # Importing the necessary modules to work with canvas drawings.
 from PyQt6.QtGui import QPainter, QColor, QFontDatabase, QFont, QGuiApplication
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from canvas.color_button import ColorButton
 from canvas.color_approx_mapping import ColorApproximator
 from tools.smart_filter import daltonize
 
 class ColorSelectionWindow(QMainWindow):
+
+    # Emitted whenever the colors of our palette change (i.e. swapping palettes, or editing one of its colors).
+    palette_changed = pyqtSignal()
+
     def __init__(self, pixel_size=15, grid_width=32, grid_height=32):
 
         super().__init__()
@@ -73,6 +77,9 @@ class ColorSelectionWindow(QMainWindow):
             ]
         }
 
+        # The name of our active palette.
+        self.active_palette = "Normal"
+
         # Creating an instance of our color approximator class (to handle our approximation labels).
         self.color_approximator = ColorApproximator()
 
@@ -160,6 +167,7 @@ class ColorSelectionWindow(QMainWindow):
 
         # Setting the active palette button to the button that triggered the signal.
         self.active_palette_button = self.sender()
+        self.active_palette = palette
 
         # We'll style our active palette button differently from the rest.
         for button in self.palette_buttons:
@@ -186,6 +194,35 @@ class ColorSelectionWindow(QMainWindow):
         # We'll update the selected colors to reflect the changes we've made.
         self.update_selected_colors()
 
+        # Letting our canvas know that our palette has changed (i.e. to recolor an indexed canvas).
+        self.palette_changed.emit()
+
+    # A method to get the colors of our active palette, as a list of (r, g, b, a) tuples.
+    def get_palette_colors(self):
+        return [color.getRgb() for color in self.color_palettes[self.active_palette]]
+
+    # A method to edit one of the colors of our active palette (given its color button), using the color dialog.
+    def edit_palette_color(self, button):
+
+        # Only the buttons of our grid are palette colors (not our primary/secondary color boxes).
+        grid_layout = self.centralWidget().layout().itemAt(2).widget().layout()
+        index = grid_layout.indexOf(button)
+        if index == -1:
+            return
+
+        color_dialog = QColorDialog()
+        color_dialog.setCurrentColor(self.color_palettes[self.active_palette][index])
+        if color_dialog.exec() != QColorDialog.DialogCode.Accepted:
+            return
+
+        # Updating our palette and its button (showing its filtered color if our filter is on).
+        color = color_dialog.selectedColor()
+        self.color_palettes[self.active_palette][index] = color
+        button.setColor(color.name())
+        color = color if not self.is_filter_on else daltonize(color, self.filter_type)
+        button.setStyleSheet(f"background-color: {color.name()}; border: {self.button_border}px solid black;")
+        self.palette_changed.emit()
+
     # A method to set up our palette selection buttons.
     def setup_palettes(self):
         
@@ -0,0 +1,138 @@
+# Importing numpy to find our fill regions over our pixel arrays.
+import numpy as np
+
+'''
+    The functions we'll use to compute the regions filled by our fill tool:
+    Rather than visiting (and drawing) one pixel at a time, we'll first compute a boolean mask of the cells our
+    fill covers, so that our canvas can write the whole region to its pixel store in a single batch.
+
+    Our fill works in two steps:
+        1. We find the cells whose color matches our target color (as an H x W boolean mask).
+           A color matches if its distance to our target color is within our tolerance, measured either as:
+               "rgba" -> the euclidean distance between the (r, g, b, a) values of our colors (0 - 510).
+               "lab"  -> the CIE76 color difference (delta E) between our colors in Lab space, with
+                         differences in alpha scaled to the range of L (0 - 100).
+        2. We find the cells of that mask that are connected to the pixel we've clicked on (a scanline fill).
+           (When replacing a color globally, we skip this step and fill every matching cell instead.)
+'''
+
+# Our supported color distance metrics.
+COLOR_METRICS = ("rgba", "lab")
+
+# A function to find the cells (an H x W bool mask) whose color matches our target (r, g, b, a) color.
+# Our colors are the H x W x 4 colors of our canvas (with unpainted cells taking on our background color).
+def get_matching_cells(colors, target_color, tolerance=0, metric="rgba"):
+    target_color = np.asarray(target_color, dtype=np.uint8)
+
+    # An exact match can be found by comparing our colors directly (as packed 32-bit values).
+    if tolerance <= 0:
+        return np.ascontiguousarray(colors).view(np.uint32)[..., 0] == target_color.view(np.uint32)[0]
+
+    # Otherwise, since sprites tend to use only a handful of distinct colors, we'll measure the distance of each
+    # unique color to our target color once, then map the results back to our cells.
+    packed = np.ascontiguousarray(colors).view(np.uint32)[..., 0]
+    unique_colors, inverse = np.unique(packed, return_inverse=True)
+    unique_colors = unique_colors.view(np.uint8).reshape(-1, 4)
+    distances = get_color_distances(unique_colors, target_color, metric)
+    return (distances <= tolerance)[inverse.reshape(packed.shape)]
+
+# A function to get the distances between an N x 4 array of (r, g, b, a) colors and a single target color.
+def get_color_distances(colors, target_color, metric="rgba"):
+    if metric not in COLOR_METRICS:
+        raise ValueError(f"Unknown color metric: {metric}")
+
+    if metric == "rgba":
+        differences = colors.astype(np.float64) - np.asarray(target_color, dtype=np.float64)
+        return np.sqrt(np.sum(differences ** 2, axis=1))
+
+    # Measuring the difference between our colors in Lab space, along with the difference in their alpha.
+    lab = rgb_to_lab(colors[:, :3]) - rgb_to_lab(np.asarray(target_color, dtype=np.uint8)[None, :3])
+    alpha = (colors[:, 3].astype(np.float64) - float(target_color[3])) * (100.0 / 255.0)
+    return np.sqrt(np.sum(lab ** 2, axis=1) + alpha ** 2)
+
+# A function to convert an N x 3 array of (8-bit) sRGB colors to CIE Lab colors (D65 white point).
+def rgb_to_lab(colors):
+    rgb = colors.astype(np.float64) / 255.0
+
+    # Converting our colors from sRGB to linear RGB, then to XYZ (normalized by our white point).
+    rgb = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = rgb @ np.array([[0.4124564, 0.2126729, 0.0193339],
+                          [0.3575761, 0.7151522, 0.1191920],
+                          [0.1804375, 0.0721750, 0.9503041]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+
+    # Converting our colors from XYZ to Lab.
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    L = 116 * f[:, 1] - 16
+    a = 500 * (f[:, 0] - f[:, 1])
+    b = 200 * (f[:, 1] - f[:, 2])
+    return np.stack([L, a, b], axis=1)
+
+# A function to find the cells of our mask that are connected (4-way) to the given (x, y) pixel.
+# Rather than pushing every neighboring cell onto a stack, we fill entire horizontal spans (scanlines) at a time,
+# and only push one seed cell for each span of matching cells above and below the span we've just filled.
+def flood_fill(matching, pixel):
+    height, width = matching.shape
+    region = np.zeros((height, width), dtype=bool)
+
+    x, y = pixel
+    if not (0 <= x < width and 0 <= y < height) or not matching[y, x]:
+        return region
+
+    stack = [(x, y)]
+    while stack:
+        x, y = stack.pop()
+
+        # If this cell has already been filled, so has its span.
+        if region[y, x]:
+            continue
+
+        # Finding the left and right ends of the span of matching cells containing our cell.
+        row = matching[y]
+        gaps = np.flatnonzero(~row[:x])
+        left = gaps[-1] + 1 if gaps.size else 0
+        gaps = np.flatnonzero(~row[x:])
+        right = x + gaps[0] if gaps.size else width
+
+        # Filling our span.
+        region[y, left:right] = True
+
+        # Seeding the spans of unfilled, matching cells directly above and below our span.
+        for ny in (y - 1, y + 1):
+            if not 0 <= ny < height:
+                continue
+            candidates = matching[ny, left:right] & ~region[ny, left:right]
+            # Each span begins at a candidate cell whose left neighbor isn't a candidate.
+            starts = np.flatnonzero(candidates & ~np.concatenate(([False], candidates[:-1])))
+            stack.extend((left + int(start), ny) for start in starts)
+
+    return region
+
+# Our supported gradients.
+GRADIENTS = ("linear", "radial")
+
+# A function to get the colors of a gradient (an N x 4 array) at the given cells (x and y coordinate arrays).
+# Our gradient goes from our start color at our start cell to our end color at our end cell, either:
+#     "linear" -> along the line from our start cell to our end cell (constant across it).
+#     "radial" -> outwards from our start cell, reaching our end color at the distance of our end cell.
+def get_gradient_colors(xs, ys, start, end, start_color, end_color, gradient="linear"):
+    if gradient not in GRADIENTS:
+        raise ValueError(f"Unknown gradient: {gradient}")
+
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    offset_x = xs.astype(np.float64) - start[0]
+    offset_y = ys.astype(np.float64) - start[1]
+
+    # Finding how far along our gradient (from 0 to 1) each of our cells is.
+    if gradient == "linear":
+        length = dx * dx + dy * dy
+        t = (offset_x * dx + offset_y * dy) / length if length else np.zeros(len(xs))
+    else:
+        radius = np.hypot(dx, dy)
+        t = np.hypot(offset_x, offset_y) / radius if radius else np.zeros(len(xs))
+    t = np.clip(t, 0.0, 1.0)[:, None]
+
+    # Blending our start and end colors.
+    start_color = np.asarray(start_color, dtype=np.float64)
+    end_color = np.asarray(end_color, dtype=np.float64)
+    return np.rint(start_color * (1.0 - t) + end_color * t).astype(np.uint8)
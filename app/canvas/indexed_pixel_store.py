@@ -0,0 +1,131 @@
+# Importing numpy to map between our colors and palette indices.
+import numpy as np
+from canvas.pixel_store import PixelStore
+
+'''
+    A class to store the palette of an indexed canvas: a lookup table of up to 256 (r, g, b, a) colors.
+    Our first entries mirror the active palette of our color selection window. Colors that aren't in our palette
+    (i.e. custom colors) are added as new entries, until our palette is full; afterwards, they're mapped to our closest entry.
+
+    Since our pixels only store indices into our palette, swapping our palette (or editing one of its entries)
+    recolors every pixel that uses it, without touching the pixels themselves.
+'''
+class CanvasPalette:
+
+    # The maximum number of colors in our palette (so that our indices fit in a single byte).
+    MAX_COLORS = 256
+
+    # Our constructor will set up our palette with the given (r, g, b, a) colors.
+    def __init__(self, colors=()):
+        self.colors = np.zeros((self.MAX_COLORS, 4), dtype=np.uint8)
+        self.count  = 0
+        self.set_colors(0, colors)
+
+    # A method to get our number of colors.
+    def get_color_count(self):
+        return self.count
+
+    # A method to get our colors, as a list of (r, g, b, a) tuples.
+    def get_colors(self):
+        return [tuple(color) for color in self.colors[:self.count].tolist()]
+
+    # A method to set our colors, starting at the given index, returning whether any of our colors changed.
+    def set_colors(self, start, colors):
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 4)
+        end = min(start + len(colors), self.MAX_COLORS)
+        changed = bool((self.colors[start:end] != colors[:end - start]).any()) or end > self.count
+        self.colors[start:end] = colors[:end - start]
+        self.count = max(self.count, end)
+        self.update_indices()
+        return changed
+
+    # A method to set a single color of our palette, returning whether it changed.
+    def set_color(self, index, color):
+        return self.set_colors(index, [color])
+
+    # A method to rebuild our lookup from packed (32-bit) colors to their (first) index in our palette.
+    def update_indices(self):
+        keys = self.colors[:self.count].view(np.uint32).ravel().tolist()
+        self.indices = {}
+        for index, key in enumerate(keys):
+            self.indices.setdefault(key, index)
+
+    # A method to convert a single (r, g, b, a) color or an N x 4 array of colors to palette indices.
+    def encode(self, colors):
+        colors = np.ascontiguousarray(colors, dtype=np.uint8)
+        if colors.ndim == 1:
+            return np.uint8(self.get_index(colors))
+        if len(colors) == 0:
+            return np.zeros(0, dtype=np.uint8)
+
+        # Our colors tend to repeat (i.e. a fill), so we'll look up each distinct color once.
+        keys, inverse = np.unique(colors.view(np.uint32).ravel(), return_inverse=True)
+        lookup = np.array([self.get_index(color) for color in keys.view(np.uint8).reshape(-1, 4)], dtype=np.uint8)
+        return lookup[inverse.ravel()]
+
+    # A method to get the index of a single color, adding it to our palette if there's room (or using our closest color otherwise).
+    def get_index(self, color):
+        key = int(np.ascontiguousarray(color, dtype=np.uint8).view(np.uint32)[0])
+        index = self.indices.get(key)
+        if index is not None:
+            return index
+        if self.count < self.MAX_COLORS:
+            self.colors[self.count] = color
+            self.indices[key] = self.count
+            self.count += 1
+            return self.count - 1
+        distances = ((self.colors.astype(np.int32) - np.asarray(color, dtype=np.int32)) ** 2).sum(axis=1)
+        return int(np.argmin(distances))
+
+    # A method to convert an array of palette indices back to colors.
+    def decode(self, indices):
+        return self.colors[indices]
+
+'''
+    A class to store the pixels of an indexed canvas: rather than a full (r, g, b, a) color, each of our pixels is stored
+    as a single byte, an index into our (shared) palette. Along with its painted state, each of our pixels takes up 2 bytes
+    rather than 5 (so our tiles take up 2.5x less memory), and our history records indices as well (so undoing a change restores indices, whatever our palette is now).
+
+    We behave just like a PixelStore: colors written to us are encoded as indices, and colors read from us are looked up in our palette.
+'''
+class IndexedPixelStore(PixelStore):
+
+    # Each of our pixels is stored as a single palette index.
+    VALUE_SHAPE = ()
+
+    # Our constructor will set up our (empty) tiles, and store our palette.
+    def __init__(self, width, height, palette):
+        super().__init__(width, height)
+        self.palette = palette
+
+    # A method to convert a single color or an N x 4 array of colors to palette indices.
+    # (Erasing writes a single 0, which we'll keep as is.)
+    def encode(self, colors):
+        colors = np.asarray(colors, dtype=np.uint8)
+        if colors.ndim == 0:
+            return colors
+        return self.palette.encode(colors)
+
+    # A method to convert an array of palette indices back to colors.
+    def decode(self, values):
+        return self.palette.decode(values)
+
+    # A method to read one of our tiles as (rgba, mask) arrays (or None if it isn't allocated).
+    # Our unpainted pixels always read as (0, 0, 0, 0), whatever the color of the index they hold.
+    def read_tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            return None
+        rgba = self.decode(tile[0])
+        rgba[~tile[1]] = 0
+        return rgba, tile[1]
+
+    # A method to convert a test of colors (see find_cells) to a test of our palette indices:
+    # we'll test each color of our palette once, then look up the result of each index.
+    def get_values_test(self, test):
+        lookup = test(self.palette.colors[None])[0]
+        return lambda indices: lookup[indices]
+
+    # A method to create an empty store like ours (sharing our palette).
+    def create_empty(self):
+        return IndexedPixelStore(self.width, self.height, self.palette)
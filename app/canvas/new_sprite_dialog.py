@@ -152,7 +152,7 @@ class NewSpriteDialog(QDialog):
 
         # Defining the minimum and maximum sizes for our sprite.
         min_size = 2
-        max_size = 512
+        max_size = 4096
 
         # Getting the width and height from our inputs.
         width = self.width_input.text()
@@ -0,0 +1,398 @@
+# Importing numpy to store our pixel colors as arrays.
+import numpy as np
+# Importing QColor and QImage to convert between our arrays and Qt's color/image objects.
+from PyQt6.QtGui import QColor, QImage
+from PyQt6.QtCore import QRect
+from canvas.canvas_history import CanvasDelta
+
+'''
+    A class to store the colors of our canvas's pixels:
+    Instead of a dictionary of QColor objects, our colors are stored in numpy arrays, split into square tiles
+    (64 x 64 pixels each). A tile is only allocated once one of its pixels is painted, and is freed again once
+    all of its pixels are erased, so large canvases (up to 4096 x 4096 and beyond) only use memory for what's been drawn.
+
+    The structure of each of our tiles will be as follows:
+        rgba -> a 64 x 64 x 4 uint8 array, where rgba[y, x] is the (r, g, b, a) color of the pixel at (x, y) within our tile.
+        mask -> a 64 x 64 bool array, where mask[y, x] is True if the pixel at (x, y) within our tile has been painted.
+
+    Unpainted pixels always have an rgba value of (0, 0, 0, 0), so that our colors can be drawn directly
+    on top of our grid as a transparent image. We also keep track of the tiles that have been written to (our dirty tiles),
+    so that our canvas only needs to re-render those tiles after a larger change (i.e. an import).
+
+    While recording (i.e. during a stroke), our store takes a snapshot of each tile the first time it's written to.
+    Once we stop recording, only the tiles that actually changed are returned as a CanvasDelta (holding their original snapshots).
+
+    To keep our tools, eyedropper, and gallery code working, our store also behaves like the old dictionary:
+        (x, y) -> QColor object, where (x, y) are the coordinates of a painted pixel on the canvas.
+
+    Our tiles hold the values our pixels are stored as, which are simply their rgba colors. Colors are converted to and from
+    our values by our encode/decode methods, which other stores can override (i.e. to store palette indices instead).
+    Our history (see CanvasDelta) records our values as they're stored.
+'''
+class PixelStore:
+
+    # The size of our tiles (in pixels).
+    TILE_SIZE = 64
+
+    # The shape of the value each of our pixels is stored as (an (r, g, b, a) color).
+    VALUE_SHAPE = (4,)
+
+    # Our constructor will set up our (empty) tiles.
+    def __init__(self, width, height):
+        self.width  = width
+        self.height = height
+        self.tiles_x = -(-width // self.TILE_SIZE)
+        self.tiles_y = -(-height // self.TILE_SIZE)
+
+        # Our allocated tiles, as {(tile_x, tile_y): (rgba, mask)}, and the tiles written to since they were last taken.
+        self.tiles = {}
+        self.dirty_tiles = set()
+
+        # Our recording state: the original (values, mask) snapshot of each tile we've recorded (None if it wasn't allocated).
+        self.recording = False
+        self.recorded  = {}
+
+    # A method to start recording the changes made to our pixels.
+    def begin_recording(self):
+        self.recording = True
+        self.recorded  = {}
+
+    # A method to stop recording, returning a CanvasDelta of the tiles that changed (or None if nothing changed).
+    def end_recording(self):
+        if not self.recording:
+            return None
+        self.recording = False
+        recorded, self.recorded = self.recorded, {}
+
+        # We'll only keep the tiles whose values or painted states actually changed (comparing unallocated tiles as empty ones).
+        keys, old_tiles, rect = [], [], QRect()
+        empty = self.new_tile()
+        for key, old in recorded.items():
+            old_values, old_mask = old or empty
+            new_values, new_mask = self.tiles.get(key, empty)
+            if np.array_equal(old_mask, new_mask) and np.array_equal(old_values, new_values):
+                continue
+            keys.append(key)
+            old_tiles.append(old)
+            rect |= self.get_tile_rect(key)
+        if not keys:
+            return None
+        return CanvasDelta(keys, old_tiles, self, rect)
+
+    # A method to record the original contents of a tile (a snapshot of it), the first time it's written to.
+    def record_tile(self, key):
+        if key in self.recorded:
+            return
+        tile = self.tiles.get(key)
+        self.recorded[key] = None if tile is None else (tile[0].copy(), tile[1].copy())
+
+    # A method to group the given pixels by the tile they belong to, yielding each tile's (tile_x, tile_y) key
+    # along with the indices (into our coordinate arrays) of its pixels.
+    def group_by_tile(self, xs, ys):
+        tile_ids = (ys // self.TILE_SIZE) * self.tiles_x + (xs // self.TILE_SIZE)
+
+        # Our tile ids usually fit in 16 bits, which lets numpy sort them in linear time (with a radix sort).
+        if self.tiles_x * self.tiles_y <= 1 << 16:
+            tile_ids = tile_ids.astype(np.uint16)
+
+        # Most of our changes (i.e. a brush stamp) fall within a single tile.
+        first = int(tile_ids[0])
+        if (tile_ids == first).all():
+            yield (first % self.tiles_x, first // self.tiles_x), slice(None)
+            return
+
+        order = np.argsort(tile_ids, kind="stable")
+        sorted_ids = tile_ids[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1])))
+        ends = np.append(starts[1:], order.size)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            tile_id = int(sorted_ids[start])
+            yield (tile_id % self.tiles_x, tile_id // self.tiles_x), order[start:end]
+
+    # A method to get the rect of cells (a QRect) covered by the given tile.
+    def get_tile_rect(self, key):
+        tile_x, tile_y = key
+        return QRect(tile_x * self.TILE_SIZE, tile_y * self.TILE_SIZE, self.TILE_SIZE, self.TILE_SIZE).intersected(QRect(0, 0, self.width, self.height))
+
+    # A method to take (and reset) the set of tiles that have been written to.
+    def take_dirty_tiles(self):
+        dirty_tiles, self.dirty_tiles = self.dirty_tiles, set()
+        return dirty_tiles
+
+    # A method to get the number of bytes our tiles take up in memory.
+    def get_memory_usage(self):
+        return sum(values.nbytes + mask.nbytes for values, mask in self.tiles.values())
+
+    # A method to allocate a new (unpainted) tile, as (values, mask).
+    def new_tile(self):
+        return (np.zeros((self.TILE_SIZE, self.TILE_SIZE) + self.VALUE_SHAPE, dtype=np.uint8), np.zeros((self.TILE_SIZE, self.TILE_SIZE), dtype=bool))
+
+    # A method to convert a single (r, g, b, a) color or an N x 4 array of colors to the values we store.
+    # (Our colors are stored as is.)
+    def encode(self, colors):
+        return np.asarray(colors, dtype=np.uint8)
+
+    # A method to convert an array of our stored values back to colors.
+    def decode(self, values):
+        return values
+
+    # A method to read one of our tiles as (rgba, mask) arrays (or None if it isn't allocated).
+    # (Since our values are our colors, this is the tile itself.)
+    def read_tile(self, key):
+        return self.tiles.get(key)
+
+    # A method to get the coordinates and colors of our painted pixels (in row-major order), as x, y, and N x 4 rgba arrays.
+    def get_painted_cells(self):
+        if not self.tiles:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros((0, 4), dtype=np.uint8)
+        chunks = []
+        for tile_x, tile_y in self.tiles:
+            rgba, mask = self.read_tile((tile_x, tile_y))
+            ys, xs = np.nonzero(mask)
+            chunks.append((xs + tile_x * self.TILE_SIZE, ys + tile_y * self.TILE_SIZE, rgba[ys, xs]))
+        xs = np.concatenate([chunk[0] for chunk in chunks])
+        ys = np.concatenate([chunk[1] for chunk in chunks])
+        colors = np.concatenate([chunk[2] for chunk in chunks])
+        order = np.lexsort((xs, ys))
+        return xs[order], ys[order], colors[order]
+
+    # A method to check whether a pixel is within the bounds of our canvas.
+    # (Negative indices would otherwise wrap around in numpy, so we'll always check first.)
+    def is_within_bounds(self, pixel):
+        x, y = pixel
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    # The following methods allow our store to be used like our old {(x, y): QColor} dictionary.
+    def __getitem__(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        x, y = pixel
+        values = self.tiles[(x // self.TILE_SIZE, y // self.TILE_SIZE)][0]
+        return QColor(*self.decode(values[y % self.TILE_SIZE, x % self.TILE_SIZE]).tolist())
+
+    def __setitem__(self, pixel, color):
+        if not self.is_within_bounds(pixel):
+            raise KeyError(pixel)
+        x, y = pixel
+        self.set_cells(np.array([x]), np.array([y]), color.getRgb())
+
+    def __delitem__(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        x, y = pixel
+        self.erase_cells(np.array([x]), np.array([y]))
+
+    def __contains__(self, pixel):
+        if not self.is_within_bounds(pixel):
+            return False
+        x, y = pixel
+        tile = self.tiles.get((x // self.TILE_SIZE, y // self.TILE_SIZE))
+        return tile is not None and bool(tile[1][y % self.TILE_SIZE, x % self.TILE_SIZE])
+
+    def __len__(self):
+        return sum(int(np.count_nonzero(mask)) for _, mask in self.tiles.values())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    # A method to get the color of a pixel, returning the default value if it hasn't been painted.
+    def get(self, pixel, default=None):
+        if pixel in self:
+            return self[pixel]
+        return default
+
+    # A method to get the coordinates of all painted pixels as a list of (x, y) tuples.
+    def keys(self):
+        xs, ys, _ = self.get_painted_cells()
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    # A method to get all painted pixels as (x, y), QColor pairs.
+    def items(self):
+        xs, ys, colors = self.get_painted_cells()
+        return [((x, y), QColor(*color)) for x, y, color in zip(xs.tolist(), ys.tolist(), colors.tolist())]
+
+    # A method to create an empty store like ours (of the same size and kind).
+    def create_empty(self):
+        return PixelStore(self.width, self.height)
+
+    # A method to create a (deep) copy of our store.
+    def copy(self):
+        store = self.create_empty()
+        store.tiles = {key: (rgba.copy(), mask.copy()) for key, (rgba, mask) in self.tiles.items()}
+        return store
+
+    # A method to erase all of our pixels.
+    def clear(self):
+        if self.recording:
+            for key in self.tiles:
+                self.record_tile(key)
+        self.dirty_tiles.update(self.tiles.keys())
+        self.tiles = {}
+
+    # A method to add new pixels to our store (not replacing the existing ones).
+    # Our pixels can be provided as {(x, y): QColor}, {(x, y): rgba_tuple}, or as another store.
+    def update(self, pixels):
+
+        # If we're given another store, we'll copy over its painted pixels in one go.
+        if isinstance(pixels, PixelStore):
+            xs, ys, colors = pixels.get_painted_cells()
+            inside = (xs < self.width) & (ys < self.height)
+            if xs.size:
+                self.set_cells(xs[inside], ys[inside], colors[inside])
+            return
+
+        # Otherwise, we'll convert our dictionary into coordinate and color arrays.
+        pixels = {pixel: color for pixel, color in pixels.items() if self.is_within_bounds(pixel)}
+        if not pixels:
+            return
+        coords = np.array(list(pixels.keys()), dtype=np.intp)
+        colors = np.array([color.getRgb() if isinstance(color, QColor) else tuple(color) for color in pixels.values()], dtype=np.uint8)
+        self.set_cells(coords[:, 0], coords[:, 1], colors)
+
+    # A method to paint several pixels at once, given arrays of x and y coordinates and their color(s).
+    # Our color can either be a single (r, g, b, a) color or an N x 4 array of colors.
+    def set_cells(self, xs, ys, colors):
+        self.write_cells(xs, ys, colors, True)
+
+    # A method to erase several pixels at once, given arrays of x and y coordinates.
+    def erase_cells(self, xs, ys):
+        self.write_cells(xs, ys, 0, False)
+
+    # A method to write both the colors and painted states of several pixels at once.
+    # Our colors and painted states can either be single values or arrays (with one value per pixel).
+    def write_cells(self, xs, ys, colors, painted):
+        self.write_values(xs, ys, self.encode(colors), painted)
+
+    # A method to write both the stored values and painted states of several pixels at once.
+    # Our values and painted states can either be single values or arrays (with one value per pixel).
+    def write_values(self, xs, ys, colors, painted):
+        xs = np.asarray(xs, dtype=np.intp).ravel()
+        ys = np.asarray(ys, dtype=np.intp).ravel()
+        if xs.size == 0:
+            return
+        colors = np.asarray(colors, dtype=np.uint8)
+        painted = np.asarray(painted, dtype=bool)
+
+        for key, index in self.group_by_tile(xs, ys):
+            local_xs, local_ys = xs[index] % self.TILE_SIZE, ys[index] % self.TILE_SIZE
+            if self.recording:
+                self.record_tile(key)
+
+            tile_painted = painted if painted.ndim == 0 else painted[index]
+            tile = self.tiles.get(key)
+
+            # Erasing pixels from an unallocated tile changes nothing. Otherwise, we'll allocate our tile.
+            if tile is None:
+                if not tile_painted.any():
+                    continue
+                tile = self.tiles[key] = self.new_tile()
+
+            tile[0][local_ys, local_xs] = colors if colors.ndim <= len(self.VALUE_SHAPE) else colors[index]
+            tile[1][local_ys, local_xs] = tile_painted
+            self.dirty_tiles.add(key)
+
+            # Freeing our tile once all of its pixels have been erased.
+            if not tile_painted.all() and not tile[1].any():
+                del self.tiles[key]
+
+    # A method to paint a region of cells (an H x W bool mask over our canvas) with a single color (i.e. a fill).
+    # Rather than writing our cells one by one, we'll write each tile's slice of our region into it.
+    def fill_region(self, region, color):
+        values = self.encode(color)
+        size = self.TILE_SIZE
+        for tile_y in range(self.tiles_y):
+            for tile_x in range(self.tiles_x):
+                block = region[tile_y * size:(tile_y + 1) * size, tile_x * size:(tile_x + 1) * size]
+                if not block.any():
+                    continue
+                key = (tile_x, tile_y)
+                if self.recording:
+                    self.record_tile(key)
+                tile = self.tiles.get(key)
+                if tile is None:
+                    tile = self.tiles[key] = self.new_tile()
+                height, width = block.shape
+
+                # (Most of the tiles of a large fill are covered entirely.)
+                if block.all():
+                    tile[0][:height, :width] = values
+                    tile[1][:height, :width] = True
+                else:
+                    tile[0][:height, :width][block] = values
+                    tile[1][:height, :width][block] = True
+                self.dirty_tiles.add(key)
+
+    # A method to swap several of our tiles with the given (values, mask) tiles (i.e. when undoing/redoing),
+    # where a tile of None frees our tile. Our previous tiles (or None for those that weren't allocated) are returned.
+    def swap_tiles(self, keys, tiles):
+        previous = []
+        for key, tile in zip(keys, tiles):
+            if self.recording:
+                self.record_tile(key)
+            previous.append(self.tiles.pop(key, None))
+            if tile is not None:
+                self.tiles[key] = tile
+            self.dirty_tiles.add(key)
+        return previous
+
+    # A method to find the cells (an H x W bool mask) whose color passes the given test, tile by tile (i.e. the cells a fill matches).
+    # Our test maps an H x W x 4 array of colors to an H x W bool array, and our unpainted cells take on the given default color.
+    def find_cells(self, test, default_color):
+        unpainted = bool(test(np.array(default_color.getRgb(), dtype=np.uint8).reshape(1, 1, 4))[0, 0])
+        cells = np.full((self.height, self.width), unpainted, dtype=bool)
+        values_test = self.get_values_test(test)
+        size = self.TILE_SIZE
+        for (tile_x, tile_y), (values, mask) in self.tiles.items():
+            block = cells[tile_y * size:(tile_y + 1) * size, tile_x * size:(tile_x + 1) * size]
+            height, width = block.shape
+            block[...] = np.where(mask, values_test(values), unpainted)[:height, :width]
+        return cells
+
+    # A method to convert a test of colors (see find_cells) to a test of our stored values.
+    # (Since our values are our colors, this is the test itself.)
+    def get_values_test(self, test):
+        return test
+
+    # A method to replace all of our pixels with the given H x W x 4 array of colors (i.e. from an image).
+    # Every pixel will be considered painted, since each one has been given a color.
+    def load_array(self, rgba):
+        self.load_arrays(rgba, np.ones((self.height, self.width), dtype=bool))
+
+    # A method to replace all of our pixels with the given H x W x 4 rgba and H x W mask arrays (i.e. when recovering our work).
+    def load_arrays(self, rgba, mask):
+        if self.recording:
+            for key in self.tiles:
+                self.record_tile(key)
+        self.dirty_tiles.update(self.tiles.keys())
+        self.tiles = {}
+
+        # Splitting our arrays into tiles, only allocating the tiles that have painted pixels.
+        size = self.TILE_SIZE
+        for tile_y in range(self.tiles_y):
+            for tile_x in range(self.tiles_x):
+                block_mask = mask[tile_y * size:(tile_y + 1) * size, tile_x * size:(tile_x + 1) * size]
+                if not block_mask.any():
+                    continue
+                height, width = block_mask.shape
+                if self.recording:
+                    self.record_tile((tile_x, tile_y))
+                tile = self.new_tile()
+                tile[1][:height, :width] = block_mask
+                tile[0][:height, :width][block_mask] = self.encode(rgba[tile_y * size:(tile_y + 1) * size, tile_x * size:(tile_x + 1) * size][block_mask])
+                self.tiles[(tile_x, tile_y)] = tile
+                self.dirty_tiles.add((tile_x, tile_y))
+
+    # A method to convert our store to a dictionary of the form {(x, y): rgba_tuple} (for saving/uploading).
+    def to_rgba_dict(self):
+        xs, ys, colors = self.get_painted_cells()
+        return {(x, y): tuple(color) for x, y, color in zip(xs.tolist(), ys.tolist(), colors.tolist())}
+
+    # A static method to convert a QImage to an H x W x 4 uint8 array of rgba colors.
+    @staticmethod
+    def qimage_to_array(image):
+        image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+        width, height = image.width(), image.height()
+        data = np.frombuffer(image.constBits().asstring(image.sizeInBytes()), dtype=np.uint8)
+        # Each row may be padded, so we'll use the image's bytes per line to reshape our data.
+        data = data.reshape(height, image.bytesPerLine())[:, :width * 4]
+        return data.reshape(height, width, 4).copy()
@@ -1,15 +1,26 @@
 # Importing basic widgets from PyQt6.
-from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget
+from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QGraphicsItem, QGraphicsObject
 # Importing the necessary modules to work with canvas drawings.
-from PyQt6.QtGui import QPainter, QColor, QPixmap, QRegion
-from PyQt6.QtCore import Qt, QEvent, QRect, QTimer
+from PyQt6.QtGui import QPainter, QColor, QPixmap, QRegion, QImage, QPainterPath
+from PyQt6.QtCore import Qt, QRect, QRectF, QTimer, QLine
 from canvas.color_selection_window import ColorSelectionWindow
 from canvas.canvas_history import CanvasHistory
-from collections import deque
-from tools.smart_filter import daltonize
-
-# Defining a custom canvas widget for Pixelate.
-class PixelateCanvas(QWidget):
+from canvas.pixel_store import PixelStore
+from canvas.canvas_layers import CanvasLayer, CanvasLayers
+from canvas.indexed_pixel_store import CanvasPalette
+from canvas.canvas_displays import CanvasDisplays
+from canvas.canvas_journal import CanvasJournal
+from canvas.fill_engine import get_matching_cells, flood_fill, get_gradient_colors
+from canvas.rasterizer import rasterize, rasterize_spans, rasterize_line, clip_cells
+from canvas.brushes import get_stamp_cells, get_stroke_cells, get_stamp_bounds
+from canvas.repaint_scheduler import RepaintScheduler
+from tools.smart_filter import daltonize, daltonize_colors, simulate_colors
+import math
+import numpy as np
+
+# Defining a custom canvas for Pixelate.
+# Our canvas is a graphics item, which is drawn directly by the scene of our (zoomable) canvas view.
+class PixelateCanvas(QGraphicsObject):
 
     # Our constructor will handle the initialization of the canvas.
     # We provide the color selection window to handle color changes.
@@ -30,9 +41,16 @@ class PixelateCanvas(QWidget):
         self.circle_start = (0, 0)
         self.circle_end   = (0, 0)
 
-        # Our filter state.
+        # The start and end points for our gradient fill.
+        self.gradient_start = (0, 0)
+        self.gradient_end   = (0, 0)
+
+        # Our filter state. Our filter either daltonizes our canvas, or simulates how a viewer with our CVD type sees it
+        # (at a severity from 0 to 100 percent).
         self.is_filter_on = False
         self.filter_type = None
+        self.filter_mode = "daltonize"
+        self.filter_severity = 100
 
         # To store the state of the mouse button.
         self.mouse_button_pressed = False  
@@ -41,23 +59,34 @@ class PixelateCanvas(QWidget):
         self.default_color = QColor(240, 240, 240, 255)
 
         # Storing the color selection window to access the chosen colors.
+        # (When our canvas is indexed, swapping or editing its palette recolors our canvas.)
         self.color_selection_window = color_selection_window
+        self.color_selection_window.palette_changed.connect(self.update_palette)
 
         # Setting up our canvas:
         self.pixel_size  = pixel_size   # This will be the size of each pixel.
         self.grid_width  = grid_width   # The number of pixels wide the canvas will be.
         self.grid_height = grid_height  # The number of pixels tall the canvas will be.
 
-        # We'll also need to store the color of each pixel.
-        # Our dictionary will map the (x, y) coordinates of each pixel to a color.
-        self.pixels = {}
+        # We'll also need to store the color of each pixel, in each of our layers.
+        # Each layer's pixel store keeps its colors in tiles, while still mapping (x, y) coordinates to colors like a dictionary.
+        # Our pixels are always the pixel store of our active layer (the layer we draw on).
+        self.layers = CanvasLayers(self.grid_width, self.grid_height)
+        self.pixels = self.layers.get_active_layer().pixels
 
         # We'll have a preview pixel to show the pixel we're about to draw. (The (x, y) coordinates of the pixel.)
         self.preview_pixel = None
 
-        # We'll need to store copies of our pixel colors to implement undo/redo functionality.
+        # The rects of the shape we're currently previewing (and the shape, start, end, and pixel size they were computed for).
+        self.preview_key   = None
+        self.preview_rects = []
+
+        # We'll need to store the changes made to our pixels to implement undo/redo functionality.
         self.canvas_history = CanvasHistory()
 
+        # Our (optional) journal, which writes each committed change to disk so our work can be recovered after a crash.
+        self.journal = None
+
         # Our various drawing modes will be stored as boolean flags.
         self.fill_mode       = False
         self.eyedropper_mode = False
@@ -67,23 +96,45 @@ class PixelateCanvas(QWidget):
         self.square_mode     = False
         self.circle_mode     = False
 
-        # Finally, we'll set the size of the canvas.
-        self.setFixedSize(self.pixel_size * self.grid_width, self.pixel_size * self.grid_height)
+        # Our fill options: how far a color may be from our target color to be filled (0 for an exact match),
+        # how that distance is measured ("rgba" or "lab"), and whether we fill connected cells or replace a color everywhere.
+        self.fill_tolerance  = 0
+        self.fill_metric     = "rgba"
+        self.fill_contiguous = True
+
+        # Our fill can also be a gradient (None, "linear", or "radial") from our primary to our secondary color.
+        self.fill_gradient   = None
 
-        # To work with mouse hover events, we'll set the following attribute.
-        self.setAttribute(Qt.WidgetAttribute.WA_Hover, True)
+        # Our pencil and eraser brush: its size (1 - 32 cells) and shape ("square", "round", or "dithered").
+        self.brush_size      = 1
+        self.brush_shape     = "square"
 
-        # Our grid will be initialized as a QPixmap object (our base layer).
-        self.grid = self.init_grid()
+        # Whether our square and circle tools draw filled shapes (rather than outlines).
+        self.square_filled   = False
+        self.circle_filled   = False
 
-        # Our canvas buffer will store the current state of our canvas (initially set to the grid).
-        self.canvas_buffer = self.grid.copy()
+        # To work with mouse hover events, we'll accept them.
+        self.setAcceptHoverEvents(True)
 
-        # When in fill mode, we'll need to keep track of visited pixels to avoid redundant operations.
-        self.visited = set()
+        # We'll only paint the region of our canvas that's exposed (our painting option will tell us which region that is).
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
 
-        # To store our generated image (from the AI assistant).
-        self.generated_image = None
+        # Our item will be cached in device coordinates: panning simply moves our cached image, and a repaint only
+        # re-renders the region of our cache that changed.
+        self.setCacheMode(QGraphicsItem.CacheMode.DeviceCoordinateCache)
+
+        # Our grid lines will be drawn as a lightweight overlay, using a more transparent black.
+        # Once our cells are smaller than the following size on screen (in pixels), our grid is hidden.
+        self.grid_color = QColor(0, 0, 0, 50)
+        self.grid_min_cell_size = 4
+
+        # Our canvas buffer will store the current state of our canvas at one pixel per cell (initially our background color).
+        # It will be scaled up by our pixel size whenever we paint.
+        # When we're zoomed out (i.e. our cells are smaller than a pixel on screen), we'll draw a downsampled copy of our buffer instead (our mipmaps).
+        # We keep a separate buffer (and mipmaps) per color filter (see CanvasDisplays), and our canvas buffer is the one we're currently showing.
+        self.canvas_displays = CanvasDisplays(self.grid_width, self.grid_height, self.default_color)
+        self.canvas_buffer = self.canvas_displays.get_active_display().buffer
+        self.canvas_mipmaps = self.canvas_displays.get_active_display().mipmaps
 
         # To handle our color approximation delay, we'll use a QTimer object.
         # The idea is that we'll only update the color approximation label after a certain delay.
@@ -95,68 +146,79 @@ class PixelateCanvas(QWidget):
         # To store the color we're approximating.
         self.color_to_approx = None
 
-    # A method to set our generated image.
-    def set_generated_image(self, image):
+        # Rather than repainting our canvas every time something changes, we request our repaints from a scheduler,
+        # which repaints the region they cover at most once per frame (60 fps by default).
+        self.repaint_scheduler = RepaintScheduler(self, before_flush=self.flush_frame)
 
-        # Updating our pixels dictionary with the generated image's colors.
-        for x in range(self.grid_width):
-            for y in range(self.grid_height):
-                color = image.pixelColor(x, y)
-                self.pixels[(x, y)] = color
+        # While a stroke is in progress (i.e. from pressing to releasing our mouse), the cells we draw are written straight
+        # into our pixel store, and only the region of cells they cover (our dirty cells) is re-rendered, once per frame.
+        self.stroke_active = False
+        self.dirty_cells = QRect()
 
-        # Scaling our image up to fit the canvas (each pixel of our generated image will be a pixel square on our canvas).
-        image = image.scaled(self.pixel_size * self.grid_width, self.pixel_size * self.grid_height, Qt.AspectRatioMode.IgnoreAspectRatio)
+        # While stroking with our brush, the cells our mouse moves over are queued (along with their colors, or None when erasing)
+        # and painted once per frame, connected to the last cell we've painted so that fast strokes have no gaps.
+        self.stroke_points = []
+        self.last_stroke_pixel = None
 
-        # Storing the scaled image as a QPixmap object.
-        image = QPixmap.fromImage(image)
-        self.generated_image = image
+    # A method to set our generated image.
+    def set_generated_image(self, image):
 
-        # Repainting our canvas to display the generated image.
-        self.update()
+        # Updating our pixel store with the generated image's colors (each pixel of our image is a pixel square on our canvas).
+        self.pixels.load_array(PixelStore.qimage_to_array(image))
 
-    # This method will create a grid for our canvas. It will be implemented as a QPixmap object.
-    # We'll initialize the grid with a light gray background and draw grid lines on top of it.
-    def init_grid(self):
+        # Redrawing our canvas buffer to display the generated image.
+        self.refresh_buffer()
 
-        # Creating a QPixmap object to store our grid. (This will serve as our canvas's base layer.)
-        grid = QPixmap(self.pixel_size * self.grid_width, self.pixel_size * self.grid_height)
+    # This method will draw the grid lines of the given cells (a QRect in cell coordinates) on top of our canvas.
+    # Rather than storing a full-size grid, we'll only draw the lines we need whenever we paint.
+    # (We can provide a different pixel size, i.e. when rendering a smaller image of a large canvas.)
+    def draw_grid(self, painter, cells, pixel_size=None):
+        pixel_size = pixel_size or self.pixel_size
 
-        # Drawing grid lines on our QPixmap object.
-        painter = QPainter(grid)
-        painter.setPen(Qt.PenStyle.SolidLine)
         # Setting our pen color to a more transparent black.
-        painter.setPen(QColor(0, 0, 0, 50))
+        painter.setPen(self.grid_color)
 
-        # First, we'll fill our grid with a light, transparent gray background.
-        grid.fill(self.default_color)
+        # The pixel boundaries of the cells we're drawing.
+        left, top = cells.x() * pixel_size, cells.y() * pixel_size
+        right, bottom = (cells.x() + cells.width()) * pixel_size, (cells.y() + cells.height()) * pixel_size
 
-        # Drawing vertical lines.
-        for x in range(self.grid_width + 1):
-            # Draws a line from (x1, y1) to (x2, y2).
-            painter.drawLine(x * self.pixel_size, 0, x * self.pixel_size, self.pixel_size * self.grid_height)
+        # Drawing vertical lines, then horizontal lines (from (x1, y1) to (x2, y2)).
+        lines = [QLine(x * pixel_size, top, x * pixel_size, bottom) for x in range(cells.x(), cells.x() + cells.width() + 1)]
+        lines += [QLine(left, y * pixel_size, right, y * pixel_size) for y in range(cells.y(), cells.y() + cells.height() + 1)]
+        painter.drawLines(lines)
 
-        # Drawing horizontal lines.
-        for y in range(self.grid_height + 1):
-            # Draws a line from (x1, y1) to (x2, y2).
-            painter.drawLine(0, y * self.pixel_size, self.pixel_size * self.grid_width, y * self.pixel_size)
+    # A method to convert a QRect in item coordinates to the QRect of cells it covers.
+    def cells_in_rect(self, rect):
+        x0, y0 = rect.left() // self.pixel_size, rect.top() // self.pixel_size
+        x1, y1 = rect.right() // self.pixel_size, rect.bottom() // self.pixel_size
+        return QRect(x0, y0, x1 - x0 + 1, y1 - y0 + 1).intersected(QRect(0, 0, self.grid_width, self.grid_height))
 
-        painter.end()
-        return grid
+    # A method to convert a QRect of cells to its QRect in item coordinates.
+    def rect_of_cells(self, cells):
+        return QRect(cells.x() * self.pixel_size, cells.y() * self.pixel_size, cells.width() * self.pixel_size, cells.height() * self.pixel_size)
+
+    # Our canvas covers a pixel square for each of its cells (in item coordinates).
+    def boundingRect(self):
+        return QRectF(0, 0, self.pixel_size * self.grid_width, self.pixel_size * self.grid_height)
 
-    # Overriding the event method to handle hover events as well.
-    def event(self, event):
+    # Our canvas buffer is always opaque, so our canvas hides whatever is behind it (our scene can skip drawing it).
+    def opaqueArea(self):
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
 
-        # If we're hovering over our canvas, we'll preview the pixel we're about to draw.
-        if event.type() == QEvent.Type.HoverMove:
+    # A method to get the (x, y) cell under the given position (a QPointF in item coordinates).
+    def get_pixel_at(self, position):
+        return (int(position.x() // self.pixel_size), int(position.y() // self.pixel_size))
 
-            # Getting the x and y coordinates of our mouse and converting them to pixel coordinates.
-            x, y = event.position().x(), event.position().y()
-            x = int(x / self.pixel_size)
-            y = int(y / self.pixel_size)
+    # If we're hovering over our canvas, we'll preview the pixel we're about to draw.
+    def hoverMoveEvent(self, event):
 
-            # To avoid unnecessary updates, we'll only update the preview pixel if it has changed.
-            if self.preview_pixel == (x, y):
-                return super().event(event)
+        # Getting the x and y coordinates of our mouse and converting them to pixel coordinates.
+        x, y = self.get_pixel_at(event.pos())
+
+        # To avoid unnecessary updates, we'll only update the preview pixel if it has changed.
+        if self.preview_pixel != (x, y):
 
             # To boost performance, we'll only update the pixels that need updating: the previous preview pixel and the current one.
             previous_preview = self.preview_pixel
@@ -164,11 +226,10 @@ class PixelateCanvas(QWidget):
 
             # If the previous preview pixel exists, we'll update it on our canvas.
             if previous_preview:
-                self.update(QRect(previous_preview[0] * self.pixel_size, previous_preview[1] * self.pixel_size, 
-                                  self.pixel_size, self.pixel_size))
+                self.request_repaint(self.rect_of_cells(self.get_preview_cells(previous_preview)))
                 
             # Now, we'll update the current preview pixel on our canvas.
-            self.update(QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size))
+            self.request_repaint(self.rect_of_cells(self.get_preview_cells(self.preview_pixel)))
 
             # Storing the color of the pixel we're approximating.
             self.color_to_approx = self.pixels.get((x, y), self.default_color)
@@ -176,26 +237,22 @@ class PixelateCanvas(QWidget):
             # Starting the color approximation timer.
             self.color_approx_timer.start()
 
-        # Upon leaving the canvas, we'll clear the preview pixel and update our canvas.
-        elif event.type() == QEvent.Type.HoverLeave:
-            
-            # Before clearing the preview pixel, we'll update it on our canvas.
-            if self.preview_pixel:
-                self.update(QRect(self.preview_pixel[0] * self.pixel_size, self.preview_pixel[1] * self.pixel_size, 
-                                  self.pixel_size, self.pixel_size))
-            
-            # Now, we'll clear the preview pixel.
-            self.preview_pixel = None
+    # Upon leaving the canvas, we'll clear the preview pixel and update our canvas.
+    def hoverLeaveEvent(self, event):
 
-            # We'll also clear the color to approximate.
-            self.color_to_approx = None
+        # Before clearing the preview pixel, we'll update it on our canvas.
+        if self.preview_pixel:
+            self.request_repaint(self.rect_of_cells(self.get_preview_cells(self.preview_pixel)))
 
-            # Updating the color approximation label immediately.
-            self.color_selection_window.set_color_approx_label("None")
+        # Now, we'll clear the preview pixel.
+        self.preview_pixel = None
+
+        # We'll also clear the color to approximate.
+        self.color_to_approx = None
+
+        # Updating the color approximation label immediately.
+        self.color_selection_window.set_color_approx_label("None")
 
-        # Then, we'll handle the event as usual.
-        return super().event(event)
-    
     # A method to update the color approximation label.
     def update_color_approx_label(self):
 
@@ -204,37 +261,128 @@ class PixelateCanvas(QWidget):
         else:
             self.color_selection_window.set_color_approx_label("None")
 
+    # A method to show our unfiltered canvas buffer again (i.e. after turning off our filter).
     def restore_buffer(self):
-        for (x, y), color in self.pixels.items():
-            current_pixel = QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size)
-            buffer_painter = QPainter(self.canvas_buffer)
-            buffer_painter.fillRect(current_pixel, color)
-            buffer_painter.end()
-
-        self.update()
-
-    # Overriding the paintEvent method, which handles drawing on the canvas.
-    def paintEvent(self, event):
-
-        painter = QPainter(self)
+        self.set_filter(None)
+
+    # A method to set the color filter our canvas is shown with (a CVD type, or None to turn our filter off),
+    # either daltonizing our canvas or simulating our CVD type ("daltonize" or "simulate").
+    # Our pixels are never filtered themselves; we'll swap to the canvas buffer of our filter, only re-rendering the tiles of it
+    # that have changed since it was last shown.
+    def set_filter(self, cvd_type, mode="daltonize"):
+        self.is_filter_on = cvd_type is not None
+        self.filter_type = cvd_type
+        self.filter_mode = mode
+
+        self.layers.update_composite()
+        display = self.canvas_displays.set_active_display(self.get_filter_key(cvd_type, mode), self.layers.composite, self.get_color_filter())
+        self.canvas_buffer, self.canvas_mipmaps = display.buffer, display.mipmaps
+        self.request_repaint()
+
+    # A method to get the key of the canvas buffer of a filter (see CanvasDisplays).
+    # Our simulations share one buffer per CVD type, whatever their severity.
+    def get_filter_key(self, cvd_type, mode="daltonize"):
+        if cvd_type is None or mode == "daltonize":
+            return cvd_type
+        return (mode, cvd_type)
+
+    # A method to set the severity of our simulations (from 0 to 100 percent).
+    # The buffers of our simulations are marked as stale with their new matrices. Since we'll repaint our canvas, only the tiles
+    # that are visible are re-rendered right away (see update_display), which keeps dragging our slider smooth on large canvases.
+    def set_filter_severity(self, severity):
+        severity = max(0, min(int(severity), 100))
+        if severity == self.filter_severity:
+            return
+        self.filter_severity = severity
+        for cvd_type in ("Protanopia", "Deuteranopia", "Tritanopia"):
+            self.canvas_displays.set_color_filter(self.get_filter_key(cvd_type, "simulate"), self.create_color_filter(cvd_type, "simulate"))
+
+        # Repainting our canvas (and, in turn, any comparison panes that simulate our CVD types).
+        self.request_repaint()
+
+    # A method to re-render the stale tiles of our active display that cover a region of cells (or our whole canvas) before it's drawn.
+    def update_display(self, cells=None):
+        self.canvas_displays.get_active_display().update(self.layers.composite, cells)
+
+    # A method to re-render our canvas buffer from the composite of our layers, respecting our filter state.
+    # We can provide a QRect of cells to re-render (otherwise, we'll re-render the entire canvas).
+    # (The buffers of our other filters only mark those cells as stale, see CanvasDisplays.)
+    def refresh_buffer(self, cells=None):
+
+        # Bringing our composite up to date first (only the tiles written to since our last refresh are re-blended).
+        self.layers.update_composite()
+        self.canvas_displays.render(self.layers.composite, cells)
+
+        # Repainting the cells we've re-rendered.
+        self.request_repaint(None if cells is None else self.rect_of_cells(cells))
+
+    # A method to request a repaint of the given rect (a QRect in item coordinates), or of our entire canvas.
+    # Our requests are coalesced, and repainted at most once per frame.
+    def request_repaint(self, rect=None):
+        self.repaint_scheduler.request(rect)
+
+    # A method to set the frame rate our repaints are paced at (in frames per second).
+    def set_frame_rate(self, fps):
+        self.repaint_scheduler.set_fps(fps)
+
+    # A method to get the statistics of our repaints (how many were requested, and how many frames they were coalesced into).
+    def get_repaint_statistics(self):
+        return self.repaint_scheduler.get_statistics()
+
+    # A method to get the color filter our canvas buffer should apply (or None if our filter is off).
+    def get_color_filter(self):
+        if not self.is_filter_on:
+            return None
+        return self.create_color_filter(self.filter_type, self.filter_mode)
+
+    # A method to create the color filter of a CVD type, which maps an N x 4 array of colors to their filtered colors.
+    def create_color_filter(self, cvd_type, mode="daltonize"):
+        if mode == "simulate":
+            severity = self.filter_severity
+            return lambda colors: simulate_colors(colors, cvd_type, severity)
+        return lambda colors: self.daltonize_colors(colors, cvd_type)
+
+    # A method to filter a single color (QColor object) the way our canvas is filtered (i.e. for our previews).
+    def filter_color(self, color):
+        if self.filter_mode == "simulate":
+            return QColor(*simulate_colors(np.array(color.getRgb()[:3]), self.filter_type, self.filter_severity).tolist())
+        return daltonize(color, self.filter_type)
+
+    # Overriding the paint method, which handles drawing on the canvas (with the painter our scene provides).
+    def paint(self, painter, option, widget=None):
+
+        # We'll only draw the cells Qt asked us to repaint, scaling our canvas buffer up with nearest-neighbor scaling.
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+
+        # (Once our whole cache is invalidated, our exposed rect is our whole item, though only the part of it within our cache is drawn.)
+        exposed = option.exposedRect.intersected(painter.worldTransform().inverted()[0].mapRect(QRectF(0, 0, painter.device().width(), painter.device().height())))
+        cells = self.cells_in_rect(exposed.toAlignedRect())
+        if cells.isEmpty():
+            return
+        self.update_display(cells)
 
-        # We'll draw our pre-rendered canvas buffer.
-        painter.drawPixmap(0, 0, self.canvas_buffer)
+        # The size of our cells on screen (in pixels), given our view's zoom.
+        cell_size = self.pixel_size * painter.worldTransform().m11()
 
-        # If we have a generated image (QPixmap object), we'll set it to our canvas buffer.
-        if self.generated_image:
+        # Since our buffer is opaque, we'll copy it straight over whatever is beneath it (rather than blending with it).
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
 
-            # Setting the canvas buffer to the generated image.
-            self.canvas_buffer = self.generated_image
+        # When zoomed out, we'll draw the level of our mip chain that matches our zoom.
+        # (Either way, we only blit the part of our buffer that covers our exposed cells.)
+        level = self.canvas_mipmaps.choose_level(cell_size)
+        if level > 0:
+            self.canvas_mipmaps.draw(painter, cells, self.pixel_size, level)
+        else:
+            self.canvas_buffer.draw(painter, cells, self.pixel_size)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
 
-            # Clearing the generated image afterwards.
-            self.generated_image = None
+        # Our grid lines are drawn on top of our canvas buffer (unless our cells are too small to see them).
+        if cell_size >= self.grid_min_cell_size:
+            self.draw_grid(painter, cells)
 
         # Displaying our previews.
         self.preview(painter)
 
-        painter.end()
-
     # The following method will draw a pixel @ the given (x, y) coordinates with the given color (QColor object).
     def draw_pixel(self, pixel, color):
         x, y = pixel
@@ -249,14 +397,8 @@ class PixelateCanvas(QWidget):
             # Updating the color of the pixel at (x, y).
             self.pixels[pixel] = color
 
-            # Updating the canvas buffer to display the pixel.
-            current_pixel = QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size)
-            buffer_painter = QPainter(self.canvas_buffer)
-            buffer_painter.fillRect(current_pixel, color if not self.is_filter_on else daltonize(color, self.filter_type))
-            buffer_painter.end()
-            
-            # Repainting the pixel we've drawn on our canvas.
-            self.update(current_pixel)
+            # Marking the pixel as dirty, so that our canvas buffer displays it (once per frame while stroking).
+            self.mark_dirty(QRect(x, y, 1, 1))
     
     # This method handles drawing the preview pixel on our canvas.
     def draw_preview_pixel(self, painter, preview_color):
@@ -269,26 +411,49 @@ class PixelateCanvas(QWidget):
         if not painter.isActive():
             return
 
+        # When painting with a larger brush, we'll preview the cells of its stamp.
+        if self.uses_brush() and (self.brush_size > 1 or self.brush_shape == "dithered"):
+            xs, ys = get_stamp_cells(self.brush_shape, self.brush_size, self.preview_pixel, self.grid_width, self.grid_height)
+            size = self.pixel_size
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(preview_color)
+            painter.drawRects([QRect(x * size, y * size, size, size) for x, y in zip(xs.tolist(), ys.tolist())])
+            return
+
         # Drawing the preview pixel on our canvas via its coordinates.
         x, y = self.preview_pixel
         painter.fillRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size, preview_color)
 
-    # A function to convert our pixels dictionary to a dictionary of the form {(x, y): rgba_tuple}.
-    def convert_to_rgba_format(self):
-        
-        # Creating an empty dictionary that we'll populate with RGBA tuples.
-        rgba_pixels = {}
+    # A method to check whether we're painting with our brush (i.e. using our pencil or eraser tools).
+    def uses_brush(self):
+        return not (self.fill_mode or self.line_mode or self.square_mode or self.circle_mode or self.eyedropper_mode or self.is_draggable)
 
-        # Iterating over the pixels dictionary.
-        for (x, y), color in self.pixels.items():
+    # A method to get the cells (a QRect) our preview covers when hovering over the given pixel.
+    def get_preview_cells(self, pixel):
+        if self.uses_brush():
+            return QRect(*get_stamp_bounds(self.brush_size, pixel))
+        return QRect(pixel[0], pixel[1], 1, 1)
+
+    # A method to paint a stamp of our brush (centered on the given pixel) with the given color, in a single batch.
+    def draw_stamp(self, pixel, color):
+
+        # If our canvas is in any of the following modes, we'll return since we're not drawing.
+        if self.is_draggable or self.eyedropper_mode:
+            return
 
-            # Converting the QColor object to an RGBA tuple.
-            rgba_tuple = (color.red(), color.green(), color.blue(), color.alpha())
+        xs, ys = get_stamp_cells(self.brush_shape, self.brush_size, pixel, self.grid_width, self.grid_height)
+        self.write_cells(xs, ys, color.getRgb())
 
-            # Adding the RGBA tuple to our dictionary.
-            rgba_pixels[(x, y)] = rgba_tuple
+    # A method to erase a stamp of our brush (centered on the given pixel), in a single batch.
+    def erase_stamp(self, pixel):
+        xs, ys = get_stamp_cells(self.brush_shape, self.brush_size, pixel, self.grid_width, self.grid_height)
+        self.erase_cells(xs, ys)
 
-        return rgba_pixels
+    # A function to convert our pixel store to a dictionary of the form {(x, y): rgba_tuple}.
+    def convert_to_rgba_format(self):
+        
+        # Our pixel store reads its painted pixels straight out of its arrays.
+        return self.pixels.to_rgba_dict()
     
     # A function to convert our pixels dictionary to a dictionary of the form {(x, y): QColor}.
     def convert_to_qcolor_format(self, rgba_pixels):
@@ -314,14 +479,9 @@ class PixelateCanvas(QWidget):
         # Removing the pixel from our pixels dictionary.
         del self.pixels[pixel]
 
-        # Storing the current pixel.
+        # Marking the pixel as dirty, so that it's repainted with the default color.
         x, y = pixel
-        current_pixel = QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size)
-
-        # Repainting the pixel with the default color.
-        buffer_painter = QPainter(self.canvas_buffer)
-        buffer_painter.fillRect(current_pixel, self.default_color)
-        buffer_painter.end()
+        self.mark_dirty(QRect(x, y, 1, 1))
 
     # Overriding the mousePressEvent method to draw pixels on our canvas.
     def mousePressEvent(self, event):
@@ -330,17 +490,14 @@ class PixelateCanvas(QWidget):
         if event.button() == Qt.MouseButton.MiddleButton:
             return
 
-        # Before drawing, we'll save the current state of our canvas in the canvas history object.
-        self.canvas_history.save_state_and_update(self.pixels, self.canvas_buffer)
+        # Before drawing, we'll start a stroke, which records the changes we make (until our mouse is released).
+        self.begin_stroke()
 
         #If Mouse Button is clicked, set true
         self.mouse_button_pressed = True
 
         # Getting the x and y coordinates of our mouse click and converting them to pixel coordinates.
-        x, y = event.pos().x(), event.pos().y()
-        x = x // self.pixel_size
-        y = y // self.pixel_size
-        pixel = (x, y)
+        pixel = self.get_pixel_at(event.pos())
 
         if self.line_mode:
             # Store the starting point & end point.
@@ -387,10 +544,16 @@ class PixelateCanvas(QWidget):
             # Otherwise, we'll get the secondary color from the color selection window.
             color = self.color_selection_window.get_secondary_color()
 
-        # If we're in erase mode, we'll "delete" the pixel at the given coordinates.
+        # If we're in erase mode, we'll "delete" the pixels under our brush.
         if self.erase_mode:
-            if pixel in self.pixels:
-                self.erase_pixel(pixel)
+            self.erase_stamp(pixel)
+            self.last_stroke_pixel = pixel
+            return
+
+        # If we're filling with a gradient, we'll store its starting point (it's drawn once our mouse is released).
+        if self.fill_mode and self.fill_gradient:
+            self.gradient_start = pixel
+            self.gradient_end = pixel
             return
 
         # If we're in fill mode, we'll use the fill method to fill in areas.
@@ -398,24 +561,302 @@ class PixelateCanvas(QWidget):
             target_color = self.pixels.get(pixel, self.default_color)
             replacement_color = color
             self.fill(pixel, target_color, replacement_color)
-            # Once we've filled in the area, we'll clear the visited set.
-            self.visited.clear()
             return
 
-        # Drawing the pixel at the given coordinates with the selected color.
-        self.draw_pixel(pixel, color)
+        # Drawing the pixels under our brush with the selected color.
+        self.draw_stamp(pixel, color)
+        self.last_stroke_pixel = pixel
+
+    # A method to start recording the changes made to our canvas as a single (undoable) operation.
+    def begin_operation(self):
+
+        # If an operation is still being recorded, we'll commit it first.
+        self.commit_operation()
+        self.pixels.begin_recording()
+
+    # A method to stop recording our operation and save its changes in our canvas history (and our journal).
+    def commit_operation(self):
+        delta = self.pixels.end_recording()
+        self.canvas_history.push(delta)
+        if self.journal is not None:
+            self.journal.append(delta)
+
+    # A method to undo the last operation made to our canvas.
+    def undo(self):
+
+        # Committing any operation that's still being recorded, so that it can be undone as well.
+        self.commit_operation()
+
+        # Reverting the pixels of our last change, on the layer it was made to (our journal records the colors we've reverted to).
+        delta = self.canvas_history.undo()
+        if delta is None:
+            return
+        if self.journal is not None:
+            self.journal.append(delta)
+
+        # Redrawing only the region of our canvas that changed.
+        self.refresh_buffer(delta.bounds())
+
+    # A method to redo the last operation we've undone.
+    def redo(self):
+
+        # Committing any operation that's still being recorded (this will also clear our redo stack).
+        self.commit_operation()
+
+        # Reapplying the pixels of our last undone change (on the layer it was made to).
+        delta = self.canvas_history.redo()
+        if delta is None:
+            return
+        if self.journal is not None:
+            self.journal.append(delta)
+
+        # Redrawing only the region of our canvas that changed.
+        self.refresh_buffer(delta.bounds())
+
+    # A method to set the journal our committed operations are written to.
+    def set_journal(self, journal):
+        self.journal = journal
+
+    # A method to load our recovered (i.e. replayed from a journal) layers, given as (name, visible, opacity, rgba, mask) tuples.
+    def load_recovered_layers(self, layers):
+        recovered_layers = []
+        for name, visible, opacity, rgba, mask in layers:
+            layer = CanvasLayer(name, self.layers.create_store(), visible, opacity)
+            layer.pixels.load_arrays(rgba, mask)
+            recovered_layers.append(layer)
+        self.replace_layers(recovered_layers)
+
+    # A method to get our layers.
+    def get_layers(self):
+        return self.layers
+
+    # A method to make the layer at the given index our active layer (the layer we draw on).
+    def set_active_layer(self, index):
+        self.commit_operation()
+        self.layers.set_active_index(index)
+        self.pixels = self.layers.get_active_layer().pixels
+
+    # A method to add a new (empty) layer above our active layer, which becomes our active layer.
+    def add_layer(self, name=None):
+        self.commit_operation()
+        layer = self.layers.add_layer(name)
+        self.pixels = layer.pixels
+        self.update_layers(CanvasJournal.LAYER_ADDED, self.layers.get_active_index())
+        return layer
+
+    # A method to remove the layer at the given index (along with its changes in our canvas history).
+    def remove_layer(self, index):
+        if self.layers.get_layer_count() == 1:
+            return
+        self.commit_operation()
+        layer = self.layers.remove_layer(index)
+        self.canvas_history.remove_changes(layer.pixels)
+        self.pixels = self.layers.get_active_layer().pixels
+        self.update_layers(CanvasJournal.LAYER_REMOVED, index)
+
+    # A method to move the layer at the given index to a new index (i.e. one step up or down).
+    def move_layer(self, index, new_index):
+        self.commit_operation()
+        new_index = max(0, min(new_index, self.layers.get_layer_count() - 1))
+        if new_index == index:
+            return
+        self.layers.move_layer(index, new_index)
+        self.update_layers(CanvasJournal.LAYER_MOVED, index, new_index)
+
+    # A method to show or hide the layer at the given index.
+    def set_layer_visible(self, index, visible):
+        self.layers.set_visible(index, visible)
+        self.update_layers(CanvasJournal.LAYER_PROPERTIES, index)
+
+    # A method to set the opacity of the layer at the given index (from 0 to 100 percent).
+    def set_layer_opacity(self, index, opacity):
+        self.layers.set_opacity(index, opacity)
+        self.update_layers(CanvasJournal.LAYER_PROPERTIES, index)
+
+    # A method to replace our layers (i.e. when opening a project or recovering our work), starting a fresh canvas history.
+    def replace_layers(self, layers, active_index=0):
+        self.commit_operation()
+        self.layers.set_layers(layers, active_index)
+        self.pixels = self.layers.get_active_layer().pixels
+        self.canvas_history = CanvasHistory()
+        self.checkpoint_layers()
+
+    # A method to add the given layers on top of our own (i.e. when importing a project with layers).
+    def import_layers(self, layers):
+        self.commit_operation()
+        self.layers.append_layers(layers)
+        self.pixels = self.layers.get_active_layer().pixels
+        self.checkpoint_layers()
+
+    # A method to re-render our canvas once our layers have changed, only re-blending the tiles they cover.
+    # We'll journal the layer operation that changed them (see CanvasJournal), given its index (and new index, when moving a layer).
+    def update_layers(self, operation, index, new_index=0):
+        self.refresh_dirty_tiles()
+        if self.journal is not None:
+            self.journal.append_layer_operation(operation, index, new_index)
+
+    # A method to re-render our canvas once the pixels of our layers have been replaced (i.e. when opening or importing a project),
+    # checkpointing our journal (which is then rewritten from our new layers).
+    def checkpoint_layers(self):
+        self.refresh_dirty_tiles()
+        if self.journal is not None:
+            self.journal.checkpoint()
+
+    # A method to check whether our canvas is indexed (i.e. its pixels store indices into a palette, rather than colors).
+    def is_indexed(self):
+        return self.layers.get_palette() is not None
+
+    # A method to switch our canvas to (or from) indexed mode, converting the pixels of each of our layers.
+    # Our palette starts with the given (r, g, b, a) colors (by default, our color selection window's active palette).
+    # Since our layers' pixels are replaced, we'll start a fresh canvas history.
+    def set_indexed_mode(self, indexed, colors=None):
+        self.commit_operation()
+        if indexed:
+            palette = CanvasPalette(self.color_selection_window.get_palette_colors() if colors is None else colors)
+        else:
+            palette = None
+        self.layers.set_palette(palette)
+        self.pixels = self.layers.get_active_layer().pixels
+        self.canvas_history = CanvasHistory()
+        self.checkpoint_layers()
+
+    # A method to update our palette to match our color selection window's active palette (i.e. once it's been swapped or edited).
+    # Only our palette's lookup table changes; our composite is then recomputed from our layers' indices
+    # (and our journal only records our new palette).
+    def update_palette(self):
+        palette = self.layers.get_palette()
+        if palette is None:
+            return
+        if palette.set_colors(0, self.color_selection_window.get_palette_colors()):
+            self.layers.invalidate_all()
+            self.refresh_dirty_tiles()
+            if self.journal is not None:
+                self.journal.append_palette()
+
+    # A method to get our layers as a dictionary (for saving), of the form:
+    # {"version": 2, "layers": [{"name": str, "visible": bool, "opacity": int, "tiles": str}, ...], "active": int}
+    # Each layer's tiles are encoded as a string (see CanvasLayers.encode_tiles), rather than a {(x, y): rgba_tuple} dictionary
+    # (as our first version saved them). Indexed canvases also save their palette, as "palette": [rgba_tuple, ...], and their tiles as indices.
+    def get_layers_data(self):
+        layers = []
+        for index in range(self.layers.get_layer_count()):
+            layer = self.layers.get_layer(index)
+            layers.append({"name": layer.name, "visible": layer.visible, "opacity": layer.opacity, "tiles": CanvasLayers.encode_tiles(layer.pixels)})
+        data = {"version": 2, "layers": layers, "active": self.layers.get_active_index()}
+        if self.is_indexed():
+            data["palette"] = self.layers.get_palette().get_colors()
+        return data
+
+    # A method to convert the layers of a dictionary (see get_layers_data) to a list of our layers.
+    def convert_to_layers(self, data):
+        layers = []
+        for layer_data in data["layers"]:
+            layer = CanvasLayer(layer_data["name"], self.layers.create_store(), layer_data["visible"], layer_data["opacity"])
+            self.layers.load_pixels(layer.pixels, layer_data, data.get("palette"))
+            layers.append(layer)
+        return layers
 
     def mouseReleaseEvent(self, event):
 
+        # Our shape preview (if any) disappears once our mouse is released, so we'll repaint the region it covered.
+        self.request_repaint(self.get_preview_bounds())
         self.mouse_button_pressed = False
 
-        if self.line_mode:
+        # Once we've drawn our shapes (if any), our stroke is complete, so we'll commit it to our canvas history.
+        self.draw_shapes(event)
+        self.end_stroke()
+
+    # A method to start a stroke: a single operation during which our dirty cells are only re-rendered once per frame.
+    def begin_stroke(self):
+        self.begin_operation()
+        self.stroke_active = True
+        self.stroke_points = []
+        self.last_stroke_pixel = None
+
+    # A method to end our stroke, painting any remaining queued points and dirty cells, and committing our operation.
+    def end_stroke(self):
+        self.flush_frame()
+        self.stroke_active = False
+        self.last_stroke_pixel = None
+        self.commit_operation()
+
+    # A method to queue a point of our brush stroke (painted with the given color, or erased if our color is None).
+    def add_stroke_point(self, pixel, color):
+        if self.last_stroke_pixel is None:
+            self.last_stroke_pixel = pixel
+
+        # Skipping repeated points (i.e. several events over the same cell).
+        last_point = self.stroke_points[-1][0] if self.stroke_points else self.last_stroke_pixel
+        if pixel == last_point:
+            return
+        self.stroke_points.append((pixel, None if color is None else color.getRgb()))
 
-            x, y = event.pos().x(), event.pos().y()
-            x = x // self.pixel_size
-            y = y // self.pixel_size
+        if not self.stroke_active:
+            self.flush_stroke_points()
+        else:
+            self.repaint_scheduler.schedule()
+
+    # A method to paint our queued stroke points: each point is connected to the previous one by a line of stamps,
+    # and each run of points with the same color is written to our pixel store in a single batch.
+    def flush_stroke_points(self):
+        points, self.stroke_points = self.stroke_points, []
+        start = 0
+        while start < len(points):
+            color = points[start][1]
+            end = start
+            while end + 1 < len(points) and points[end + 1][1] == color:
+                end += 1
+
+            # The path of our run: the line segments from our last painted cell through each of its points.
+            segments = []
+            for pixel, _ in points[start:end + 1]:
+                segments.append(rasterize_line(self.last_stroke_pixel, pixel))
+                self.last_stroke_pixel = pixel
+            path_xs = np.concatenate([segment[0] for segment in segments])
+            path_ys = np.concatenate([segment[1] for segment in segments])
+
+            xs, ys = get_stroke_cells(self.brush_shape, self.brush_size, path_xs, path_ys, self.grid_width, self.grid_height)
+            if color is None:
+                self.erase_cells(xs, ys)
+            else:
+                self.write_cells(xs, ys, color)
+            start = end + 1
+
+    # A method to handle a frame of our stroke: painting our queued points, then re-rendering our dirty cells.
+    def flush_frame(self):
+        self.flush_stroke_points()
+        self.flush_dirty_cells()
+
+    # A method to mark a region of cells (a QRect in cell coordinates) as needing to be re-rendered.
+    # While stroking, our dirty cells accumulate until our next frame. Otherwise, they're re-rendered right away.
+    def mark_dirty(self, cells):
+        self.dirty_cells = self.dirty_cells.united(cells)
+        if not self.stroke_active:
+            self.flush_dirty_cells()
+        else:
+            self.repaint_scheduler.schedule()
 
-            self.line_end = (x, y)
+    # A method to re-render our dirty cells (in one pass), then repaint them.
+    def flush_dirty_cells(self):
+        if self.dirty_cells.isEmpty():
+            return
+        cells, self.dirty_cells = self.dirty_cells, QRect()
+        self.refresh_buffer(cells)
+
+    # A method to draw our line, square, and circle shapes on our canvas buffer once our mouse is released.
+    def draw_shapes(self, event):
+
+        if self.fill_mode and self.fill_gradient:
+
+            self.gradient_end = self.get_pixel_at(event.pos())
+
+            # Filling the region under our starting point with our gradient.
+            self.gradient_fill(self.gradient_start, self.gradient_end)
+            return
+
+        if self.line_mode:
+
+            self.line_end = self.get_pixel_at(event.pos())
 
             # Retrieving the primary color.
             color = self.color_selection_window.get_primary_color()
@@ -426,11 +867,7 @@ class PixelateCanvas(QWidget):
 
         if self.square_mode:
 
-            x, y = event.pos().x(), event.pos().y()
-            x = x // self.pixel_size
-            y = y // self.pixel_size
-
-            self.square_end = (x, y)
+            self.square_end = self.get_pixel_at(event.pos())
 
             # Retrieving the primary color.
             color = self.color_selection_window.get_primary_color()
@@ -442,11 +879,7 @@ class PixelateCanvas(QWidget):
         
         if self.circle_mode:
 
-            x, y = event.pos().x(), event.pos().y()
-            x = x // self.pixel_size
-            y = y // self.pixel_size
-
-            self.circle_end = (x, y)
+            self.circle_end = self.get_pixel_at(event.pos())
 
             # Retrieving the primary color.
             color = self.color_selection_window.get_primary_color()
@@ -464,45 +897,59 @@ class PixelateCanvas(QWidget):
             return
         
         # Getting the x and y coordinates of our mouse click and converting them to pixel coordinates.
-        x, y = event.pos().x(), event.pos().y()
-        x = x // self.pixel_size
-        y = y // self.pixel_size
-        pixel = (x, y)
+        pixel = self.get_pixel_at(event.pos())
+
+        # Gradient Preview (if we're filling with a gradient and dragging the mouse).
+        if self.fill_mode and self.fill_gradient and event.buttons() in (Qt.MouseButton.LeftButton, Qt.MouseButton.RightButton):
+
+            # Update the end point of the gradient.
+            previous_bounds = self.get_preview_bounds()
+            self.gradient_end = pixel
+
+            # Repaint the region of our previous and current previews to show the direction of our gradient.
+            self.request_repaint(previous_bounds.united(self.get_preview_bounds()))
+            return
 
         # Line Preview (if we're in line mode and dragging the mouse).
         if self.line_mode and event.buttons() == Qt.MouseButton.LeftButton:
 
             # Update the end point of the line.
+            previous_bounds = self.get_preview_bounds()
             self.line_end = pixel
 
-            # Repaint the canvas to show the new preview line.
-            self.update()
+            # Repaint the region of our previous and current previews to show the new preview line.
+            self.request_repaint(previous_bounds.united(self.get_preview_bounds()))
             return
 
         #If in square mode, we will draw a preview if mouse is clicked and moving.
         if self.square_mode and event.buttons() == Qt.MouseButton.LeftButton:
 
             # Update the end point of the square.
+            previous_bounds = self.get_preview_bounds()
             self.square_end = pixel
 
-            # Repaint the canvas to show the new preview square.
-            self.update()
+            # Repaint the region of our previous and current previews to show the new preview square.
+            self.request_repaint(previous_bounds.united(self.get_preview_bounds()))
             return
 
         # If in circle mode, we will draw a preview if mouse is clicked and moving.
         if self.circle_mode and event.buttons() == Qt.MouseButton.LeftButton:
 
             # Update the end point of the circle.
+            previous_bounds = self.get_preview_bounds()
             self.circle_end = pixel
 
-            # Repaint the canvas to show the new preview circle.
-            self.update()
+            # Repaint the region of our previous and current previews to show the new preview circle.
+            self.request_repaint(previous_bounds.united(self.get_preview_bounds()))
+            return
+
+        # Only our brush (pencil/eraser) strokes continue as we drag.
+        if not self.uses_brush() or self.last_stroke_pixel is None:
             return
 
-        # If we're in erase mode, we'll "delete" the pixel at the given coordinates.
+        # If we're in erase mode, we'll "delete" the pixels under our brush.
         if self.erase_mode:
-            if pixel in self.pixels:
-                self.erase_pixel(pixel)
+            self.add_stroke_point(pixel, None)
             return
         
         # If the left mouse button is being pressed, we'll draw with the primary color.
@@ -513,12 +960,32 @@ class PixelateCanvas(QWidget):
         elif event.buttons() == Qt.MouseButton.RightButton:
             color = self.color_selection_window.get_secondary_color()
 
-        self.draw_pixel(pixel, color)
+        else:
+            return
+
+        # Queuing our point, which will be connected to our stroke's previous point once our frame is painted.
+        self.add_stroke_point(pixel, color)
 
     # To set our canvas to fill mode, we'll use the following method.
     def set_fill_mode(self, fill_mode):
         self.fill_mode = fill_mode
 
+    # To set the tolerance of our fill tool (0 for an exact match), we'll use the following method.
+    def set_fill_tolerance(self, fill_tolerance):
+        self.fill_tolerance = fill_tolerance
+
+    # To set how our fill tool measures the distance between colors ("rgba" or "lab"), we'll use the following method.
+    def set_fill_metric(self, fill_metric):
+        self.fill_metric = fill_metric
+
+    # To set whether our fill tool fills connected cells or replaces a color everywhere, we'll use the following method.
+    def set_fill_contiguous(self, fill_contiguous):
+        self.fill_contiguous = fill_contiguous
+
+    # To set the gradient our fill tool uses (None, "linear", or "radial"), we'll use the following method.
+    def set_fill_gradient(self, fill_gradient):
+        self.fill_gradient = fill_gradient
+
     # To set our canvas to fill mode, we'll use the following method.
     def set_eyedropper_mode(self, eyedropper_mode):
         self.eyedropper_mode = eyedropper_mode
@@ -539,6 +1006,22 @@ class PixelateCanvas(QWidget):
     def set_circle_mode(self, circle_mode):
         self.circle_mode = circle_mode
 
+    # To set the size of our brush (1 - 32 cells), we'll use the following method.
+    def set_brush_size(self, brush_size):
+        self.brush_size = brush_size
+
+    # To set the shape of our brush ("square", "round", or "dithered"), we'll use the following method.
+    def set_brush_shape(self, brush_shape):
+        self.brush_shape = brush_shape
+
+    # To set whether our square tool draws filled squares, we'll use the following method.
+    def set_square_filled(self, square_filled):
+        self.square_filled = square_filled
+
+    # To set whether our circle tool draws filled circles, we'll use the following method.
+    def set_circle_filled(self, circle_filled):
+        self.circle_filled = circle_filled
+
     # A method to get our canvas dimensions.
     def get_dimensions(self):
         return (self.grid_width, self.grid_height)
@@ -547,42 +1030,92 @@ class PixelateCanvas(QWidget):
     def get_pixel_size(self):
         return self.pixel_size
 
+    # A method to render our canvas (buffer + grid lines, without previews) to an image at its on-screen size.
+    # Large canvases are rendered at a smaller pixel size, so that our image stays within the given maximum number of bytes
+    # (down to a single pixel per cell, i.e. 64 MB for a 4096 x 4096 canvas).
+    def render_image(self, max_bytes=64 * 1024 * 1024):
+        pixel_size = max(1, min(self.pixel_size, math.isqrt(max_bytes // (4 * self.grid_width * self.grid_height))))
+        image = QImage(pixel_size * self.grid_width, pixel_size * self.grid_height, QImage.Format.Format_ARGB32)
+        painter = QPainter(image)
+        cells = QRect(0, 0, self.grid_width, self.grid_height)
+        self.update_display(cells)
+        self.canvas_buffer.draw(painter, cells, pixel_size)
+        if pixel_size >= self.grid_min_cell_size:
+            self.draw_grid(painter, cells, pixel_size)
+        painter.end()
+        return image
+
     # If the fill mode of our canvas is active, we'll use the following method to fill in areas.
     def fill(self, pixel, target_color, replacement_color):
 
-        # Using a stack to simulate recursion.
-        stack = deque([pixel])
+        # If the pixel is out of bounds, there's nothing to fill.
+        if not self.is_within_canvas(pixel):
+            return
 
-        # As long as we have pixels to process, we'll continue.
-        while stack:
-            # Getting the coordinates of the pixel we'll be processing.
-            next_pixel = stack.pop()
+        self.fill_region(self.get_fill_region(pixel, target_color), replacement_color)
 
-            # If we've already visited/processed the pixel, we'll skip it.
-            if next_pixel in self.visited:
-                continue
+    # A method to get the region of cells (an H x W bool mask) our fill covers, starting from the given pixel.
+    def get_fill_region(self, pixel, target_color):
 
-            # Otherwise, we'll get the color of the pixel and continue w/ processing it.
-            color = self.pixels.get(next_pixel, self.default_color)
+        # Finding the cells that match our target color, tile by tile (unpainted cells take on our default color)...
+        target_color = target_color.getRgb()
+        matching = self.pixels.find_cells(lambda colors: get_matching_cells(colors, target_color, self.fill_tolerance, self.fill_metric), self.default_color)
 
-            ''' We'll handle our base cases first.
-                    1. If the pixel is out of bounds, we'll skip it.
-                    2. If the pixel is not the target color, we'll skip it.
-                    (We're only interested in the pixels we're targeting.)
-            '''
-            if not self.is_within_canvas(next_pixel) or color != target_color:
-                continue
+        # ...then, the region of those cells that's connected to our pixel (or every matching cell, when replacing a color).
+        return flood_fill(matching, pixel) if self.fill_contiguous else matching
 
-            # Otherwise, we'll draw the pixel with the replacement color.
-            self.draw_pixel(next_pixel, replacement_color)
+    # A method to fill the region our fill covers with a gradient from our primary color (at our start point)
+    # to our secondary color (at our end point).
+    def gradient_fill(self, start, end):
 
-            # We'll mark the pixel as visited/processed.
-            self.visited.add(next_pixel)
+        # If our starting point is out of bounds, there's nothing to fill.
+        if not self.is_within_canvas(start):
+            return
+
+        region = self.get_fill_region(start, self.pixels.get(start, self.default_color))
+        rows = np.flatnonzero(region.any(axis=1))
+        if rows.size == 0:
+            return
+
+        # Computing the colors of our region a row of tiles at a time (so that we never hold the coordinates of our whole region),
+        # then re-rendering (and repainting) it once.
+        primary_color = self.color_selection_window.get_primary_color().getRgb()
+        secondary_color = self.color_selection_window.get_secondary_color().getRgb()
+        size = self.pixels.TILE_SIZE
+        for y0 in range(int(rows[0]) // size * size, int(rows[-1]) + 1, size):
+            ys, xs = np.nonzero(region[y0:y0 + size])
+            ys += y0
+            self.pixels.set_cells(xs, ys, get_gradient_colors(xs, ys, start, end, primary_color, secondary_color, self.fill_gradient))
+        self.mark_dirty(self.get_region_bounds(region, rows))
+
+    # A method to fill a region of cells (an H x W bool mask) with the given color, in a single batch.
+    def fill_region(self, region, color):
+        rows = np.flatnonzero(region.any(axis=1))
+        if rows.size == 0:
+            return
+        self.pixels.fill_region(region, color.getRgb())
+        self.mark_dirty(self.get_region_bounds(region, rows))
+
+    # A method to get the bounding rect (a QRect in cell coordinates) of a region of cells, given the rows it covers.
+    def get_region_bounds(self, region, rows):
+        columns = np.flatnonzero(region[rows[0]:rows[-1] + 1].any(axis=0))
+        return QRect(int(columns[0]), int(rows[0]), int(columns[-1] - columns[0]) + 1, int(rows[-1] - rows[0]) + 1)
+
+    # A method to erase several cells at once (given x and y coordinate arrays), then re-render (and repaint) them once.
+    def erase_cells(self, xs, ys):
+        if xs.size == 0:
+            return
+        self.pixels.erase_cells(xs, ys)
+        self.mark_dirty(QRect(int(xs.min()), int(ys.min()), int(xs.max() - xs.min()) + 1, int(ys.max() - ys.min()) + 1))
+
+    # A method to paint several cells at once (given x and y coordinate arrays) with a single color or an N x 4 array of colors.
+    # Our cells are written to our pixel store in a single batch, then re-rendered (and repainted) once.
+    def write_cells(self, xs, ys, colors):
+        if xs.size == 0:
+            return
+        self.pixels.set_cells(xs, ys, colors)
+        self.mark_dirty(QRect(int(xs.min()), int(ys.min()), int(xs.max() - xs.min()) + 1, int(ys.max() - ys.min()) + 1))
 
-            # We'll now process the neighboring pixels.
-            x, y = next_pixel
-            stack.extend([(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)])
-            
     # The following method will allow us to preview pixels on our canvas before drawing them.
     # We provide a QPainter object to handle all drawing operations.
     def preview(self, painter):
@@ -595,7 +1128,11 @@ class PixelateCanvas(QWidget):
         else:
             preview_color = self.color_selection_window.get_primary_color()
             if self.is_filter_on:
-                preview_color = daltonize(preview_color, self.filter_type)
+                preview_color = self.filter_color(preview_color)
+
+        # If we're filling with a gradient and the mouse button was pressed, we'll preview its direction as a line.
+        if self.fill_mode and self.fill_gradient and self.mouse_button_pressed:
+            self.draw_line(self.gradient_start, self.gradient_end, preview_color, is_preview=True, painter=painter)
 
         # If we're in line mode and the mouse button was pressed, we'll draw a preview line.
         if self.line_mode and self.mouse_button_pressed:
@@ -624,167 +1161,140 @@ class PixelateCanvas(QWidget):
         self.is_draggable = draggable
 
     # A getter method to retrieve the current state of our canvas.
+    # (Our pixel store can be used like a dictionary of the form {(x, y): QColor}.)
     def get_pixels(self):
         return self.pixels
     
-    # A method to set the pixels of our canvas.
+    # A method to set the pixels of our canvas (replacing the existing ones).
+    # Our pixels can be provided as a dictionary of the form {(x, y): QColor} or as a pixel store.
     def set_pixels(self, pixels):
-        self.pixels = pixels
+        self.pixels.clear()
+        self.update_pixels(pixels)
     
     # A method to update the pixels of our canvas (adding new pixels; not replacing the existing ones).
     # (Will be used to implement import functionality from within the main app window.)
     def update_pixels(self, pixels):
         self.pixels.update(pixels)
 
-        # Updating the canvas buffer to display the new pixels.
-        for (x, y), color in pixels.items():
-            current_pixel = QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size)
-            buffer_painter = QPainter(self.canvas_buffer)
-            buffer_painter.fillRect(current_pixel, color)
-            buffer_painter.end()
+        # Updating the canvas buffer to display the new pixels (only re-rendering the tiles they were written to).
+        self.refresh_dirty_tiles()
 
-        # Repainting the canvas to display the new pixels.
-        self.update()
+    # A method to re-render (and repaint) only the tiles of our composite that have changed (i.e. been written to in any of our layers).
+    def refresh_dirty_tiles(self):
+        for key in self.layers.update_composite():
+            self.refresh_buffer(self.pixels.get_tile_rect(key))
 
     # Method to draw a line on screen given a color, start, and end point.
     def draw_line(self, start, end, color, is_preview=False, painter=None):
-        x1, y1 = start
-        x2, y2 = end
-
-        # Store distance, step direction, and error.
-        dx = abs(x2 - x1)
-        dy = abs(y2 - y1)
-        sx = 1 if x1 < x2 else -1
-        sy = 1 if y1 < y2 else -1
-        err = dx - dy
-
-        while True:
-
-            # Within canvas bounds...
-            if self.is_within_canvas((x1, y1)):
-
-                if is_preview:
-                    # For our preview line, we'll draw it directly onto our canvas, not the canvas buffer.
-                    painter.fillRect(x1 * self.pixel_size, y1 * self.pixel_size, self.pixel_size, self.pixel_size, color)
-
-                else:
-                    # Otherwise, we'll draw the line on our canvas buffer.
-                    self.draw_pixel((x1, y1), color)
-
-            # Bresenham’s Algorithm:
-            if x1 == x2 and y1 == y2:
-                break
-
-            # To determine the next pixel to draw, we'll calculate the error.
-            e2 = 2 * err
-
-            # Horizontal step decision.
-            if e2 > -dy:
-                err -= dy
-                x1 += sx
-
-            # Vertical step decision.
-            if e2 < dx:
-                err += dx
-                y1 += sy
+        self.draw_shape("line", start, end, color, is_preview, painter)
 
     # Method to check if a coordinate is within the canvas.
     def is_within_canvas(self, pixel):
         x, y = pixel
         return 0 <= x < self.grid_width and 0 <= y < self.grid_height
 
-    # Method to draw a square on screen given a color, start, and end point.
+    # Method to draw a square (outlined or filled) on screen given a color, start, and end point.
     def draw_square(self, start, end, color, is_preview=False, painter=None):
+        self.draw_shape("filled_square" if self.square_filled else "square", start, end, color, is_preview, painter)
 
-        # Store coordinates of start and end points.
-        x1, y1 = start
-        x2, y2 = end
-
-        # Drawing all 4 sides of the square.
-        self.draw_line(start, (x2, y1), color, is_preview, painter)
-        self.draw_line((x2, y1), end, color, is_preview, painter)
-        self.draw_line(end, (x1, y2), color, is_preview, painter)
-        self.draw_line((x1, y2), start, color, is_preview, painter)
-
+    # Method to draw a circle (outlined or filled) on screen given a color, start, and end point (based on the mid-point circle drawing algorithm).
     def draw_circle(self, start, end, color, is_preview=False, painter=None):
-        # Following code is based on mid-point circle drawing algorithm.
-
-        x1, y1 = start  
-        x2, y2 = end  
-        radius = round(abs(x2 - x1) / 2) 
-
-        # Calculate the center of the circle based on beginning and ending coordinate signs
-        if x2 < x1 and y2 < y1: # Dragging from top right to bottom left
-            cx = x1 - radius
-            cy = y1 - radius
-
-        elif x2 >= x1 and y2 >= y1: # Dragging from bottom left to top right
-            cx = x1 + radius
-            cy = y1 + radius
-
-        elif x2 < x1 and y2 >= y1: # Dragging from bottom right to top left
-            cx = x1 - radius
-            cy = y1 + radius
-
-        elif x2 >= x1 and y2 < y1: # Dragging from top left to bottom right
-            cx = x1 + radius
-            cy = y1 - radius
-
-        x = radius
-        y = 0
-        P = 1 - radius  # Initial decision parameter
-
-        def plot_circle_points(px, py):
-            # Since it's a circle, if we verify that a pixel is a valid point, then its symmetrical counterparts are also valid (using 8 quadrants)
-            points = [
-                (cx + px, cy + py), (cx - px, cy + py),
-                (cx + px, cy - py), (cx - px, cy - py),
-                (cx + py, cy + px), (cx - py, cy + px),
-                (cx + py, cy - px), (cx - py, cy - px),
-            ]
-
-            # Making sure we draw in canvas bounds!
-            for px, py in points:
-                if self.is_within_canvas((px, py)):  
-                    if is_preview:
-                        painter.fillRect(px * self.pixel_size, py * self.pixel_size,
-                                        self.pixel_size, self.pixel_size, color)
-                    else:
-                        self.draw_pixel((px, py), color)
-
-        # Draw the initial circle points
-        plot_circle_points(x, y)
-
-        while x > y:
-            y += 1
-            if P <= 0:  # Midpoint is inside or on the perimeter
-                P = P + 2 * y + 1
-            else:  # Midpoint is outside
-                x -= 1
-                P = P + 2 * y - 2 * x + 1
-
-            if x < y:  # Finished drawing all the points in the quadrant; break
-                break
-
-            plot_circle_points(x, y)
+        self.draw_shape("filled_circle" if self.circle_filled else "circle", start, end, color, is_preview, painter)
 
-    def daltonize_canvas(self, cvd_type):
+    # A method to draw one of our shapes (see rasterizer.SHAPES), given a color, start, and end point.
+    # Our shape's cells are rasterized all at once (and cached), then either previewed or written to our pixel store in one batch.
+    def draw_shape(self, shape, start, end, color, is_preview=False, painter=None):
 
-        if not self.is_filter_on or self.filter_type != cvd_type:
-            # Daltonize the filtered pixels
-            for (x, y), color in self.pixels.items():
-                daltonized_color = daltonize(color, cvd_type)
+        if is_preview:
+            # For our preview, we'll draw our shape directly onto our canvas, not the canvas buffer.
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(color)
+            painter.drawRects(self.get_preview_rects(shape, start, end))
+            return
 
-                # Updating the canvas buffer to display the pixel while preserving original value
-                current_pixel = QRect(x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size)
-                buffer_painter = QPainter(self.canvas_buffer)
-                buffer_painter.fillRect(current_pixel, daltonized_color)
-                buffer_painter.end()
-            self.update()
+        # Otherwise, we'll draw our shape on our canvas buffer.
+        xs, ys = self.get_shape_cells(shape, start, end)
+        self.write_cells(xs, ys, color.getRgb())
+
+    # A method to get the cells of a shape that are within our canvas, as x and y coordinate arrays.
+    def get_shape_cells(self, shape, start, end):
+        xs, ys = rasterize(shape, start, end)
+        return clip_cells(xs, ys, self.grid_width, self.grid_height)
+
+    # A method to get the shape we're currently previewing while dragging, as (shape, start, end), or None.
+    def get_preview_shape(self):
+        if not self.mouse_button_pressed:
+            return None
+        if self.fill_mode and self.fill_gradient:
+            return ("line", self.gradient_start, self.gradient_end)
+        if self.line_mode:
+            return ("line", self.line_start, self.line_end)
+        if self.square_mode:
+            return ("filled_square" if self.square_filled else "square", self.square_start, self.square_end)
+        if self.circle_mode:
+            return ("filled_circle" if self.circle_filled else "circle", self.circle_start, self.circle_end)
+        return None
+
+    # A method to get the bounding rect (in item coordinates) of the shape we're currently previewing (empty if there's none).
+    # While dragging, we only repaint the bounds of our previous and current previews, rather than our entire canvas.
+    def get_preview_bounds(self):
+        preview_shape = self.get_preview_shape()
+        if preview_shape is None:
+            return QRect()
+        # (A filled shape covers the same bounds as its outline, which has far fewer cells.)
+        shape, start, end = preview_shape
+        xs, ys = rasterize(shape.replace("filled_", ""), start, end)
+        x0, y0 = int(xs.min()), int(ys.min())
+        cells = QRect(x0, y0, int(xs.max()) - x0 + 1, int(ys.max()) - y0 + 1).intersected(QRect(0, 0, self.grid_width, self.grid_height))
+        if cells.isEmpty():
+            return QRect()
+        return self.rect_of_cells(cells)
+
+    # A method to get the rects (in item coordinates) of the cells of a shape we're previewing.
+    # Our filled square is previewed as a single rect, and our filled circle as a rect per row span (see rasterize_spans),
+    # while our outlines use a rect per cell.
+    # Since our preview is repainted many times while dragging, we'll keep the rects of our current preview.
+    def get_preview_rects(self, shape, start, end):
+        key = (shape, start, end, self.pixel_size)
+        if self.preview_key != key:
+            size = self.pixel_size
+            if shape == "filled_square":
+                # Our filled square is a single rect (clipped to our canvas).
+                (x1, y1), (x2, y2) = start, end
+                cells = QRect(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1).intersected(QRect(0, 0, self.grid_width, self.grid_height))
+                self.preview_rects = [] if cells.isEmpty() else [self.rect_of_cells(cells)]
+            elif shape == "filled_circle":
+                # Clipping our spans to our canvas.
+                ys, lefts, rights = rasterize_spans(shape, start, end)
+                lefts, rights = np.maximum(lefts, 0), np.minimum(rights, self.grid_width - 1)
+                keep = (ys >= 0) & (ys < self.grid_height) & (lefts <= rights)
+                self.preview_rects = [QRect(left * size, y * size, (right - left + 1) * size, size)
+                                      for y, left, right in zip(ys[keep].tolist(), lefts[keep].tolist(), rights[keep].tolist())]
+            else:
+                xs, ys = self.get_shape_cells(shape, start, end)
+                self.preview_rects = [QRect(x * size, y * size, size, size) for x, y in zip(xs.tolist(), ys.tolist())]
+            self.preview_key = key
+        return self.preview_rects
+
+    # A method to daltonize an N x 4 array of colors (with a single matrix multiplication, see smart_filter).
+    def daltonize_colors(self, colors, cvd_type):
+        return daltonize_colors(colors, cvd_type)
+
+    # A method to toggle the given filter on (or off, if it's already on).
+    def daltonize_canvas(self, cvd_type):
+        self.toggle_filter(cvd_type, "daltonize")
 
-            self.is_filter_on = True
-            self.filter_type = cvd_type
+    # A method to toggle the simulation of the given CVD type on (or off, if we're already simulating it).
+    def simulate_canvas(self, cvd_type):
+        self.toggle_filter(cvd_type, "simulate")
 
+    # A method to toggle a filter on (or off, if it's already on).
+    def toggle_filter(self, cvd_type, mode):
+        if self.is_filter_active(cvd_type, mode):
+            self.set_filter(None)
         else:
-            self.is_filter_on = False
-            self.filter_type = None
+            self.set_filter(cvd_type, mode)
+
+    # A method to check whether the given filter is on.
+    def is_filter_active(self, cvd_type, mode="daltonize"):
+        return self.is_filter_on and self.filter_type == cvd_type and self.filter_mode == mode
@@ -0,0 +1,141 @@
+# Importing numpy to compute the cells of our shapes as coordinate arrays.
+import numpy as np
+# Importing lru_cache to cache the cells of our most recently rasterized shapes.
+from functools import lru_cache
+
+'''
+    The functions we'll use to rasterize the shapes drawn by our line, square, and circle tools:
+    Each shape is given by the (x, y) cells its drag started and ended on, and is rasterized into two arrays
+    of x and y cell coordinates (computed all at once with numpy, rather than cell by cell).
+    Our square and circle also have filled variants, which cover every cell inside their outlines.
+
+    The cells of our most recent shapes are cached per (shape, start, end), since our previews repaint the same
+    shape many times while dragging. Our cached arrays are read-only, so they can be shared safely.
+    Our filled shapes can also be rasterized as row spans (one per row of cells), which our previews draw as a single rect each.
+    Our cells are not clipped to our canvas; that's up to whoever draws them (see clip_cells).
+'''
+
+# Our supported shapes.
+SHAPES = ("line", "square", "circle", "filled_square", "filled_circle")
+
+# A function to get the cells of a shape, as a tuple of (read-only) x and y coordinate arrays.
+@lru_cache(maxsize=64)
+def rasterize(shape, start, end):
+    if shape == "line":
+        xs, ys = rasterize_line(start, end)
+    elif shape == "square":
+        xs, ys = rasterize_square(start, end)
+    elif shape == "circle":
+        xs, ys = rasterize_circle(start, end)
+    elif shape == "filled_square":
+        xs, ys = rasterize_filled_square(start, end)
+    elif shape == "filled_circle":
+        xs, ys = fill_outline(*rasterize_circle(start, end))
+    else:
+        raise ValueError(f"Unknown shape: {shape}")
+
+    xs.flags.writeable = False
+    ys.flags.writeable = False
+    return xs, ys
+
+# A function to get the row spans of a filled shape, as a tuple of (read-only) arrays: the y coordinate of each row,
+# along with the x coordinates of its leftmost and rightmost cells.
+@lru_cache(maxsize=64)
+def rasterize_spans(shape, start, end):
+    if shape == "filled_square":
+        x1, y1 = start
+        x2, y2 = end
+        ys = np.arange(min(y1, y2), max(y1, y2) + 1, dtype=np.int64)
+        lefts, rights = np.full(ys.size, min(x1, x2), dtype=np.int64), np.full(ys.size, max(x1, x2), dtype=np.int64)
+    elif shape == "filled_circle":
+        ys, lefts, rights = get_outline_spans(*rasterize_circle(start, end))
+    else:
+        raise ValueError(f"Not a filled shape: {shape}")
+
+    for array in (ys, lefts, rights):
+        array.flags.writeable = False
+    return ys, lefts, rights
+
+# A function to get the cells of a line (matching those of Bresenham's algorithm).
+# Along our line's major axis, we step one cell at a time; along its minor axis, we round to the nearest cell.
+def rasterize_line(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    dx, dy = abs(x2 - x1), abs(y2 - y1)
+    sx = 1 if x1 < x2 else -1
+    sy = 1 if y1 < y2 else -1
+
+    steps = np.arange(max(dx, dy) + 1, dtype=np.int64)
+    if dx >= dy:
+        # (Ties are rounded towards our starting cell, as in Bresenham's algorithm.)
+        xs = x1 + sx * steps
+        ys = y1 + sy * ((2 * steps * dy + dx - 1) // (2 * dx) if dx else steps)
+    else:
+        ys = y1 + sy * steps
+        xs = x1 + sx * ((2 * steps * dx + dy - 1) // (2 * dy))
+    return xs, ys
+
+# A function to get the cells of a square's outline (its four sides, from corner to corner).
+def rasterize_square(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    corners = [start, (x2, y1), end, (x1, y2), start]
+    sides = [rasterize_line(corners[i], corners[i + 1]) for i in range(4)]
+    return np.concatenate([side[0] for side in sides]), np.concatenate([side[1] for side in sides])
+
+# A function to get the cells of a circle's outline (matching those of the mid-point circle algorithm).
+# Our circle's diameter is the horizontal distance of our drag, and it grows from our starting cell towards our ending cell.
+def rasterize_circle(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    radius = round(abs(x2 - x1) / 2)
+
+    # Calculating the center of our circle based on the direction we're dragging in.
+    cx = x1 + radius if x2 >= x1 else x1 - radius
+    cy = y1 + radius if y2 >= y1 else y1 - radius
+
+    # The cells of a single octant (where x >= y). The mid-point algorithm keeps x as large as possible while x^2 - x + y^2 <= r^2.
+    py = np.arange(radius + 1, dtype=np.int64)
+    px = np.minimum(np.floor((1 + np.sqrt(1 + 4 * (radius * radius - py * py))) / 2).astype(np.int64), radius)
+    keep = px >= py
+    px, py = px[keep], py[keep]
+
+    # Mirroring our octant into all 8 octants of our circle.
+    xs = np.concatenate([cx + px, cx - px, cx + px, cx - px, cx + py, cx - py, cx + py, cx - py])
+    ys = np.concatenate([cy + py, cy + py, cy - py, cy - py, cy + px, cy + px, cy - px, cy - px])
+    return xs, ys
+
+# A function to get the cells of a filled square (every cell of the rectangle between our corners).
+def rasterize_filled_square(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    ys, xs = np.mgrid[min(y1, y2):max(y1, y2) + 1, min(x1, x2):max(x1, x2) + 1]
+    return xs.ravel(), ys.ravel()
+
+# A function to get the row spans of a (convex) outline, given the x and y coordinates of its cells.
+# Each row of our shape spans from the leftmost to the rightmost cell of our outline in that row.
+def get_outline_spans(xs, ys):
+    top = ys.min()
+    rows = ys - top
+    left = np.full(rows.max() + 1, xs.max(), dtype=np.int64)
+    right = np.full(rows.max() + 1, xs.min(), dtype=np.int64)
+    np.minimum.at(left, rows, xs)
+    np.maximum.at(right, rows, xs)
+    return np.arange(top, top + len(left), dtype=np.int64), left, right
+
+# A function to fill a (convex) outline, given the x and y coordinates of its cells.
+def fill_outline(xs, ys):
+    top, left, right = get_outline_spans(xs, ys)
+
+    # Expanding each row's span into the cells it covers.
+    lengths = right - left + 1
+    row_ys = np.repeat(top, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(left, lengths) + offsets, row_ys
+
+# A function to clip the cells of a shape to our canvas, returning the x and y coordinates of the cells within it.
+def clip_cells(xs, ys, width, height):
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    if inside.all():
+        return xs, ys
+    return xs[inside], ys[inside]
@@ -0,0 +1,116 @@
+# Importing the necessary modules to schedule repaints of our canvas.
+from PyQt6.QtCore import QElapsedTimer, QRect, QRectF, QTimer
+
+'''
+    A class to schedule the repaints of a graphics item (i.e. our canvas), at most once per frame:
+    Rather than calling update() on our item every time something changes, we request a repaint of the rect
+    that changed. Our requested rects accumulate into a small set of dirty rects (overlapping rects are merged),
+    which are repainted together once our next frame is due. Any work that should happen once per frame before painting
+    (i.e. painting our queued stroke points) can be given as our "before flush" callback; requesting a frame schedules
+    it without a dirty rect.
+
+    Our frames are paced by our frame rate (60 fps by default): if our last frame was long enough ago, our next frame
+    is flushed as soon as control returns to the event loop; otherwise, it waits for the rest of the frame.
+
+    We also keep the following statistics, to measure how well our requests are coalesced:
+        requests  -> the number of repaints we've been asked for.
+        frames    -> the number of frames we've flushed (i.e. the number of times we've updated our item).
+        coalesced -> the number of requests that were merged into another request's frame.
+'''
+class RepaintScheduler:
+
+    # Past this many separate dirty rects, we'll simply repaint their bounding rect.
+    MAX_DIRTY_RECTS = 32
+
+    # Our constructor will set up our dirty rects, our frame timer, and our statistics.
+    def __init__(self, item, fps=60, before_flush=None):
+        self.item = item
+        self.before_flush = before_flush
+
+        # The rects of our item waiting to be repainted (in item coordinates).
+        self.dirty_rects = []
+
+        # Our frame timer, along with the time since our last frame was flushed.
+        self.frame_timer = QTimer(item)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.flush)
+        self.last_frame = QElapsedTimer()
+        self.set_fps(fps)
+
+        self.reset_statistics()
+
+    # A method to set our frame rate (in frames per second).
+    def set_fps(self, fps):
+        if fps <= 0:
+            raise ValueError("Our frame rate must be positive.")
+        self.fps = fps
+        self.frame_interval = max(1, round(1000 / fps))
+
+    # A method to get our frame rate.
+    def get_fps(self):
+        return self.fps
+
+    # A method to request a repaint of the given rect (a QRect in item coordinates), or of our entire item.
+    def request(self, rect=None):
+        rect = self.item.boundingRect().toAlignedRect() if rect is None else QRect(rect)
+        if rect.isEmpty():
+            return
+        self.requests += 1
+
+        # Merging our rect with any of our dirty rects it overlaps.
+        dirty_rects = []
+        for dirty_rect in self.dirty_rects:
+            if dirty_rect.intersects(rect):
+                rect = rect.united(dirty_rect)
+            else:
+                dirty_rects.append(dirty_rect)
+        dirty_rects.append(rect)
+
+        if len(dirty_rects) > self.MAX_DIRTY_RECTS:
+            bounds = QRect()
+            for dirty_rect in dirty_rects:
+                bounds = bounds.united(dirty_rect)
+            dirty_rects = [bounds]
+
+        self.dirty_rects = dirty_rects
+        self.schedule()
+
+    # A method to schedule our next frame (if it isn't scheduled already), without requesting a repaint.
+    def schedule(self):
+        if self.frame_timer.isActive():
+            return
+
+        # Waiting for whatever's left of our current frame.
+        elapsed = self.last_frame.elapsed() if self.last_frame.isValid() else self.frame_interval
+        self.frame_timer.start(max(0, self.frame_interval - elapsed))
+
+    # A method to flush our frame: running our "before flush" callback, then repainting our dirty rects.
+    def flush(self):
+        self.frame_timer.stop()
+        if self.before_flush is not None:
+            self.before_flush()
+
+        # Our callback may have requested more repaints (and scheduled another frame), which we'll include in this frame.
+        self.frame_timer.stop()
+        if not self.dirty_rects:
+            return
+        dirty_rects, self.dirty_rects = self.dirty_rects, []
+        for rect in dirty_rects:
+            self.item.update(QRectF(rect))
+
+        self.frames += 1
+        self.last_frame.restart()
+
+    # A method to get our coalescing statistics, as a dictionary.
+    def get_statistics(self):
+        return {
+            "requests": self.requests,
+            "frames": self.frames,
+            "coalesced": self.requests - self.frames,
+            "fps": self.fps,
+        }
+
+    # A method to reset our statistics.
+    def reset_statistics(self):
+        self.requests = 0
+        self.frames = 0
@@ -0,0 +1,64 @@
+# Importing numpy to track which of our tiles are stale.
+import numpy as np
+from PyQt6.QtCore import QRect
+from canvas.pixel_store import PixelStore
+
+'''
+    A class to keep track of which tiles of a canvas-sized image are stale (i.e. need to be recomputed from our pixels),
+    for our displays and the levels of our mip chains. Our tiles are the same tiles our pixels are stored in (see PixelStore).
+
+    Stale tiles are recomputed row by row: each row of tiles is covered by a single rect of cells,
+    from its first to its last stale tile (so that a stroke is recomputed in a few large blocks, rather than tile by tile).
+'''
+class StaleTiles:
+
+    # The size of our tiles (in cells).
+    TILE_SIZE = PixelStore.TILE_SIZE
+
+    # Our constructor will set up our tiles (all stale by default, since nothing has been computed yet).
+    def __init__(self, width, height, stale=True):
+        self.width  = width
+        self.height = height
+        self.tiles = np.full((-(-height // self.TILE_SIZE), -(-width // self.TILE_SIZE)), stale, dtype=bool)
+
+    # A method to mark the tiles covering a region of cells (a QRect in cell coordinates, or our whole canvas) as stale.
+    def mark(self, cells=None):
+        if cells is None:
+            self.tiles[...] = True
+            return
+        tiles = self.get_tile_slices(cells)
+        if tiles is not None:
+            self.tiles[tiles] = True
+
+    # A method to mark all of our tiles as up to date.
+    def clear(self):
+        self.tiles[...] = False
+
+    # A method to check whether any of our tiles are stale.
+    def any(self):
+        return bool(self.tiles.any())
+
+    # A method to get the (row, column) slices of the tiles covering a region of cells (or None if it's outside our canvas).
+    def get_tile_slices(self, cells):
+        cells = cells.intersected(QRect(0, 0, self.width, self.height))
+        if cells.isEmpty():
+            return None
+        tx0, ty0 = cells.x() // self.TILE_SIZE, cells.y() // self.TILE_SIZE
+        tx1, ty1 = (cells.x() + cells.width() - 1) // self.TILE_SIZE, (cells.y() + cells.height() - 1) // self.TILE_SIZE
+        return slice(ty0, ty1 + 1), slice(tx0, tx1 + 1)
+
+    # A method to take our stale tiles (marking them as up to date), as a list of rects of cells (one per row of tiles).
+    # Given a region of cells, we'll only take the stale tiles covering that region (the rest remain stale).
+    def take_rects(self, cells=None):
+        rows, columns = (slice(None), slice(None)) if cells is None else (self.get_tile_slices(cells) or (slice(0), slice(0)))
+        tiles = self.tiles[rows, columns]
+        ty_offset, tx_offset = rows.start or 0, columns.start or 0
+
+        rects = []
+        for ty in np.flatnonzero(tiles.any(axis=1)):
+            stale = np.flatnonzero(tiles[ty])
+            x0, x1 = (stale[0] + tx_offset) * self.TILE_SIZE, min((stale[-1] + 1 + tx_offset) * self.TILE_SIZE, self.width)
+            y0, y1 = (ty + ty_offset) * self.TILE_SIZE, min((ty + 1 + ty_offset) * self.TILE_SIZE, self.height)
+            rects.append(QRect(int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+        tiles[...] = False
+        return rects
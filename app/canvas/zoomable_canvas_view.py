@@ -1,24 +1,96 @@
 # Importing basic widgets from PyQt6.
-from PyQt6.QtWidgets import QGraphicsView
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QMouseEvent, QTransform
+from PyQt6.QtWidgets import QGraphicsView, QWidget
+from PyQt6.QtCore import Qt, QRectF, QMargins
+from PyQt6.QtGui import QMouseEvent, QTransform, QPainter, QColor
+
+'''
+    A class to show our canvas with a color filter (a CVD type) applied, next to our view (see ZoomableCanvasView's comparison modes).
+    Our pane is exactly as large as our view's viewport and shows the same part of our canvas, so it pans and zooms along with our view.
+
+    Our pane renders our canvas from the same source as our view (the composite of our canvas's layers), through its own
+    filtered buffer (a display attached to our canvas, see CanvasDisplays). As our artist draws, only the tiles that changed are re-filtered.
+'''
+class ComparisonPane(QWidget):
+
+    def __init__(self, view, cvd_type, mode="daltonize"):
+        super().__init__(view)
+        self.view = view
+        self.cvd_type = cvd_type
+        self.mode = mode
+        canvas = view.canvas
+        self.display = canvas.canvas_displays.attach_display(canvas.get_filter_key(cvd_type, mode), canvas.create_color_filter(cvd_type, mode))
+
+        # Our label (the name of our filter), drawn in our top left corner.
+        self.label_color = QColor(0, 0, 0, 160)
+
+    # A method to detach our filtered buffer from our canvas (once our pane is removed).
+    def release(self):
+        self.view.canvas.canvas_displays.detach_display(self.display)
+
+    # Overriding the paintEvent method, to draw the part of our canvas our view shows (just as our canvas draws itself).
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.view.get_background_color())
+        canvas = self.view.canvas
+
+        # Mapping our canvas's cells onto our pane, the same way our view maps them onto its viewport.
+        transform = canvas.sceneTransform() * self.view.viewportTransform()
+        painter.setTransform(transform)
+        cells = canvas.cells_in_rect(transform.inverted()[0].mapRect(QRectF(event.rect())).toAlignedRect())
+        if not cells.isEmpty():
+            # Re-filtering the visible tiles that have changed since we were last painted.
+            self.display.update(canvas.layers.composite, cells)
+            cell_size = canvas.pixel_size * transform.m11()
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+            level = self.display.mipmaps.choose_level(cell_size)
+            if level > 0:
+                self.display.mipmaps.draw(painter, cells, canvas.pixel_size, level)
+            else:
+                self.display.buffer.draw(painter, cells, canvas.pixel_size)
+            if cell_size >= canvas.grid_min_cell_size:
+                canvas.draw_grid(painter, cells)
+
+        painter.resetTransform()
+        painter.setPen(self.label_color)
+        painter.drawText(8, 18, self.cvd_type if self.mode == "daltonize" else f"{self.cvd_type} (simulated)")
+
+    # Zooming over our pane zooms our view (and, in turn, our pane).
+    def wheelEvent(self, event):
+        self.view.wheelEvent(event)
 
 class ZoomableCanvasView(QGraphicsView):
 
-    def __init__(self, scene, proxy_widget):
+    # Around our canvas, our scene extends far enough in every direction for us to pan (and zoom) freely.
+    scene_margin = 1000000
+
+    def __init__(self, scene, canvas):
 
         # Setting the scene for our view.
         super().__init__(scene)
 
+        # Our view mode: "single" (just our canvas), "split" (our canvas next to a single filtered version of it),
+        # or "quad" (our canvas along with each of our filtered versions, in a 2 x 2 grid). Our filtered versions are shown in our panes.
+        self.view_mode = "single"
+        self.panes = []
+
         # Setting the transformation anchor to our mouse cursor's position.
         # (A transformation anchor is the point in the view that remains fixed when the view is transformed.)
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
 
-        # Storing our proxy widget (to move around the canvas).
-        self.proxy_widget = proxy_widget
+        # Storing a direct reference to our canvas (an item of our scene).
+        self.canvas = canvas
+
+        # Rather than moving our canvas around our scene, we pan by scrolling our view (and zoom by scaling it),
+        # so both are transform-only operations. Our (hidden) scroll bars need room to scroll, so we'll pad our scene.
+        margin = self.scene_margin
+        self.setSceneRect(self.canvas.boundingRect().adjusted(-margin, -margin, margin, margin))
+
+        # Our canvas isn't antialiased, so the regions we repaint don't need to be padded (a cell repaints just that cell).
+        self.setOptimizationFlag(QGraphicsView.OptimizationFlag.DontAdjustForAntialiasing, True)
 
-        # Storing a direct reference to our canvas.
-        self.canvas = self.proxy_widget.widget()
+        # Keeping our canvas centered in our view, even as our view is resized.
+        self.setResizeAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
+        self.centerOn(self.canvas)
 
         # Storing our tool manager (to access the current tool).
         self.tools = None
@@ -35,6 +107,67 @@ class ZoomableCanvasView(QGraphicsView):
         # For dragging functionality, we'll need to store the last mouse position (to calculate how much we've dragged our mouse).
         self.last_mouse_pos = None 
 
+    # A method to set our view mode ("single", "split", or "quad"). In split mode, we'll compare our canvas with the given CVD type.
+    # Our panes either daltonize our canvas or simulate how it's seen (at our canvas's filter severity), depending on the given filter mode.
+    def set_view_mode(self, mode, cvd_type="Protanopia", filter_mode="daltonize"):
+        if mode not in ("single", "split", "quad"):
+            raise ValueError(f"Unknown view mode: {mode}")
+        for pane in self.panes:
+            pane.release()
+            pane.deleteLater()
+
+        cvd_types = {"single": [], "split": [cvd_type], "quad": ["Protanopia", "Deuteranopia", "Tritanopia"]}[mode]
+        self.view_mode = mode
+        self.panes = [ComparisonPane(self, cvd_type, filter_mode) for cvd_type in cvd_types]
+        for pane in self.panes:
+            pane.show()
+        self.layout_panes()
+
+    # A method to get our view mode.
+    def get_view_mode(self):
+        return self.view_mode
+
+    # A method to get the color our canvas is drawn over.
+    def get_background_color(self):
+        return self.viewport().palette().color(self.viewport().backgroundRole())
+
+    # A method to lay out our viewport and our panes: our viewport keeps our top left cell of our grid (1 x 2 in split mode, 2 x 2 in quad mode),
+    # and our panes fill in the rest of our cells (each exactly as large as our viewport).
+    def layout_panes(self):
+        columns = 1 if self.view_mode == "single" else 2
+        rows = 2 if self.view_mode == "quad" else 1
+        width, height = self.width() // columns, self.height() // rows
+
+        # Keeping the part of our canvas we were looking at centered in our (resized) viewport.
+        margins = QMargins(0, 0, self.width() - width, self.height() - height)
+        if margins != self.viewportMargins():
+            center = self.mapToScene(self.viewport().rect().center())
+            self.setViewportMargins(margins)
+            self.centerOn(center)
+        viewport = self.viewport().geometry()
+        cells = [(1, 0), (0, 1), (1, 1)]
+        for pane, (column, row) in zip(self.panes, cells):
+            pane.setGeometry(viewport.x() + column * width, viewport.y() + row * height, viewport.width(), viewport.height())
+
+    # Overriding the resizeEvent method to lay out our panes again.
+    def resizeEvent(self, event):
+        self.layout_panes()
+        super().resizeEvent(event)
+
+    # Overriding the paintEvent method, to repaint the same part of our panes whenever part of our viewport is repainted
+    # (i.e. while drawing, or once we've zoomed).
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        for pane in self.panes:
+            pane.update(event.rect())
+
+    # Overriding the scrollContentsBy method to repaint our panes once we've panned
+    # (our viewport only repaints the parts of it that were scrolled into view).
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        for pane in self.panes:
+            pane.update()
+
     # A method to set our tool manager.
     def set_tools(self, tools):
         self.tools = tools
@@ -67,11 +200,11 @@ class ZoomableCanvasView(QGraphicsView):
         if self.canvas.is_draggable:
 
             # We'll set our cursor to a closed hand cursor to indicate that it's being dragged.
-            self.proxy_widget.setCursor(Qt.CursorShape.ClosedHandCursor)
+            self.canvas.setCursor(Qt.CursorShape.ClosedHandCursor)
 
             # We'll store the current mouse position to calculate how much we've dragged our mouse.
-            # Note: We'll store the mouse position in scene coordinates.
-            self.last_mouse_pos = self.mapToScene(event.pos())
+            # Note: We'll store the mouse position in view coordinates.
+            self.last_mouse_pos = event.pos()
 
         # Otherwise, we'll fall back to the default behavior.
         else:
@@ -81,16 +214,16 @@ class ZoomableCanvasView(QGraphicsView):
     # We'll override the mouseMoveEvent method to handle dragging functionality.
     def mouseMoveEvent(self, event):
 
-        # If our canvas is draggable and we have a last mouse position, we'll update the position of our canvas.
+        # If our canvas is draggable and we have a last mouse position, we'll pan our view.
         if self.canvas.is_draggable and self.last_mouse_pos:
 
             # We'll calculate the difference between the current mouse position and the last mouse position.
-            current_mouse_pos = self.mapToScene(event.pos())
+            current_mouse_pos = event.pos()
             delta = current_mouse_pos - self.last_mouse_pos
 
-            # Updating the position of our proxy widget (which moves our canvas).
-            proxy_pos = self.proxy_widget.pos()
-            self.proxy_widget.setPos(proxy_pos + delta)
+            # Scrolling our view in the opposite direction (which moves our canvas along with our mouse).
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
 
             # Updating the last mouse position.
             self.last_mouse_pos = current_mouse_pos
@@ -109,14 +242,14 @@ class ZoomableCanvasView(QGraphicsView):
             if event.button() == Qt.MouseButton.MiddleButton:
                 
                 # Setting our cursor to be an arrow cursor.
-                self.proxy_widget.setCursor(Qt.CursorShape.ArrowCursor)
+                self.canvas.setCursor(Qt.CursorShape.ArrowCursor)
                 
                 # Using our tool manager to set the current tool to the pencil tool.
                 self.tools.use_pencil_tool()
 
             # Otherwise, we'll set our cursor back to an open hand cursor as it's still draggable.
             else:
-                self.proxy_widget.setCursor(Qt.CursorShape.OpenHandCursor)
+                self.canvas.setCursor(Qt.CursorShape.OpenHandCursor)
 
             # Clearing the last mouse position.
             self.last_mouse_pos = None
@@ -47,7 +47,12 @@ class CustomMessageBox(QDialog):
         layout.addRow(icon, message_label)
 
         # Creating an OK button to close the message box.
-        self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok)
+        # (Questions get Yes/No buttons instead; we can check the answer via self.result() once closed.)
+        if type == "question":
+            self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Yes | QDialogButtonBox.StandardButton.No)
+            self.buttons.rejected.connect(self.reject)
+        else:
+            self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok)
         self.buttons.accepted.connect(self.accept)
         self.buttons.setStyleSheet(self.get_style())
 
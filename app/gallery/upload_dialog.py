@@ -13,7 +13,8 @@ from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from app.gallery.gallery_manager import GalleryManager
 from app.user_auth.auth_manager import AuthManager
 from app.custom_messagebox import CustomMessageBox
-from app.tools.validations import validate_dimensions, validate_imported_data
+from app.tools.validations import validate_dimensions, validate_imported_data, validate_layered_data
+from app.canvas.canvas_layers import CanvasLayers
 import ast
 
 # A file loader thread to handle loading .pix files in the background.
@@ -48,6 +49,10 @@ class FileLoaderThread(QThread):
             # Parsing our text file using the ast module. (Converting our string dict. to an actual dict.)
             pixels = ast.literal_eval(pixels)
 
+            # Layered projects are flattened into a single pixels dictionary (blending their visible layers), since that's what our gallery stores.
+            if validate_layered_data(pixels):
+                pixels = CanvasLayers.flatten_data(dimensions[0], dimensions[1], pixels)
+
             # Validating our pixels data to ensure that it's in the correct format.
             if not validate_imported_data(pixels):
                 self.error_occurred.emit("The data in the selected file is not in the correct format.")
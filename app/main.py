@@ -9,13 +9,16 @@ from PyQt6.QtGui import QGuiApplication, QColor, QIcon, QPixmap, QFont, QFontDat
 from PyQt6.QtCore import Qt, QSize, QTimer
 from main_window import MainWindow
 from app.canvas.new_sprite_dialog import NewSpriteDialog
+from canvas.canvas_journal import CanvasJournal
 from custom_messagebox import CustomMessageBox
-from app.tools.validations import validate_dimensions, validate_imported_data
+from app.tools.validations import validate_dimensions, validate_imported_data, validate_layered_data
 from gallery.gallery_manager import GalleryManager
 from gallery.gallery_widget import GalleryWidget, DimmedBackdrop
 from app.user_auth.auth_manager import AuthManager
 from app.user_auth.auth_dialogs import LoginDialog
+from tools.smart_filter import save_lookup_tables
 import ast
+import os
 
 # Our starting screen.
 class StartScreen(QMainWindow):
@@ -97,6 +100,56 @@ class StartScreen(QMainWindow):
         # Setting it as the central widget of our window.
         self.setCentralWidget(widget)
 
+        # Once our start screen is shown, we'll check for any work that can be recovered from a previous session.
+        QTimer.singleShot(0, self.offer_recovery)
+
+    # A method to offer to recover the work left behind by a previous session (i.e. after a crash).
+    def offer_recovery(self):
+
+        for journal_path in CanvasJournal.find_journals():
+            project_path = CanvasJournal.get_project_path(journal_path)
+            name = os.path.basename(project_path) if project_path else "an unsaved project"
+
+            # Asking the user whether they'd like to recover their work.
+            self.dimmed_backdrop.show()
+            box = CustomMessageBox(title   = "Recover your work?", 
+                                   message = f"Pixelate didn't close properly. Would you like to recover your work on {name}?", 
+                                   type    = "question")
+            self.dimmed_backdrop.hide()
+
+            # If not, we'll discard our journal.
+            if box.result() != QDialog.DialogCode.Accepted:
+                CanvasJournal.remove_journal(journal_path)
+                continue
+
+            try:
+                # Replaying our journal to recover our pixels.
+                width, height, layers, palette = CanvasJournal.replay(journal_path)
+            except Exception as e:
+                CustomMessageBox(title   = "ERROR: failed to recover project", 
+                                 message = str(e), 
+                                 type    = "warning")
+                CanvasJournal.remove_journal(journal_path)
+                continue
+
+            # Creating our main window with our recovered layers.
+            self.main_window = MainWindow((width, height))
+            if palette is not None:
+                self.main_window.canvas.set_indexed_mode(True, palette)
+            self.main_window.canvas.load_recovered_layers(layers)
+
+            # Restarting our journal from our recovered pixels (then removing the journal we've recovered from).
+            self.main_window.set_project_path(project_path)
+            if os.path.abspath(journal_path) != self.main_window.journal.path:
+                CanvasJournal.remove_journal(journal_path)
+
+            # Jumping straight to the main window.
+            self.main_window.showFullScreen()
+
+            # Closing our start screen.
+            self.close()
+            return
+
     # A method to open the Pixelate gallery.
     def open_gallery(self):
 
@@ -203,8 +256,8 @@ class StartScreen(QMainWindow):
                 # Parsing our text file using the ast module. (Converting our string dict. to an actual dict.)
                 pixels = ast.literal_eval(pixels)
 
-                # Validating our pixels data to ensure that it's in the correct format.
-                if not validate_imported_data(pixels):
+                # Validating our pixels data to ensure that it's in the correct format (either our layers, or a single pixels dictionary).
+                if not validate_layered_data(pixels) and not validate_imported_data(pixels):
                     CustomMessageBox(title   = "ERROR: invalid data format/type", 
                                      message = "The data in the selected file is not in the correct format.", 
                                      type    = "error")
@@ -221,11 +274,21 @@ class StartScreen(QMainWindow):
                     # Creating our main window with the imported dimensions.
                     self.main_window = MainWindow(dimensions)
 
-                    # Converting our pixels data to a dictionary of the form {(x,y): QColor}.
-                    pixels = self.main_window.canvas.convert_to_qcolor_format(pixels)
+                    # Setting up the layers of our canvas (older projects have a single pixels dictionary, which becomes our only layer).
+                    if validate_layered_data(pixels):
+                        canvas = self.main_window.canvas
+                        if "palette" in pixels:
+                            canvas.set_indexed_mode(True, pixels["palette"])
+                        canvas.replace_layers(canvas.convert_to_layers(pixels), pixels["active"])
+                    else:
+                        # Converting our pixels data to a dictionary of the form {(x,y): QColor}.
+                        pixels = self.main_window.canvas.convert_to_qcolor_format(pixels)
+
+                        # Setting the pixels data of our canvas.
+                        self.main_window.canvas.update_pixels(pixels)
 
-                    # Setting the pixels data of our canvas.
-                    self.main_window.canvas.update_pixels(pixels)
+                    # Our project's journal will be kept next to it.
+                    self.main_window.set_project_path(filepath)
 
                     # Jumping straight to the main window.
                     self.main_window.showFullScreen()
@@ -278,6 +341,10 @@ class StartScreen(QMainWindow):
         
 # Creating our application.
 app = QApplication([])
+
+# Persisting the colors we've daltonized once we quit (see CVDLookupTable).
+app.aboutToQuit.connect(save_lookup_tables)
+
 window = StartScreen()
 window.showFullScreen()
 app.exec()
\ No newline at end of file
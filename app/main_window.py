@@ -1,10 +1,10 @@
 from PyQt6.QtWidgets import ( QApplication, QMainWindow, QHBoxLayout, 
                               QVBoxLayout, QWidget, QGraphicsScene, 
-                              QGraphicsProxyWidget, QMenuBar, QMenu,
+                              QMenuBar, QMenu,
                               QFileDialog, QMessageBox, QSizePolicy,
                               QWidgetAction, QLabel, QDialog )
 
-from PyQt6.QtGui import QGuiApplication, QColor, QFont, QFontDatabase, QAction, QImage, QPainter
+from PyQt6.QtGui import QGuiApplication, QColor, QFont, QFontDatabase, QAction, QActionGroup, QImage, QPainter
 from PyQt6.QtCore import Qt
 from tools.tools import Tools
 import ast
@@ -12,6 +12,7 @@ import ast
 from canvas.pixelate_canvas import PixelateCanvas
 from canvas.color_selection_window import ColorSelectionWindow
 from canvas.zoomable_canvas_view import ZoomableCanvasView
+from canvas.canvas_journal import CanvasJournal
 from gallery.gallery_manager import GalleryManager
 from gallery.gallery_widget import GalleryWidget, DimmedBackdrop
 from gallery.upload_dialog import UploadDialog
@@ -19,7 +20,7 @@ from user_auth.auth_manager import AuthManager
 from user_auth.auth_dialogs import LoginDialog
 from pixi_ai.ai_assistant import AIAssistant
 from custom_messagebox import CustomMessageBox
-from app.tools.validations import validate_dimensions, validate_imported_data
+from app.tools.validations import validate_dimensions, validate_imported_data, validate_layered_data
 
 class MainWindow(QMainWindow):
     # Our constructor will invoke QMainWindow's constructor.
@@ -92,17 +93,19 @@ class MainWindow(QMainWindow):
         # Adding our left window to our main layout.
         layout.addWidget(left_window)
 
-        # Creating our canvas widget.
+        # Creating our canvas (a graphics item).
         self.canvas = PixelateCanvas(self.color_selection_window, self.pixel_size, self.grid_width, self.grid_height)
 
+        # Journaling the changes made to our canvas, so that our work can be recovered after a crash.
+        self.journal = CanvasJournal(self.canvas.get_layers())
+        self.canvas.set_journal(self.journal)
+
         # To achieve zoom functionality, we'll need the following:
-        self.scene        = QGraphicsScene()       # Creating a scene to hold our canvas.
-        self.proxy_widget = QGraphicsProxyWidget() # Creating a proxy widget that will be embedded in our view.
-        self.proxy_widget.setWidget(self.canvas)   # Setting our canvas as the proxy widget.
-        self.scene.addItem(self.proxy_widget)      # Adding the proxy widget to our scene (this embeds our canvas in the scene).
+        self.scene = QGraphicsScene()   # Creating a scene to hold our canvas.
+        self.scene.addItem(self.canvas) # Adding our canvas to our scene (our scene draws it directly).
 
         # To finalize our zoom functionality, we'll create a view to display our scene.
-        self.canvas_view = ZoomableCanvasView(self.scene, self.proxy_widget)
+        self.canvas_view = ZoomableCanvasView(self.scene, self.canvas)
         layout.addWidget(self.canvas_view)
 
         # Storing a reference of our canvas + main window in our AI assistant.
@@ -113,7 +116,7 @@ class MainWindow(QMainWindow):
         tool_window_width = 300
         # The height of our tools window will be the same as our left window.
         tool_window_height = left_window_height
-        self.tools = Tools(self.proxy_widget, tool_window_width, tool_window_height)
+        self.tools = Tools(self.canvas, tool_window_width, tool_window_height)
         self.canvas_view.set_tools(self.tools)
         layout.addWidget(self.tools)
 
@@ -129,15 +132,23 @@ class MainWindow(QMainWindow):
         # Setting the central widget of our application.
         self.setCentralWidget(window)
 
-    # A method to save our canvas to a text file (saving the pixels dictionary).
+    # A method to set the path of our project (i.e. once it's been saved or opened), which is where our journal is kept.
+    def set_project_path(self, filepath):
+        self.journal.set_project_path(filepath)
+
+    # Upon closing our window, our work has either been saved or discarded, so we'll remove our journal.
+    def closeEvent(self, event):
+        self.journal.close(discard=True)
+        super().closeEvent(event)
+
+    # A method to save our canvas to a text file (saving our layers, each with its encoded tiles).
     def save_canvas(self):
 
         # Displaying our dimmed backdrop.
         self.dimmed_backdrop.show()
 
-        # Retrieving our pixels dictionary (which contains the color of each pixel).
-        # We'd like to have our dictionary in the form {(x,y): rgba_tuple}.
-        pixels = self.canvas.convert_to_rgba_format()
+        # Retrieving our layers (each with its tiles, which contain the color of each of its pixels, see get_layers_data).
+        pixels = self.canvas.get_layers_data()
         pixels = pixels.__str__()
 
         # Opening a file dialog to prompt to the user to specify where they'd like to save their work.
@@ -149,8 +160,10 @@ class MainWindow(QMainWindow):
                 with open(filepath, "w") as file:
                     # Writing the dimensions of our canvas to the file.
                     file.write(f"({self.grid_width},{self.grid_height})\n")
-                    # Writing the pixels dictionary to the file.
+                    # Writing our layers to the file.
                     file.write(pixels)
+                # Our project is now saved, so we'll restart our journal next to it.
+                self.set_project_path(filepath)
                 CustomMessageBox(title   = "Success", 
                                  message = "Project saved successfully.", 
                                  type    = "info")
@@ -213,6 +226,15 @@ class MainWindow(QMainWindow):
                 # Parsing our text file using the ast module. (Converting our string dict. to an actual dict.)
                 pixels = ast.literal_eval(pixels)
 
+                # Projects with layers are added as new layers on top of ours (they can be undone by removing them).
+                if validate_layered_data(pixels):
+                    self.canvas.import_layers(self.canvas.convert_to_layers(pixels))
+                    CustomMessageBox(title   = "Success", 
+                                     message = "Project imported successfully.", 
+                                     type    = "info")
+                    self.dimmed_backdrop.hide()
+                    return
+
                 # Validating our pixels data to ensure that it's in the correct format.
                 if not validate_imported_data(pixels):
                     CustomMessageBox(title   = "ERROR: invalid data format/type", 
@@ -231,8 +253,10 @@ class MainWindow(QMainWindow):
                     # Converting our pixels data to a dictionary of the form {(x,y): QColor}.
                     pixels = self.canvas.convert_to_qcolor_format(pixels)
 
-                    # Updating the pixels data of our canvas.
+                    # Updating the pixels data of our canvas (as a single operation, so it can be undone and journaled).
+                    self.canvas.begin_operation()
                     self.canvas.update_pixels(pixels)
+                    self.canvas.commit_operation()
 
             except Exception as e:
                 CustomMessageBox(title   = "ERROR: failed to import project", 
@@ -243,6 +267,14 @@ class MainWindow(QMainWindow):
         # Hiding our dimmed backdrop.
         self.dimmed_backdrop.hide()
 
+    # A method to set the view mode of our canvas view (see ZoomableCanvasView).
+    def set_view_mode(self, mode, cvd_type=None, filter_mode="daltonize"):
+        self.canvas_view.set_view_mode(mode, cvd_type or "Protanopia", filter_mode)
+
+    # A method to switch our canvas to (or from) indexed colors.
+    def set_indexed_mode(self, indexed):
+        self.canvas.set_indexed_mode(indexed)
+
     # A method to export our canvas as a PNG image.
     def export_canvas(self):
 
@@ -258,13 +290,8 @@ class MainWindow(QMainWindow):
             return
 
         try:
-            # Create an image with the canvas size
-            image = QImage(self.canvas.canvas_buffer.size(), QImage.Format.Format_ARGB32)
-
-            # Use QPainter to render the canvas onto the image
-            painter = QPainter(image)
-            painter.drawPixmap(0, 0, self.canvas.canvas_buffer)
-            painter.end()
+            # Create an image of our canvas, scaled up to its on-screen size.
+            image = self.canvas.render_image()
 
             # Save the image as PNG
             if image.save(file_path, "PNG"):
@@ -419,6 +446,37 @@ class MainWindow(QMainWindow):
         export_action.triggered.connect(self.export_canvas)
         file_menu.addAction(export_action) 
 
+        # Creating an action to switch our canvas to (or from) indexed colors, where each pixel stores an index into our palette.
+        self.indexed_action = QAction("Indexed Colors", self)
+        self.indexed_action.setCheckable(True)
+        self.indexed_action.triggered.connect(self.set_indexed_mode)
+        file_menu.addAction(self.indexed_action)
+
+        # Creating a view menu, to compare our canvas with its filtered versions (side by side, or all at once).
+        view_menu = menubar.addMenu("View")
+        view_group = QActionGroup(self)
+        # Our comparisons either daltonize our canvas, or simulate how it's seen.
+        view_modes = [("Single View", "single", None, "daltonize"), None,
+                      ("Compare with Protanopia", "split", "Protanopia", "daltonize"),
+                      ("Compare with Deuteranopia", "split", "Deuteranopia", "daltonize"),
+                      ("Compare with Tritanopia", "split", "Tritanopia", "daltonize"),
+                      ("Compare All (Quad View)", "quad", None, "daltonize"), None,
+                      ("Simulate Protanopia", "split", "Protanopia", "simulate"),
+                      ("Simulate Deuteranopia", "split", "Deuteranopia", "simulate"),
+                      ("Simulate Tritanopia", "split", "Tritanopia", "simulate"),
+                      ("Simulate All (Quad View)", "quad", None, "simulate")]
+        for view_mode in view_modes:
+            if view_mode is None:
+                view_menu.addSeparator()
+                continue
+            label, mode, cvd_type, filter_mode = view_mode
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(mode == "single")
+            action.triggered.connect(lambda checked, mode=mode, cvd_type=cvd_type, filter_mode=filter_mode: self.set_view_mode(mode, cvd_type, filter_mode))
+            view_group.addAction(action)
+            view_menu.addAction(action)
+
         # Creating a menu for our gallery.
         gallery_menu = menubar.addMenu("Gallery")
 
@@ -288,8 +288,8 @@ class AIAssistant(QWidget):
             # If we have valid image data, we'll store it in our canvas.
             if image_data and self.canvas:
 
-                # We'll save the current state of our canvas before updating it with the generated image.
-                self.canvas.canvas_history.save_state_and_update(self.canvas.pixels, self.canvas.canvas_buffer)
+                # We'll record the changes made to our canvas while updating it with the generated image.
+                self.canvas.begin_operation()
 
                 # Using our image data, we'll create a QImage object.
                 image = QImage()
@@ -302,8 +302,9 @@ class AIAssistant(QWidget):
                                      Qt.AspectRatioMode.IgnoreAspectRatio, 
                                      Qt.TransformationMode.FastTransformation)
                 
-                # Storing the generated image in our canvas.
+                # Storing the generated image in our canvas, then saving our changes in our canvas history.
                 self.canvas.set_generated_image(image)
+                self.canvas.commit_operation()
 
         # Closing the dimmed backdrop after the image generation dialog is closed.
         self.backdrop.close()
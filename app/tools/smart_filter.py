@@ -1,59 +1,162 @@
 from PyQt6.QtGui import QColor
+from PyQt6.QtCore import QStandardPaths
 import numpy as np
+import glob
+import zlib
+import os
 
-def rgb_to_lms(r, g, b):
-    L = (17.8824 * r) + (43.5161 * g) + (4.11935 * b)
-    M = (3.45565 * r) + (27.1554 * g) + (3.86714 * b)
-    S = (0.0299566 * r) + (0.184309 * g) + (1.46709 * b)
-    return np.array([L, M, S])
+# Converting RGB to LMS (the responses of our long, medium and short cones).
+RGB_TO_LMS = np.array([[17.8824, 43.5161, 4.11935],
+                       [3.45565, 27.1554, 3.86714],
+                       [0.0299566, 0.184309, 1.46709]])
 
-def simulate_cvd(lms, cvd_matrix):
-    return np.dot(cvd_matrix, lms)
+# Converting LMS back to RGB.
+LMS_TO_RGB = np.array([[0.0809444479, -0.130504409, 0.116721066],
+                       [-0.0102485335, 0.0540193266, -0.113614708],
+                       [-0.000365296938, -0.00412161469, 0.693511405]])
 
-def lms_to_rgb(l, m, s):
-    r = (0.0809444479 * l) + (-0.130504409 * m) + (0.116721066 * s)
-    g = (-0.0102485335 * l) + (0.0540193266 * m) + (-0.113614708 * s)
-    b = (-0.000365296938 * l) + (-0.00412161469 * m) + (0.693511405 * s)
-    return np.array([r, g, b])
+# Shifting the error (the colors we can't see) towards the colors we can see.
+ERROR_MODIFICATIONS = np.array([[0.0, 0.0, 0.0],
+                                [0.7, 1.0, 0.0],
+                                [0.7, 0.0, 1.0]])
 
-def apply_error_modifications(r, g, b):
-    R = 0.0 * r + 0.0 * g + 0.0 * b
-    G = 0.7 * r + 1.0 * g + 0.0 * b
-    B = 0.7 * r + 0.0 * g + 1.0 * b
-    return np.array([R, G, B])
+# Color Vision Deficiency matrices
+CVD_MATRICES = {
+    "Protanopia": np.array([[0.0, 2.02344, -2.52581],
+                            [0.0, 1.0, 0.0],
+                            [0.0, 0.0, 1.0]]),
+    "Deuteranopia": np.array([[1.0, 0.0, 0.0],
+                              [0.494207, 0.0, 1.24827],
+                              [0.0, 0.0, 1.0]]),
+    "Tritanopia": np.array([[1.0, 0.0, 0.0],
+                            [0.0, 1.0, 0.0],
+                            [-0.395913, 0.801109, 0.0]])
+}
+
+# Every step of daltonizing a color is linear (up to our final clip), so we'll precompose them into a single matrix per CVD type:
+# simulated = LMS_TO_RGB . CVD . RGB_TO_LMS . rgb, error = rgb - simulated, daltonized = rgb + ERROR_MODIFICATIONS . error
+def compose_daltonize_matrix(cvd_matrix):
+    simulate = LMS_TO_RGB @ cvd_matrix @ RGB_TO_LMS
+    return np.eye(3) + ERROR_MODIFICATIONS @ (np.eye(3) - simulate)
+
+# Our matrices are transposed, to apply them to rows of colors.
+DALTONIZE_MATRICES = {cvd_type: compose_daltonize_matrix(cvd_matrix).T.astype(np.float32) for cvd_type, cvd_matrix in CVD_MATRICES.items()}
+
+# Simulating a CVD (what a viewer with it sees) is linear as well: simulated = LMS_TO_RGB . CVD . RGB_TO_LMS . rgb.
+# Milder deficiencies (anomalous trichromacy) are simulated by interpolating from the identity (0% severity) to that matrix (100%).
+# We'll precompute our (transposed) matrices for each whole percent of severity.
+SIMULATION_MATRICES = {
+    cvd_type: np.array([(1 - severity / 100) * np.eye(3) + (severity / 100) * (LMS_TO_RGB @ cvd_matrix @ RGB_TO_LMS)
+                        for severity in range(101)]).transpose(0, 2, 1).astype(np.float32)
+    for cvd_type, cvd_matrix in CVD_MATRICES.items()
+}
+
+# Applies a (transposed) 3 x 3 matrix to an array of uint8 colors (N x 3, or any shape whose last axis holds 3 or 4 channels,
+# i.e. an H x W x 4 image), clipping the results. Alpha is left as is.
+def transform_colors(colors, matrix):
+    colors = np.asarray(colors, dtype=np.uint8)
+    transformed = colors.copy()
+    rgb = colors[..., :3].astype(np.float32) @ matrix
+    transformed[..., :3] = np.rint(np.clip(rgb, 0, 255))
+    return transformed
+
+# Daltonizes an array of uint8 colors (see transform_colors).
+def daltonize_colors(colors, cvd_type):
+    if cvd_type not in DALTONIZE_MATRICES:
+        return colors
+    return transform_colors(colors, DALTONIZE_MATRICES[cvd_type])
+
+# Simulates how a viewer with the given CVD (at a severity from 0 to 100 percent) sees an array of uint8 colors (see transform_colors).
+def simulate_colors(colors, cvd_type, severity=100):
+    if cvd_type not in SIMULATION_MATRICES:
+        return colors
+    return transform_colors(colors, SIMULATION_MATRICES[cvd_type][max(0, min(int(round(severity)), 100))])
+
+'''
+    A class to look up the daltonized versions of single colors (for our per-color hot paths, i.e. previews and our selected colors).
+    Rather than a full 24-bit table (48 MB per CVD type), we'll lazily fill an exact cache of the colors we've actually daltonized,
+    mapping each packed 24-bit color to its packed daltonized color. Our cache is persisted to our cache directory
+    (see save_lookup_tables), so the colors of a project are only ever daltonized once, even across restarts.
+
+    Our persisted cache is named after our format version and a hash of our daltonization matrix, so a cache written
+    by another version of Pixelate (or for a since-changed matrix) is never loaded; it's discarded once we save ours.
+'''
+class CVDLookupTable:
+
+    # The maximum number of colors we'll persist (4 MB on disk).
+    MAX_SAVED_COLORS = 1 << 19
+
+    # The version of our persisted format.
+    FORMAT_VERSION = 1
+
+    def __init__(self, cvd_type):
+        self.cvd_type = cvd_type
+        self.colors   = None
+        self.modified = False
+        self.matrix_hash = zlib.crc32(DALTONIZE_MATRICES[cvd_type].tobytes())
+
+    # A static method to get our cache directory.
+    @staticmethod
+    def get_cache_dir():
+        cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation)
+        return os.path.abspath(os.path.join(cache_dir or os.path.expanduser("~"), "Pixelate", "cvd"))
+
+    # A method to get the path of our persisted cache (i.e. protanopia-v1-1a2b3c4d.npy).
+    def get_path(self):
+        return os.path.join(self.get_cache_dir(), f"{self.cvd_type.lower()}-v{self.FORMAT_VERSION}-{self.matrix_hash:08x}.npy")
+
+    # A method to load our persisted cache (a 2 x N array of packed colors and their daltonized colors), if there is one.
+    # A missing, corrupted or mismatched cache simply starts out empty.
+    def load(self):
+        self.colors = {}
+        try:
+            cache = np.load(self.get_path())
+            if cache.dtype != np.uint32 or cache.ndim != 2 or len(cache) != 2:
+                raise ValueError("Mismatched CVD cache")
+            keys, values = cache
+            self.colors = dict(zip(keys.tolist(), values.tolist()))
+        except (OSError, ValueError):
+            pass
+
+    # A method to persist our cache (if we've added colors to it since we loaded it).
+    def save(self):
+        if not self.modified:
+            return
+        items = list(self.colors.items())[:self.MAX_SAVED_COLORS]
+        try:
+            os.makedirs(self.get_cache_dir(), exist_ok=True)
+            np.save(self.get_path(), np.array(items, dtype=np.uint32).reshape(-1, 2).T)
+            self.modified = False
+
+            # Discarding our stale caches (written by other versions, or for other matrices).
+            for path in glob.glob(os.path.join(self.get_cache_dir(), self.cvd_type.lower() + "*.npy")):
+                if os.path.abspath(path) != self.get_path():
+                    os.remove(path)
+        except OSError:
+            pass
+
+    # A method to get the daltonized version of a single (r, g, b) color, as an (r, g, b) tuple.
+    def lookup(self, r, g, b):
+        if self.colors is None:
+            self.load()
+        key = (r << 16) | (g << 8) | b
+        value = self.colors.get(key)
+        if value is None:
+            r, g, b = daltonize_colors(np.array([r, g, b]), self.cvd_type).tolist()
+            value = self.colors[key] = (r << 16) | (g << 8) | b
+            self.modified = True
+        return value >> 16, (value >> 8) & 0xFF, value & 0xFF
+
+# Our lookup tables, per CVD type.
+LOOKUP_TABLES = {cvd_type: CVDLookupTable(cvd_type) for cvd_type in DALTONIZE_MATRICES}
+
+# Persists our lookup tables (i.e. once our application quits).
+def save_lookup_tables():
+    for lookup_table in LOOKUP_TABLES.values():
+        lookup_table.save()
 
 def daltonize(qcolor, cvd_type):
-    if cvd_type != "Protanopia" and cvd_type != "Deuteranopia" and cvd_type != "Tritanopia":
+    if cvd_type not in LOOKUP_TABLES:
         return qcolor
 
-    r, g, b = qcolor.redF(), qcolor.greenF(), qcolor.blueF()
-
-    # Convert RGB to LMS
-    lms = rgb_to_lms(r, g, b)
-
-    # Color Vision Deficiency matrices
-    CVDMatrix = {
-        "Protanopia": np.array([[0.0, 2.02344, -2.52581],
-                                [0.0, 1.0, 0.0],
-                                [0.0, 0.0, 1.0]]),
-        "Deuteranopia": np.array([[1.0, 0.0, 0.0],
-                                  [0.494207, 0.0, 1.24827],
-                                  [0.0, 0.0, 1.0]]),
-        "Tritanopia": np.array([[1.0, 0.0, 0.0],
-                                [0.0, 1.0, 0.0],
-                                [-0.395913, 0.801109, 0.0]])
-    }
-
-    cvd_matrix = CVDMatrix[cvd_type]
-    simulated_lms = simulate_cvd(lms, cvd_matrix)
-    simulated_rgb = lms_to_rgb(*simulated_lms)
-
-    # Calculate error matrix
-    error = np.array([r, g, b]) - simulated_rgb
-
-    # Apply error modifications
-    compensation = apply_error_modifications(*error)
-    final_rgb = np.clip(compensation + np.array([r, g, b]), 0, 1)
-
-    # Convert back to QColor
-    return QColor.fromRgbF(*final_rgb)
\ No newline at end of file
+    return QColor(*LOOKUP_TABLES[cvd_type].lookup(qcolor.red(), qcolor.green(), qcolor.blue()))
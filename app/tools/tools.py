@@ -1,8 +1,8 @@
 # Importing basic widgets from PyQt6.
-from PyQt6.QtWidgets import QMainWindow, QPushButton, QVBoxLayout, QWidget, QApplication, QHBoxLayout, QMenu
+from PyQt6.QtWidgets import QMainWindow, QPushButton, QVBoxLayout, QWidget, QApplication, QHBoxLayout, QMenu, QWidgetAction, QSlider, QLabel
 # Importing the necessary modules to work with canvas drawings.
-from PyQt6.QtGui import QPainter, QColor, QIcon, QPixmap, QCursor, QFont
-from PyQt6.QtCore import Qt, QSize, QPoint
+from PyQt6.QtGui import QPainter, QColor, QIcon, QPixmap, QCursor, QFont, QActionGroup
+from PyQt6.QtCore import Qt, QSize, QPoint, QTimer, pyqtSignal
 # Importing our canvas class.
 from canvas.pixelate_canvas import PixelateCanvas
 from canvas.canvas_history import CanvasHistory
@@ -10,12 +10,11 @@ from canvas.canvas_history import CanvasHistory
 class Tools(QMainWindow):
     
     # Our constructor will initialize our tools window.
-    # We provide our canvas (through our proxy widget) to handle canvas operations with our tools.
-    def __init__(self, proxy_widget, width, height):
+    # We provide our canvas to handle canvas operations with our tools.
+    def __init__(self, canvas, width, height):
 
         super().__init__()
-        self.proxy_widget = proxy_widget
-        self.canvas       = self.proxy_widget.widget()
+        self.canvas       = canvas
         self.width        = width
         self.height       = height
 
@@ -71,15 +70,40 @@ class Tools(QMainWindow):
         layout.addLayout(top_row_layout)
 
         # Our fill tool will be next.
-        button = QPushButton()
-        button.setStyleSheet(self.get_default_button_style())
-        button.setIcon(QIcon(self.icons_path + "fill_icon.png"))
-        button.setIconSize(self.icon_size)
+        self.fill_button = FilterButton()
+        self.fill_button.setStyleSheet(self.get_default_button_style())
+        self.fill_button.setIcon(QIcon(self.icons_path + "fill_icon.png"))
+        self.fill_button.setIconSize(self.icon_size)
 
-        # Connecting its signal to a function that will set the canvas's fill mode to True.
-        button.clicked.connect(lambda: self.set_fill_mode(True))
-        self.tools.append(button)
-        layout.addWidget(button)
+        # Creating a dropdown menu for our fill options.
+        self.fill_menu = QMenu(self)
+
+        # Our fill modes: filling connected cells, or replacing a color everywhere on our canvas.
+        self.add_option_actions(self.fill_menu, [("Contiguous", True), ("Replace Color", False)], self.canvas.set_fill_contiguous)
+
+        # How close a color must be to the color we're filling to be filled as well (0 for an exact match).
+        self.tolerance_menu = self.fill_menu.addMenu("Tolerance")
+        self.tolerance_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.tolerance_menu, [("Exact", 0), ("5", 5), ("10", 10), ("20", 20), ("40", 40)], self.canvas.set_fill_tolerance)
+
+        # How we measure the distance between colors.
+        self.metric_menu = self.fill_menu.addMenu("Distance")
+        self.metric_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.metric_menu, [("RGBA", "rgba"), ("Lab \u0394E", "lab")], self.canvas.set_fill_metric)
+
+        # Whether we fill with a single color, or a gradient from our primary to our secondary color (dragged from start to end).
+        self.gradient_menu = self.fill_menu.addMenu("Gradient")
+        self.gradient_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.gradient_menu, [("None", None), ("Linear", "linear"), ("Radial", "radial")], self.canvas.set_fill_gradient)
+
+        self.fill_menu.setStyleSheet(self.get_menu_style())
+
+        # Connecting its signals to functions that will set the canvas's fill mode to True (or show our fill options).
+        self.fill_button.clicked.connect(lambda: self.set_fill_mode(True))
+        self.fill_button.options_requested.connect(self.show_fill_menu)
+        self.fill_button.setMenu(self.fill_menu)
+        self.tools.append(self.fill_button)
+        layout.addWidget(self.fill_button)
 
         # Our eyedropper tool:
         button = QPushButton()
@@ -103,27 +127,41 @@ class Tools(QMainWindow):
         self.tools.append(button)
         layout.addWidget(button)
 
-        # Our pencil tool:
-        button = QPushButton()
-        button.setStyleSheet(self.get_active_button_style())
-        button.setIcon(QIcon(self.icons_path + "pencil.png"))
+        # Our pencil and eraser tools share a brush, whose size and shape are chosen from the following menu.
+        self.brush_menu = QMenu(self)
+        self.brush_menu.setStyleSheet(self.get_menu_style())
+        self.brush_size_menu = self.brush_menu.addMenu("Size")
+        self.brush_size_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.brush_size_menu, [(str(size), size) for size in (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)], self.canvas.set_brush_size)
+        self.brush_shape_menu = self.brush_menu.addMenu("Shape")
+        self.brush_shape_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.brush_shape_menu, [("Square", "square"), ("Round", "round"), ("Dithered", "dithered")], self.canvas.set_brush_shape)
 
-        # Connecting its signal to a function that will allow us to draw.
-        button.clicked.connect(self.use_pencil_tool)
-        button.setIconSize(self.icon_size)
-        self.tools.append(button)
-        layout.addWidget(button)
+        # Our pencil tool:
+        self.pencil_button = FilterButton()
+        self.pencil_button.setStyleSheet(self.get_active_button_style())
+        self.pencil_button.setIcon(QIcon(self.icons_path + "pencil.png"))
+
+        # Connecting its signals to functions that will allow us to draw (or show our brush options).
+        self.pencil_button.clicked.connect(self.use_pencil_tool)
+        self.pencil_button.options_requested.connect(self.show_pencil_menu)
+        self.pencil_button.setMenu(self.brush_menu)
+        self.pencil_button.setIconSize(self.icon_size)
+        self.tools.append(self.pencil_button)
+        layout.addWidget(self.pencil_button)
 
         # Our eraser tool:
-        button = QPushButton()
-        button.setStyleSheet(self.get_default_button_style())
-        button.setIcon(QIcon(self.icons_path + "eraser_icon.png"))
-
-        # Connecting its signal to a function that will allow us to erase (drawing w/ our background color).
-        button.clicked.connect(self.use_erase_tool)
-        button.setIconSize(self.icon_size)
-        self.tools.append(button)
-        layout.addWidget(button)
+        self.eraser_button = FilterButton()
+        self.eraser_button.setStyleSheet(self.get_default_button_style())
+        self.eraser_button.setIcon(QIcon(self.icons_path + "eraser_icon.png"))
+
+        # Connecting its signals to functions that will allow us to erase (or show our brush options).
+        self.eraser_button.clicked.connect(self.use_erase_tool)
+        self.eraser_button.options_requested.connect(self.show_eraser_menu)
+        self.eraser_button.setMenu(self.brush_menu)
+        self.eraser_button.setIconSize(self.icon_size)
+        self.tools.append(self.eraser_button)
+        layout.addWidget(self.eraser_button)
 
         # Our line tool:
         button = QPushButton()
@@ -137,29 +175,37 @@ class Tools(QMainWindow):
         self.tools.append(button)
         layout.addWidget(button)
 
-        # Our square tool:
-        button = QPushButton()
-        button.setStyleSheet(self.get_default_button_style())
-        button.setIcon(QIcon(self.icons_path + "square_icon.png"))
-        button.setIconSize(self.icon_size)
-
-        # Connecting its signal to a function that will set our drag state to True.
-        button.clicked.connect(self.use_square_tool)
-        button.setIconSize(self.icon_size)
-        self.tools.append(button)
-        layout.addWidget(button)
-
-        # Our circle tool:
-        button = QPushButton()
-        button.setStyleSheet(self.get_default_button_style())
-        button.setIcon(QIcon(self.icons_path + "circle_icon.png"))
-        button.setIconSize(self.icon_size)
-
-        # Connecting its signal to a function that will set our drag state to True.
-        button.clicked.connect(self.use_circle_tool)
-        button.setIconSize(self.icon_size)
-        self.tools.append(button)
-        layout.addWidget(button)
+        # Our square tool (with a menu to choose between outlined and filled squares):
+        self.square_button = FilterButton()
+        self.square_button.setStyleSheet(self.get_default_button_style())
+        self.square_button.setIcon(QIcon(self.icons_path + "square_icon.png"))
+        self.square_button.setIconSize(self.icon_size)
+        self.square_menu = QMenu(self)
+        self.square_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.square_menu, [("Outline", False), ("Filled", True)], self.canvas.set_square_filled)
+
+        # Connecting its signals to functions that will set our square tool state to True (or show our square options).
+        self.square_button.clicked.connect(self.use_square_tool)
+        self.square_button.options_requested.connect(self.show_square_menu)
+        self.square_button.setMenu(self.square_menu)
+        self.tools.append(self.square_button)
+        layout.addWidget(self.square_button)
+
+        # Our circle tool (with a menu to choose between outlined and filled circles):
+        self.circle_button = FilterButton()
+        self.circle_button.setStyleSheet(self.get_default_button_style())
+        self.circle_button.setIcon(QIcon(self.icons_path + "circle_icon.png"))
+        self.circle_button.setIconSize(self.icon_size)
+        self.circle_menu = QMenu(self)
+        self.circle_menu.setStyleSheet(self.get_menu_style())
+        self.add_option_actions(self.circle_menu, [("Outline", False), ("Filled", True)], self.canvas.set_circle_filled)
+
+        # Connecting its signals to functions that will set our circle tool state to True (or show our circle options).
+        self.circle_button.clicked.connect(self.use_circle_tool)
+        self.circle_button.options_requested.connect(self.show_circle_menu)
+        self.circle_button.setMenu(self.circle_menu)
+        self.tools.append(self.circle_button)
+        layout.addWidget(self.circle_button)
 
         # Our LMS tool:
         self.lms_button = FilterButton()
@@ -176,6 +222,35 @@ class Tools(QMainWindow):
         self.deuteranopia_action.setCheckable(True)
         self.tritanopia_action.setCheckable(True)
 
+        # Our simulations show how a viewer with each CVD sees our canvas (rather than daltonizing it).
+        self.simulate_menu = self.lms_menu.addMenu("Simulate")
+        self.simulate_menu.setStyleSheet(self.get_menu_style())
+        self.simulation_actions = {}
+        for cvd_type in ("Protanopia", "Deuteranopia", "Tritanopia"):
+            action = self.simulate_menu.addAction(cvd_type, lambda cvd_type=cvd_type: self.use_simulation_filter(cvd_type))
+            action.setCheckable(True)
+            self.simulation_actions[cvd_type] = action
+
+        # The severity of our simulations (from 0 to 100 percent), which re-renders our canvas as we drag our slider.
+        # Our slider moves faster than a large canvas re-renders, so we'll coalesce its moves (only applying our latest severity).
+        self.severity_label = QLabel("Severity: 100%")
+        self.severity_slider = QSlider(Qt.Orientation.Horizontal)
+        self.severity_slider.setRange(0, 100)
+        self.severity_slider.setValue(100)
+        self.severity_slider.valueChanged.connect(self.set_simulation_severity)
+        self.severity_timer = QTimer(self)
+        self.severity_timer.setSingleShot(True)
+        self.severity_timer.setInterval(30)
+        self.severity_timer.timeout.connect(self.apply_simulation_severity)
+        severity_widget = QWidget()
+        severity_layout = QVBoxLayout(severity_widget)
+        severity_layout.addWidget(self.severity_label)
+        severity_layout.addWidget(self.severity_slider)
+        severity_action = QWidgetAction(self.simulate_menu)
+        severity_action.setDefaultWidget(severity_widget)
+        self.simulate_menu.addSeparator()
+        self.simulate_menu.addAction(severity_action)
+
         self.lms_menu.setStyleSheet(self.get_menu_style())
 
         # Connect smart filter menu to the button.
@@ -185,6 +260,19 @@ class Tools(QMainWindow):
         self.tools.append(self.lms_button)
         layout.addWidget(self.lms_button)
 
+        # Our layers button (with a menu to choose our active layer and to manage our layers).
+        self.layers_button = FilterButton()
+        self.layers_button.setText("Layers")
+        self.layers_button.setStyleSheet(self.get_default_button_style())
+        self.layers_menu = QMenu(self)
+        self.layers_menu.setStyleSheet(self.get_menu_style())
+
+        # Our menu lists our current layers, so it's rebuilt every time it's shown.
+        self.layers_menu.aboutToShow.connect(self.update_layers_menu)
+        self.layers_button.clicked.connect(self.show_layers_menu)
+        self.layers_button.setMenu(self.layers_menu)
+        layout.addWidget(self.layers_button)
+
         # Creating an intermediary widget to hold our layout.
         window = QWidget()
         window.setLayout(layout)
@@ -197,15 +285,95 @@ class Tools(QMainWindow):
 
     # A method to show the LMS menu.
     def show_lms_menu(self):
-        menu = self.lms_button.getMenu()
+        self.show_button_menu(self.lms_button)
+
+    # A method to show our layers menu.
+    def show_layers_menu(self):
+        self.show_button_menu(self.layers_button)
+
+    # A method to rebuild our layers menu: our layers (from top to bottom, with our active layer checked),
+    # followed by the actions we can take on our active layer.
+    def update_layers_menu(self):
+        self.layers_menu.clear()
+        layers = self.canvas.get_layers()
+        active_index = layers.get_active_index()
+        active_layer = layers.get_active_layer()
+
+        group = QActionGroup(self.layers_menu)
+        for index in reversed(range(layers.get_layer_count())):
+            layer = layers.get_layer(index)
+            label = layer.name if layer.visible else f"{layer.name} (hidden)"
+            action = self.layers_menu.addAction(label, lambda index=index: self.canvas.set_active_layer(index))
+            action.setCheckable(True)
+            action.setChecked(index == active_index)
+            group.addAction(action)
+        self.layers_menu.addSeparator()
+
+        self.layers_menu.addAction("New Layer", self.canvas.add_layer)
+        action = self.layers_menu.addAction("Delete Layer", lambda: self.canvas.remove_layer(active_index))
+        action.setEnabled(layers.get_layer_count() > 1)
+        self.layers_menu.addAction("Move Up", lambda: self.canvas.move_layer(active_index, active_index + 1))
+        self.layers_menu.addAction("Move Down", lambda: self.canvas.move_layer(active_index, active_index - 1))
+        action = self.layers_menu.addAction("Visible", lambda: self.canvas.set_layer_visible(active_index, not active_layer.visible))
+        action.setCheckable(True)
+        action.setChecked(active_layer.visible)
+
+        opacity_menu = self.layers_menu.addMenu("Opacity")
+        opacity_menu.setStyleSheet(self.get_menu_style())
+        group = QActionGroup(opacity_menu)
+        for opacity in (100, 75, 50, 25):
+            action = opacity_menu.addAction(f"{opacity}%", lambda opacity=opacity: self.canvas.set_layer_opacity(active_index, opacity))
+            action.setCheckable(True)
+            action.setChecked(active_layer.opacity == opacity)
+            group.addAction(action)
+
+    # A method to use our fill tool and show our fill options.
+    def show_fill_menu(self):
+        self.set_fill_mode(True)
+        self.show_button_menu(self.fill_button)
+
+    # A method to use our pencil tool and show our brush options.
+    def show_pencil_menu(self):
+        self.use_pencil_tool()
+        self.show_button_menu(self.pencil_button)
+
+    # A method to use our eraser tool and show our brush options.
+    def show_eraser_menu(self):
+        self.use_erase_tool()
+        self.show_button_menu(self.eraser_button)
+
+    # A method to use our square tool and show our square options.
+    def show_square_menu(self):
+        self.use_square_tool()
+        self.show_button_menu(self.square_button)
+
+    # A method to use our circle tool and show our circle options.
+    def show_circle_menu(self):
+        self.use_circle_tool()
+        self.show_button_menu(self.circle_button)
+
+    # A method to add a group of mutually exclusive options to a menu, given a list of (label, value) pairs.
+    # Choosing an option calls our setter with its value. Our first option is checked by default.
+    def add_option_actions(self, menu, options, setter):
+        group = QActionGroup(self)
+        for index, (label, value) in enumerate(options):
+            action = menu.addAction(label, lambda value=value: setter(value))
+            action.setCheckable(True)
+            action.setChecked(index == 0)
+            group.addAction(action)
+        return group
+
+    # A method to show the menu of one of our (filter) buttons.
+    def show_button_menu(self, button):
+        menu = button.getMenu()
         
-        # Get the lms_button's rect.
-        rect = self.lms_button.rect()
+        # Get the button's rect.
+        rect = button.rect()
 
         # Get the bottom right corner of the rect and map it to global coordinates.
-        bottom_right = self.lms_button.mapToGlobal(rect.bottomRight())
+        bottom_right = button.mapToGlobal(rect.bottomRight())
 
-        # Show the menu at the bottom right corner of the lms_button.
+        # Show the menu at the bottom right corner of the button.
         menu_width = menu.sizeHint().width()
 
         # Calculate the x and y positions for the menu.
@@ -218,45 +386,31 @@ class Tools(QMainWindow):
 
     def clear_canvas(self):
 
-        # Saving our current canvas state to allow for undo functionality.
-        self.canvas.canvas_history.save_state_and_update(self.canvas.pixels, self.canvas.canvas_buffer)
+        # Recording the pixels we clear to allow for undo functionality.
+        self.canvas.begin_operation()
         
-        # Clearing our dictionary of pixels.
-        self.canvas.pixels = {}
+        # Clearing our pixel store.
+        self.canvas.pixels.clear()
+        self.canvas.commit_operation()
 
-        # Resetting our canvas buffer to an empty grid.
-        self.canvas.canvas_buffer = self.canvas.grid.copy()
+        # Resetting the tiles of our canvas buffer that had been painted.
+        self.canvas.refresh_dirty_tiles()
 
         # Clearing our preview pixel.
         self.canvas.preview_pixel = None
 
-        # Clearing our generated image.
-        self.canvas.generated_image = None
-
         # Redrawing a brand new canvas.
-        self.canvas.update()
+        self.canvas.request_repaint()
 
     def undo(self):
 
-        # Calling the undo method of our canvas history object.
-        # It will return the last state of our canvas which we'll update our canvas with.
-        pixels, last_buffer = self.canvas.canvas_history.undo(self.canvas.pixels, self.canvas.canvas_buffer)
-        self.canvas.pixels = pixels
-        self.canvas.canvas_buffer = last_buffer
-        
-        # Redrawing our canvas.
-        self.canvas.update()
+        # Our canvas reverts the pixels of our last change, then redraws only the region that changed.
+        self.canvas.undo()
         
     def redo(self):
-        
-        # Calling the redo method of our canvas history object.
-        # It will return the last state of our canvas which we'll update our canvas with.
-        pixels, last_buffer = self.canvas.canvas_history.redo(self.canvas.pixels, self.canvas.canvas_buffer)
-        self.canvas.pixels = pixels
-        self.canvas.canvas_buffer = last_buffer
 
-        # Redrawing our canvas.
-        self.canvas.update()
+        # Our canvas reapplies the pixels of our last undone change, then redraws only the region that changed.
+        self.canvas.redo()
 
     def set_fill_mode(self, fill_mode):
 
@@ -508,10 +662,8 @@ class Tools(QMainWindow):
         self.active_tools[1] = self.tools[8]
 
         # Check if the filter is already active...
-        if self.canvas.is_filter_on and self.canvas.filter_type == cvd_type:
-            # Turn off the filter.
-            self.canvas.is_filter_on = False
-            self.canvas.filter_type = None
+        if self.canvas.is_filter_active(cvd_type):
+            # Turn off the filter (showing our unfiltered canvas buffer again).
             self.canvas.restore_buffer()
             self.canvas.color_selection_window.restore_color_palette()
             self.active_tools[1] = None
@@ -545,10 +697,42 @@ class Tools(QMainWindow):
                 self.deuteranopia_action.setChecked(False)
                 self.tritanopia_action.setChecked(True)
 
+        # Daltonizing replaces any simulation.
+        for action in self.simulation_actions.values():
+            action.setChecked(False)
+
         # Update the canvas
-        self.canvas.update()
+        self.canvas.request_repaint()
+        self.update_button_styles()
+
+    # A method to simulate how a viewer with the given CVD sees our canvas (or to stop simulating it, if we already are).
+    def use_simulation_filter(self, cvd_type):
+        turning_off = self.canvas.is_filter_active(cvd_type, "simulate")
+        self.canvas.simulate_canvas(cvd_type)
+        self.active_tools[1] = None if turning_off else self.tools[8]
+
+        # Our palette isn't simulated (we're checking our canvas), so we'll show its original colors.
+        self.canvas.color_selection_window.restore_color_palette()
+
+        # Only our simulation's action stays checked (simulating replaces any daltonization).
+        self.protanopia_action.setChecked(False)
+        self.deuteranopia_action.setChecked(False)
+        self.tritanopia_action.setChecked(False)
+        for simulated_type, action in self.simulation_actions.items():
+            action.setChecked(not turning_off and simulated_type == cvd_type)
+
         self.update_button_styles()
 
+    # A method to set the severity of our simulations (from 0 to 100 percent), once our slider's pending moves have been coalesced.
+    def set_simulation_severity(self, severity):
+        self.severity_label.setText(f"Severity: {severity}%")
+        if not self.severity_timer.isActive():
+            self.severity_timer.start()
+
+    # A method to apply the severity of our slider to our canvas.
+    def apply_simulation_severity(self):
+        self.canvas.set_filter_severity(self.severity_slider.value())
+
     # Default button style.
     def get_default_button_style(self):
         return f'''
@@ -647,22 +831,43 @@ class Tools(QMainWindow):
             }}
         '''
 
-# A custom filter button for our LMS filter.
+# A custom filter button for our LMS filter (and our tools with options).
+# Our options are requested by right-clicking our button, or by holding it down.
 class FilterButton(QPushButton):
 
+    # Emitted when our options are requested.
+    options_requested = pyqtSignal()
+
+    # How long our button must be held down to request our options (in milliseconds).
+    HOLD_DURATION = 400
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.menu = None
+        self.hold_timer = QTimer(self)
+        self.hold_timer.setSingleShot(True)
+        self.hold_timer.setInterval(self.HOLD_DURATION)
+        self.hold_timer.timeout.connect(self.options_requested.emit)
 
     def setMenu(self, menu):
         self.menu = menu
         super().setMenu(menu)
 
     def mousePressEvent(self, event):
-        # Emit the clicked signal when the button is clicked; don't show the menu yet.
-        self.clicked.emit()
+        # Requesting our options when our button is right-clicked.
+        if event.button() == Qt.MouseButton.RightButton:
+            self.options_requested.emit()
+
+        # Otherwise, emit the clicked signal when the button is clicked; don't show the menu yet (unless our button is held down).
+        else:
+            self.clicked.emit()
+            self.hold_timer.start()
         self.setDown(False) # Don't keep the button pressed.
         event.accept()
 
+    def mouseReleaseEvent(self, event):
+        self.hold_timer.stop()
+        event.accept()
+
     def getMenu(self):
         return self.menu
@@ -43,4 +43,42 @@ def validate_imported_data(pixels):
             if not isinstance(rgba_value, int):
                 return False
 
-    return True
\ No newline at end of file
+    return True
+
+# A method to validate our imported layers (used to check whether a layered project is in the correct format).
+# Ideally, our data should be in the form:
+# {"version": 2, "layers": [{"name": str, "visible": bool, "opacity": int, "tiles": str}, ...], "active": int}
+# (along with an optional "palette": [rgba_tuple, ...] for indexed projects).
+# Projects saved before our version 2 have no version, and a pixels dictionary ({(x,y): rgba_tuple}) for each layer instead of its tiles.
+def validate_layered_data(data):
+
+    # If our data is not a dictionary with a non-empty list of layers and an active layer index, we'll return False.
+    if not isinstance(data, dict) or not isinstance(data.get("layers"), list) or not data["layers"]:
+        return False
+    version = data.get("version", 1)
+    if version not in (1, 2):
+        return False
+    if not isinstance(data.get("active"), int) or not 0 <= data["active"] < len(data["layers"]):
+        return False
+
+    # Indexed projects also have a palette (a list of at most 256 rgba tuples).
+    if "palette" in data:
+        palette = data["palette"]
+        if not isinstance(palette, list) or len(palette) > 256:
+            return False
+        for rgba_tuple in palette:
+            if not isinstance(rgba_tuple, tuple) or len(rgba_tuple) != 4 or not all(isinstance(value, int) for value in rgba_tuple):
+                return False
+
+    # Each of our layers must have a name, visibility, opacity (0 - 100), and either its (encoded) tiles or a valid pixels dictionary.
+    for layer in data["layers"]:
+        if not isinstance(layer, dict) or not isinstance(layer.get("name"), str) or not isinstance(layer.get("visible"), bool):
+            return False
+        if not isinstance(layer.get("opacity"), int) or not 0 <= layer["opacity"] <= 100:
+            return False
+        if version == 2 and not isinstance(layer.get("tiles"), str):
+            return False
+        if version == 1 and not validate_imported_data(layer.get("pixels")):
+            return False
+
+    return True